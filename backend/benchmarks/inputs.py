@@ -0,0 +1,41 @@
+"""Default form values of the frontend (frontend/src/views/dcf-valuation.jsx), in the /dcf input_list format"""
+
+DEFAULT_INPUT_LIST = [
+    {"id": "risk_free_rate", "distribution": "normal", "values": {"mean": 0.04, "std": 0.002}},
+    {"id": "ERP", "distribution": "normal", "values": {"mean": 0.048, "std": 0.001}},
+    {"id": "equity_value", "distribution": "triangular", "values": {"min": 45, "mode": 51.016, "max": 57}},
+    {"id": "debt_value", "distribution": "triangular", "values": {"min": 3.7, "mode": 3.887, "max": 4}},
+    {"id": "unlevered_beta", "distribution": "triangular", "values": {"min": 0.8, "mode": 0.9, "max": 1}},
+    {"id": "terminal_unlevered_beta", "distribution": "triangular", "values": {"min": 0.8, "mode": 0.9, "max": 1}},
+    {"id": "year_beta_begins_to_converge_to_terminal_beta", "distribution": "uniform", "values": {"low": 1, "high": 2}},
+    {"id": "current_pretax_cost_of_debt", "distribution": "triangular", "values": {"min": 0.057, "mode": 0.06, "max": 0.063}},
+    {"id": "terminal_pretax_cost_of_debt", "distribution": "triangular", "values": {"min": 0.052, "mode": 0.055, "max": 0.058}},
+    {"id": "year_cost_of_debt_begins_to_converge_to_terminal_cost_of_debt", "distribution": "uniform", "values": {"low": 1, "high": 2}},
+    {"id": "current_effective_tax_rate", "distribution": "triangular", "values": {"min": 0.23, "mode": 0.24, "max": 0.25}},
+    {"id": "marginal_tax_rate", "distribution": "triangular", "values": {"min": 0.23, "mode": 0.25, "max": 0.27}},
+    {"id": "year_effective_tax_rate_begin_to_converge_marginal_tax_rate", "distribution": "uniform", "values": {"low": 1, "high": 3}},
+    {"id": "additional_return_on_cost_of_capital_in_perpetuity", "distribution": "triangular", "values": {"min": 0, "mode": 0.02, "max": 0.035}},
+    {"id": "revenue_base", "distribution": "triangular", "values": {"min": 8.8, "mode": 9.2, "max": 9.6}},
+    {"id": "revenue_growth_rate_cycle1_begin", "distribution": "skewnorm", "values": {"skewness": -2.9, "loc": 0.145, "scale": 0.032}},
+    {"id": "revenue_growth_rate_cycle1_end", "distribution": "skewnorm", "values": {"skewness": -2.9, "loc": 0.18, "scale": 0.033}},
+    {"id": "length_of_cycle1", "distribution": "uniform", "values": {"low": 4, "high": 8}},
+    {"id": "revenue_growth_rate_cycle2_begin", "distribution": "skewnorm", "values": {"skewness": -2.9, "loc": 0.165, "scale": 0.034}},
+    {"id": "revenue_growth_rate_cycle2_end", "distribution": "skewnorm", "values": {"skewness": -2.9, "loc": 0.11, "scale": 0.032}},
+    {"id": "length_of_cycle2", "distribution": "uniform", "values": {"low": 4, "high": 8}},
+    {"id": "revenue_growth_rate_cycle3_begin", "distribution": "skewnorm", "values": {"skewness": -2.9, "loc": 0.09, "scale": 0.024}},
+    {"id": "revenue_growth_rate_cycle3_end", "distribution": "normal", "values": {"mean": 0.04, "std": 0.002}},
+    {"id": "length_of_cycle3", "distribution": "uniform", "values": {"low": 4, "high": 8}},
+    {"id": "revenue_convergance_periods_cycle1", "distribution": "uniform", "values": {"low": 1, "high": 2}},
+    {"id": "revenue_convergance_periods_cycle2", "distribution": "uniform", "values": {"low": 1, "high": 2}},
+    {"id": "revenue_convergance_periods_cycle3", "distribution": "uniform", "values": {"low": 1, "high": 2}},
+    {"id": "current_sales_to_capital_ratio", "distribution": "triangular", "values": {"min": 1.5, "mode": 1.7, "max": 1.9}},
+    {"id": "terminal_sales_to_capital_ratio", "distribution": "triangular", "values": {"min": 1.1, "mode": 1.3, "max": 1.6}},
+    {"id": "year_sales_to_capital_begins_to_converge_to_terminal_sales_to_capital", "distribution": "uniform", "values": {"low": 1, "high": 3}},
+    {"id": "current_operating_margin", "distribution": "triangular", "values": {"min": 0.145, "mode": 0.15, "max": 0.155}},
+    {"id": "terminal_operating_margin", "distribution": "triangular", "values": {"min": 0.12, "mode": 0.175, "max": 0.22}},
+    {"id": "year_operating_margin_begins_to_converge_to_terminal_operating_margin", "distribution": "uniform", "values": {"low": 1, "high": 3}},
+    {"id": "cash_and_non_operating_asset", "distribution": "uniform", "values": {"low": 1.6, "high": 1.8}},
+    {"id": "asset_liquidation_during_negative_growth", "distribution": "uniform", "values": {"low": 0, "high": 1e-09}},
+    {"id": "current_invested_capital", "distribution": "uniform", "values": {"low": 5.8, "high": 6.2}},
+    {"id": "shares_outstanding", "distribution": "constant", "values": {"constant": 0.0275898}},
+]
@@ -0,0 +1,57 @@
+"""
+Latency of the deterministic endpoints: point_valuation (/dcf/point) and valuation_greeks (/dcf/greeks).
+
+The base case is the medians of the frontend's default form. Every function is called
+--warmup times first (imports, caches), then timed over --calls warm calls;
+the table gives the latency percentiles in milliseconds. The library call
+valuator_multi_phase is timed alongside as the reference it replaces.
+Latencies depend on the machine and its load: compare runs on the same machine.
+
+Run from the backend directory:
+    python -m benchmarks.point_latency --calls 2000
+"""
+import argparse
+import time
+import numpy as np
+from dcf_valuation.batch import VARIABLE_NAMES
+from dcf_valuation.greeks import valuation_greeks
+from dcf_valuation.point import point_valuation
+from dcf_valuation.utils import adjust_parameters_input_to_api, valuator_multi_phase
+from .inputs import DEFAULT_INPUT_LIST
+
+PERCENTILES = [50, 90, 99]
+
+
+def latencies(function, base_case, calls, warmup):
+    for _ in range(warmup):
+        function(base_case)
+    seconds = np.empty(calls)
+    for i in range(calls):
+        start = time.perf_counter()
+        function(base_case)
+        seconds[i] = time.perf_counter() - start
+    return 1000 * seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=2000, help="timed calls of each function")
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument("--reference-calls", type=int, default=50, help="timed calls of valuator_multi_phase")
+    args = parser.parse_args()
+
+    monte_carlo_input, _ = adjust_parameters_input_to_api(DEFAULT_INPUT_LIST)
+    base_case = {name: float(monte_carlo_input[name].ppf(0.5)) for name in VARIABLE_NAMES}
+    functions = {"point_valuation": (lambda case: point_valuation(case), args.calls),
+                 "point_valuation (no table)": (lambda case: point_valuation(case, ()), args.calls),
+                 "valuation_greeks": (valuation_greeks, args.calls),
+                 "valuator_multi_phase": (lambda case: valuator_multi_phase(**case), args.reference_calls)}
+
+    print(f"{'':>28}{'calls':>8}" + "".join(f"{f'p{percentile} ms':>10}" for percentile in PERCENTILES))
+    for name, (function, calls) in functions.items():
+        milliseconds = latencies(function, base_case, calls, min(args.warmup, calls))
+        print(f"{name:>28}{calls:>8}" + "".join(f"{value:>10.3f}" for value in np.percentile(milliseconds, PERCENTILES)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Accuracy versus cost of the sampling strategies of monte_carlo_valuator_multi_phase.
+
+For each strategy and sample size the run is repeated with different seeds and the
+relative RMSE of the reported equity value percentiles (P15/P50/P85 of the histogram,
+P20/P80 of valuation_summary) is measured against a large reference run.
+The last table gives the samples each strategy needs to reach the target error.
+
+Run from the backend directory:
+    python -m benchmarks.sampling_accuracy --target 0.005
+"""
+import argparse
+import time
+import numpy as np
+from dcf_valuation.batch import VARIABLE_NAMES, batch_valuator_multi_phase
+from dcf_valuation.sampling import SAMPLING_STRATEGIES
+from dcf_valuation.utils import adjust_parameters_input_to_api, monte_carlo_sample_generator
+from .inputs import DEFAULT_INPUT_LIST
+
+PERCENTILES = [15, 20, 50, 80, 85]
+
+
+def equity_percentiles(monte_carlo_input, sample_size, seed, sampling, chunk_size=32768):
+    distributions = [monte_carlo_input[name] for name in VARIABLE_NAMES]
+    sample = monte_carlo_sample_generator(distributions,
+                                          monte_carlo_input['list_of_correlation_between_variables'],
+                                          sample_size,
+                                          seed=seed,
+                                          sampling=sampling)
+    equity = np.concatenate([batch_valuator_multi_phase(sample[start:start + chunk_size])['equity_value']
+                             for start in range(0, sample_size, chunk_size)])
+    return np.percentile(equity, PERCENTILES)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", type=float, default=0.005, help="target relative RMSE of the percentiles")
+    parser.add_argument("--repetitions", type=int, default=20)
+    parser.add_argument("--min-power", type=int, default=8, help="smallest sample size is 2**min_power")
+    parser.add_argument("--max-power", type=int, default=15, help="largest sample size is 2**max_power")
+    parser.add_argument("--reference-power", type=int, default=19)
+    args = parser.parse_args()
+
+    monte_carlo_input, _ = adjust_parameters_input_to_api(DEFAULT_INPUT_LIST)
+    reference = equity_percentiles(monte_carlo_input, 2 ** args.reference_power, seed=12345, sampling='sobol')
+    print("Reference percentiles", dict(zip(PERCENTILES, np.round(reference, 3))))
+
+    sample_sizes = [2 ** power for power in range(args.min_power, args.max_power + 1)]
+    errors = {}
+    seconds = {}
+    for sampling in SAMPLING_STRATEGIES:
+        for sample_size in sample_sizes:
+            start = time.perf_counter()
+            estimates = np.array([equity_percentiles(monte_carlo_input, sample_size, seed, sampling)
+                                  for seed in range(args.repetitions)])
+            seconds[sampling, sample_size] = (time.perf_counter() - start) / args.repetitions
+            ### Worst percentile of the relative RMSE over the repetitions
+            errors[sampling, sample_size] = np.max(np.sqrt(np.mean(((estimates - reference) / reference) ** 2, axis=0)))
+
+    print(f"\nRelative RMSE of P{'/P'.join(map(str, PERCENTILES))} (worst), seconds per run in brackets")
+    print(f"{'samples':>8}" + "".join(f"{sampling:>22}" for sampling in SAMPLING_STRATEGIES))
+    for sample_size in sample_sizes:
+        print(f"{sample_size:>8}" + "".join(f"{errors[sampling, sample_size]:>12.4%} ({seconds[sampling, sample_size]:6.3f}s)"
+                                            for sampling in SAMPLING_STRATEGIES))
+
+    print(f"\nSamples needed for a relative RMSE below {args.target:.2%}")
+    for sampling in SAMPLING_STRATEGIES:
+        needed = next((sample_size for sample_size in sample_sizes if errors[sampling, sample_size] <= args.target), None)
+        print(f"{sampling:>8}: {needed if needed is not None else f'> {sample_sizes[-1]}'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,21 @@
-from fastapi import APIRouter, Request, HTTPException
+from fastapi import APIRouter, Request, HTTPException, Path
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
 from http import HTTPStatus
-from .run import generate_valuation
+from .run import generate_valuation, reweight_valuation, generate_sensitivity
 from .utils import adjust_parameters_input_to_api
+from .batch import VARIABLE_NAMES, SERIES_NAMES
+from .reweight import DEFAULT_MIN_EFFECTIVE_SAMPLE_FRACTION
+from .sensitivity import DEFAULT_SOBOL_SAMPLE_SIZE
+from .greeks import DEFAULT_RELATIVE_STEP, valuation_greeks
+from .point import point_valuation
+from .results import SCALAR_OUTPUTS, SERIES_OUTPUTS
+from .budget import deadline_from_budget
+from .cache import RESULT_CACHE
 import asyncio
+import json
 import logging
+import os
 import time
 from datetime import datetime
 
@@ -14,14 +26,77 @@ from datetime import datetime
 router = APIRouter(prefix="/dcf")
 logger = logging.getLogger(__name__)
 
+### Companies of a /dcf/portfolio request valued at the same time - their chunks share the process pool
+PORTFOLIO_CONCURRENCY = int(os.environ.get("DCF_PORTFOLIO_CONCURRENCY", "4"))
+
 ########################################################
 # GENERATE DCF VALUATION
 ########################################################
 
-from pydantic import BaseModel
+from typing import Dict, List, Literal, Optional, Union
+from pydantic import BaseModel, Field, model_validator
+
+class AdaptiveSampling(BaseModel):
+    """Stop sampling once the standard errors of the reported equity value percentiles are under the tolerance"""
+    tolerance: float = Field(0.01, gt=0)
+    tolerance_type: Literal['relative', 'absolute'] = 'relative'
+    method: Literal['order_statistic', 'bootstrap'] = 'order_statistic'
+    confidence: float = Field(0.95, gt=0, lt=1)
+    batch_size: int = Field(2000, ge=100)
+    min_sample_size: int = Field(2000, ge=100)
+    max_sample_size: int = Field(50000, ge=100, le=200000)
+
+    @model_validator(mode='after')
+    def check_caps(self):
+        if self.min_sample_size > self.max_sample_size:
+            raise ValueError("min_sample_size must not exceed max_sample_size")
+        return self
+
+class VarianceReduction(BaseModel):
+    """
+    Antithetic pairs in the copula's normal space and a control variate anchored on the valuation at the input means,
+    or importance sampling of the equity value's tails (P1/P5/P95/P99)
+    """
+    antithetic: bool = False
+    control_variate: bool = False
+    importance_sampling: bool = False
+    tail_shift: float = Field(2.33, gt=0, le=5)
+
+    @model_validator(mode='after')
+    def check_combination(self):
+        if self.importance_sampling and (self.antithetic or self.control_variate):
+            raise ValueError("importance_sampling cannot be combined with antithetic or control_variate")
+        return self
+
+class SurrogateModel(BaseModel):
+    """Polynomial chaos surrogate evaluated on a large sample, validated on held out exact valuations"""
+    sample_size: int = Field(1000000, ge=10000, le=5000000)
+    design_size: int = Field(2000, ge=800, le=50000)
+    validation_size: int = Field(500, ge=100, le=20000)
+    degree: Literal[1, 2] = 2
+    max_validation_error: float = Field(0.05, gt=0)
+    include_firm_valuation: bool = False
 
 class InputList(BaseModel):
     input_list: list
+    adaptive: Optional[AdaptiveSampling] = None
+    variance_reduction: Optional[VarianceReduction] = None
+    surrogate: Optional[SurrogateModel] = None
+    time_budget: Optional[float] = Field(None, gt=0, le=300, description="Seconds to answer in, charts included")
+    seed: Optional[int] = Field(None, ge=0, description="Seed of the run's random streams - derived from the inputs when not given")
+    session_id: Optional[str] = Field(None, max_length=128,
+                                      description="Revalue with the random numbers of the session's last run, changing only what the edited inputs affect")
+    use_cache: bool = Field(True, description="Answer from the result cache when the same inputs were valued before")
+    include_plots: bool = True
+    outputs: Optional[List[Literal[tuple(SCALAR_OUTPUTS) + tuple(SERIES_OUTPUTS)]]] = Field(
+        None, description="Outputs to compute, e.g. ['equity_valuation'] for the summary alone - all when not given")
+
+    @model_validator(mode='after')
+    def check_importance_sampling(self):
+        if (self.variance_reduction is not None and self.variance_reduction.importance_sampling
+                and (self.adaptive is not None or self.time_budget is not None)):
+            raise ValueError("importance_sampling runs a fixed sample size: drop adaptive and time_budget")
+        return self
 
 async def monitor_client_disconnection(request, request_id):
     """Monitor if client disconnects during processing"""
@@ -38,6 +113,7 @@ async def monitor_client_disconnection(request, request_id):
 async def generate_dcf_valuation(input_list: InputList, request: Request):
     request_id = id(request)
     start_time = time.time()
+    deadline = deadline_from_budget(input_list.time_budget)
     start_datetime = datetime.now().isoformat()
     
     logger.info(f"[REQUEST {request_id}] DCF valuation request started at {start_datetime}")
@@ -45,13 +121,20 @@ async def generate_dcf_valuation(input_list: InputList, request: Request):
     
     try:
         monte_carlo_input, shares_outstanding = adjust_parameters_input_to_api(input_list.input_list)
+        if input_list.seed is not None:
+            monte_carlo_input["seed"] = input_list.seed
         logger.info(f"[REQUEST {request_id}] Parameters adjusted successfully")
         
         logger.info(f"[REQUEST {request_id}] Starting valuation generation")
         
         # Create the executor task
         loop = asyncio.get_event_loop()
-        valuation_task = loop.run_in_executor(None, generate_valuation, monte_carlo_input, shares_outstanding)
+        adaptive = input_list.adaptive.model_dump() if input_list.adaptive is not None else None
+        variance_reduction = input_list.variance_reduction.model_dump() if input_list.variance_reduction is not None else None
+        surrogate = input_list.surrogate.model_dump() if input_list.surrogate is not None else None
+        valuation_task = loop.run_in_executor(None, generate_valuation, monte_carlo_input, shares_outstanding,
+                                              adaptive, deadline, variance_reduction, surrogate, input_list.use_cache,
+                                              input_list.session_id, input_list.include_plots, input_list.outputs)
         
         # Create a monitoring task for client disconnection
         monitor_task = asyncio.create_task(monitor_client_disconnection(request, request_id))
@@ -100,4 +183,190 @@ async def generate_dcf_valuation(input_list: InputList, request: Request):
         duration = end_time - start_time
         logger.error(f"[REQUEST {request_id}] ERROR occurred after {duration:.2f} seconds: {str(e)}")
         logger.error(f"[REQUEST {request_id}] Error type: {type(e).__name__}")
-        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@router.get("/cache", status_code=HTTPStatus.OK)
+async def result_cache_stats():
+    """Size and hit / miss counters of the result cache"""
+    return RESULT_CACHE.stats()
+
+
+########################################################
+# PORTFOLIO
+########################################################
+
+class PortfolioCompany(BaseModel):
+    """One company of a portfolio: its /dcf input_list and optional run settings"""
+    id: Optional[str] = Field(None, max_length=128, description="Echoed on the company's result line, e.g. the ticker")
+    input_list: list
+    sample_size: Optional[int] = Field(None, ge=100, le=1000000)
+    seed: Optional[int] = Field(None, ge=0)
+    variance_reduction: Optional[VarianceReduction] = None
+
+class PortfolioRequest(BaseModel):
+    companies: List[PortfolioCompany] = Field(..., min_length=1, max_length=1000)
+    include_plots: bool = Field(False, description="Render each company's plots - summaries only otherwise")
+    use_cache: bool = True
+
+def _portfolio_line(index, company, charts=None, error=None):
+    """NDJSON line of a company's result - non finite numbers are not valid JSON and become errors"""
+    line = {"index": index, "id": company.id}
+    if error is None:
+        try:
+            return json.dumps(jsonable_encoder({**line, "status": "ok", "result": charts}), allow_nan=False) + "\n"
+        except ValueError as e:
+            error = e
+    return json.dumps({**line, "status": "error", "error": f"{type(error).__name__}: {error}"}) + "\n"
+
+@router.post("/portfolio", status_code=HTTPStatus.OK)
+async def dcf_portfolio(portfolio_request: PortfolioRequest, request: Request):
+    """
+    Value many companies in one request. Results stream back as NDJSON, one line per company in the order they finish:
+    index (position in companies), id, status and result (the /dcf response) or error.
+    PORTFOLIO_CONCURRENCY companies run at once in the executor; a company that fails does not stop the others.
+    """
+    request_id = id(request)
+    loop = asyncio.get_event_loop()
+    semaphore = asyncio.Semaphore(PORTFOLIO_CONCURRENCY)
+    logger.info(f"[REQUEST {request_id}] Portfolio of {len(portfolio_request.companies)} companies")
+
+    async def value_company(index, company):
+        async with semaphore:
+            try:
+                monte_carlo_input, shares_outstanding = adjust_parameters_input_to_api(company.input_list)
+                if company.sample_size is not None:
+                    monte_carlo_input["sample_size"] = company.sample_size
+                if company.seed is not None:
+                    monte_carlo_input["seed"] = company.seed
+                variance_reduction = company.variance_reduction.model_dump() if company.variance_reduction is not None else None
+                charts = await loop.run_in_executor(None, generate_valuation, monte_carlo_input, shares_outstanding,
+                                                    None, None, variance_reduction, None, portfolio_request.use_cache,
+                                                    None, portfolio_request.include_plots)
+                return _portfolio_line(index, company, charts)
+            except Exception as e:
+                logger.error(f"[REQUEST {request_id}] Company {index} failed: {str(e)}")
+                return _portfolio_line(index, company, error=e)
+
+    async def lines():
+        tasks = [asyncio.ensure_future(value_company(index, company))
+                 for index, company in enumerate(portfolio_request.companies)]
+        try:
+            for task in asyncio.as_completed(tasks):
+                yield await task
+        finally:
+            ### Client gone: companies still waiting for a slot are not valued
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+########################################################
+# SENSITIVITY ANALYSIS
+########################################################
+
+class SensitivityRequest(BaseModel):
+    """Sobol indices and P10 / P90 tornado swings of the equity value over the inputs of input_list"""
+    input_list: list
+    sample_size: int = Field(DEFAULT_SOBOL_SAMPLE_SIZE, ge=64, le=16384,
+                             description="Rows of each Saltelli matrix - the design values 38 times as many samples")
+    sampling: Literal['sobol', 'random'] = 'sobol'
+    seed: Optional[int] = Field(None, ge=0)
+    use_cache: bool = True
+
+@router.post("/sensitivity", status_code=HTTPStatus.OK)
+async def dcf_sensitivity(sensitivity_request: SensitivityRequest):
+    """Which inputs drive the spread of the intrinsic equity value - see generate_sensitivity"""
+    loop = asyncio.get_event_loop()
+    try:
+        monte_carlo_input, shares_outstanding = adjust_parameters_input_to_api(sensitivity_request.input_list)
+        if sensitivity_request.seed is not None:
+            monte_carlo_input["seed"] = sensitivity_request.seed
+        return await loop.run_in_executor(None, generate_sensitivity, monte_carlo_input, shares_outstanding,
+                                          sensitivity_request.sample_size, sensitivity_request.sampling,
+                                          sensitivity_request.use_cache)
+    except (KeyError, TypeError, ValueError) as e:
+        ### Malformed input_list, or an input missing from it
+        raise HTTPException(status_code=422, detail=f"Invalid input_list: {type(e).__name__} {str(e)}")
+    except Exception as e:
+        logger.error(f"[SENSITIVITY] ERROR: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+########################################################
+# POINT ESTIMATE
+########################################################
+
+class PointRequest(BaseModel):
+    """Base case of the deterministic valuation - keyword arguments of valuator_multi_phase"""
+    base_case: Dict[str, Union[float, str, None]]
+    series: Optional[List[str]] = Field(None, description="Per year columns of the table - all when not given, [] for none")
+
+    @model_validator(mode='after')
+    def check_series(self):
+        unknown = set(self.series or []) - set(SERIES_NAMES)
+        if unknown:
+            raise ValueError(f"Unknown series: {', '.join(sorted(unknown))}")
+        return self
+
+@router.post("/point", status_code=HTTPStatus.OK)
+def dcf_point(point_request: PointRequest):
+    """Single base case valuation: equity and firm value and the per year table as columns - see point_valuation"""
+    try:
+        return point_valuation(point_request.base_case,
+                               SERIES_NAMES if point_request.series is None else point_request.series)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+########################################################
+# GREEKS
+########################################################
+
+class GreeksRequest(BaseModel):
+    """Base case of the deterministic valuation - keyword arguments of valuator_multi_phase"""
+    base_case: Dict[str, Union[float, str, None]]
+    relative_step: float = Field(DEFAULT_RELATIVE_STEP, gt=0, le=0.1)
+    output: Literal['equity_value', 'firm_value', 'value_of_operating_assets'] = 'equity_value'
+
+@router.post("/greeks", status_code=HTTPStatus.OK)
+def dcf_greeks(greeks_request: GreeksRequest):
+    """Derivative and elasticity of the valuation with respect to every input, from one batch of 73 valuations"""
+    start = time.monotonic()
+    try:
+        greeks = valuation_greeks(greeks_request.base_case, greeks_request.relative_step, greeks_request.output)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    greeks["timing"] = {"total_seconds": time.monotonic() - start}
+    return greeks
+
+########################################################
+# REWEIGHT A CACHED RUN
+########################################################
+
+class ReweightRequest(BaseModel):
+    """Modified input distributions, in the input_list format of /dcf - inputs left out keep the run's distributions"""
+    input_list: list
+    min_effective_sample_fraction: float = Field(DEFAULT_MIN_EFFECTIVE_SAMPLE_FRACTION, ge=0, le=1,
+                                                 description="Weights under this effective sample size over the sample size are degenerate")
+    fallback: bool = Field(True, description="Value the modified inputs again when the weights are degenerate")
+    include_histogram: bool = True
+
+@router.post("/{run_id}/reweight", status_code=HTTPStatus.OK)
+async def reweight_dcf_valuation(reweight_request: ReweightRequest,
+                                 run_id: str = Path(..., pattern="^[0-9a-f]{64}$")):
+    """
+    Valuation summary and histogram of a cached run (run_id of its response) under modified input distributions,
+    by likelihood ratio weights on the run's sample - see reweight_valuation
+    """
+    loop = asyncio.get_event_loop()
+    try:
+        monte_carlo_input, _ = adjust_parameters_input_to_api(reweight_request.input_list)
+    except (KeyError, TypeError, ValueError) as e:
+        raise HTTPException(status_code=422, detail=f"Invalid input_list: {type(e).__name__} {str(e)}")
+    changes = {name: value for name, value in monte_carlo_input.items() if name in VARIABLE_NAMES}
+    try:
+        return await loop.run_in_executor(None, reweight_valuation, run_id, changes,
+                                          reweight_request.min_effective_sample_fraction,
+                                          reweight_request.fallback, reweight_request.include_histogram)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Run {run_id} is not cached")
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=f"Cannot reweight run {run_id}: {str(e)}")
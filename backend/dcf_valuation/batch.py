@@ -0,0 +1,570 @@
+import numpy as np
+from functools import lru_cache
+
+########################################################
+# VARIABLES
+########################################################
+
+### Order of the sampled inputs - this is the column order of the sample matrix
+VARIABLE_NAMES = ['risk_free_rate',
+                  'ERP',
+                  'equity_value',
+                  'debt_value',
+                  'unlevered_beta',
+                  'terminal_unlevered_beta',
+                  'year_beta_begins_to_converge_to_terminal_beta',
+                  'current_pretax_cost_of_debt',
+                  'terminal_pretax_cost_of_debt',
+                  'year_cost_of_debt_begins_to_converge_to_terminal_cost_of_debt',
+                  'current_effective_tax_rate',
+                  'marginal_tax_rate',
+                  'year_effective_tax_rate_begin_to_converge_marginal_tax_rate',
+                  'revenue_base',
+                  'revenue_growth_rate_cycle1_begin',
+                  'revenue_growth_rate_cycle1_end',
+                  'revenue_growth_rate_cycle2_begin',
+                  'revenue_growth_rate_cycle2_end',
+                  'revenue_growth_rate_cycle3_begin',
+                  'revenue_growth_rate_cycle3_end',
+                  'revenue_convergance_periods_cycle1',
+                  'revenue_convergance_periods_cycle2',
+                  'revenue_convergance_periods_cycle3',
+                  'length_of_cycle1',
+                  'length_of_cycle2',
+                  'length_of_cycle3',
+                  'current_sales_to_capital_ratio',
+                  'terminal_sales_to_capital_ratio',
+                  'year_sales_to_capital_begins_to_converge_to_terminal_sales_to_capital',
+                  'current_operating_margin',
+                  'terminal_operating_margin',
+                  'year_operating_margin_begins_to_converge_to_terminal_operating_margin',
+                  'additional_return_on_cost_of_capital_in_perpetuity',
+                  'cash_and_non_operating_asset',
+                  'asset_liquidation_during_negative_growth',
+                  'current_invested_capital']
+
+### The following variable should have "year" in their definition but I did not think of it. So I am adding them to INTEGER_VARIABLE_NAMES
+INTEGER_VARIABLE_NAMES = [s for s in VARIABLE_NAMES if "year" in s] + ['length_of_cycle1', 'length_of_cycle2', 'length_of_cycle3',
+                                                                       'revenue_convergance_periods_cycle1',
+                                                                       'revenue_convergance_periods_cycle2',
+                                                                       'revenue_convergance_periods_cycle3']
+
+### Per year columns of the valuation, same names as the df_valuation of valuator_multi_phase
+SERIES_NAMES = ['cumWACC',
+                'cumCostOfEquity',
+                'beta',
+                'ERP',
+                'projected_after_tax_cost_of_debt',
+                'revenueGrowth',
+                'revenues',
+                'margins',
+                'ebit',
+                'sales_to_capital_ratio',
+                'taxRate',
+                'afterTaxOperatingIncome',
+                'reinvestment',
+                'invested_capital',
+                'ROIC',
+                'reinvestmentRate',
+                'FCFF',
+                'projected_FCFF_value',
+                'PVFCFF',
+                'cum_acceptable_annualized_return_on_equity',
+                'cum_expected_annualized_return_on_equity',
+                'cum_excess_annualized_return_on_equity',
+                'cum_excess_annualized_return_on_equity_realized',
+                'excess_annualized_return_on_equity']
+
+
+########################################################
+# SAMPLE COLUMNS
+########################################################
+
+def sample_columns(samples):
+    """
+    Return a dict of float64 arrays, one per variable in VARIABLE_NAMES.
+    samples: 2-D array with the columns in VARIABLE_NAMES order, or any
+    mapping (dict, DataFrame) from variable name to values.
+    """
+    if isinstance(samples, np.ndarray):
+        samples = np.atleast_2d(samples)
+        return {name: np.ascontiguousarray(samples[:, i], dtype=np.float64)
+                for i, name in enumerate(VARIABLE_NAMES)}
+    return {name: np.atleast_1d(np.asarray(samples[name], dtype=np.float64))
+            for name in VARIABLE_NAMES}
+
+
+########################################################
+# HORIZON MASK
+########################################################
+
+def horizon_mask(valuation_interval_in_years,
+                 max_horizon):
+    """
+    Validity mask of a padded (n, max_horizon) per year array:
+    True where the year is inside the valuation interval of the sample.
+    """
+    return(np.arange(max_horizon)[None, :] < valuation_interval_in_years[:, None])
+
+
+def last_year(values,
+              valuation_interval_in_years):
+    """Value at the last projected year of each row of a padded (n, max_horizon) array"""
+    return(np.take_along_axis(values, (valuation_interval_in_years - 1)[:, None], axis=1)[:, 0])
+
+
+########################################################
+# CONVERGENCE WEIGHTS
+########################################################
+
+@lru_cache(maxsize=1024)
+def convergence_weights(number_of_steps,
+                        period_to_begin_to_converge):
+    """
+    Weight of the expected value at each period of dynamic_converger:
+    0 until period_to_begin_to_converge, then linear up to 1 at number_of_steps.
+    Any converged path is current + weights * (expected - current).
+    The returned array is cached and read only.
+    """
+    number_of_steps = int(number_of_steps)
+    period_to_begin_to_converge = int(period_to_begin_to_converge)
+    weights = np.concatenate((np.zeros(max(period_to_begin_to_converge - 1, 0)),
+                              np.linspace(0, 1, number_of_steps - period_to_begin_to_converge + 1)))
+    weights.flags.writeable = False
+    return(weights)
+
+
+@lru_cache(maxsize=8)
+def convergence_weight_table(size):
+    """
+    All the convergence_weights up to size steps in one array:
+    table[number_of_steps, period_to_begin_to_converge] is the weight of each year,
+    padded with 1 past number_of_steps. Periods are clipped to [1, number_of_steps + 1].
+    """
+    table = np.ones((size + 1, size + 2, size))
+    for number_of_steps in range(size + 1):
+        for period in range(size + 2):
+            weights = convergence_weights(number_of_steps, min(max(period, 1), number_of_steps + 1))
+            table[number_of_steps, period, :len(weights)] = weights
+    table.flags.writeable = False
+    return(table)
+
+
+def _weight_table_for(max_horizon):
+    """Smallest cached table covering max_horizon years - sizes are powers of 2 to keep the cache small"""
+    return(convergence_weight_table(max(32, 1 << (int(max_horizon) - 1).bit_length())))
+
+
+########################################################
+# BATCH CONVERGER
+########################################################
+
+def batch_convergence_weights(number_of_steps,
+                              period_to_begin_to_converge,
+                              max_horizon,
+                              position=None):
+    """
+    Gather the convergence weights of every sample from the cached weight table.
+    number_of_steps and period_to_begin_to_converge: (n,), truncated to int like dynamic_converger.
+    position: year of each weight inside the path, defaults to 0..max_horizon-1 for every sample.
+    """
+    table = _weight_table_for(max(max_horizon, np.max(number_of_steps, initial=0)))
+    size = table.shape[2]
+    number_of_steps = np.clip(np.trunc(number_of_steps), 0, size).astype(np.intp)
+    period_to_begin_to_converge = np.clip(np.trunc(period_to_begin_to_converge), 0, size + 1).astype(np.intp)
+    ### Flat indices and np.take are much faster than fancy indexing on the 3-D table
+    row = number_of_steps * (size + 2) + period_to_begin_to_converge
+    if position is None:
+        return(np.take(table.reshape(-1, size), row, axis=0)[:, :max_horizon])
+    return(np.take(table.reshape(-1), row * size + np.clip(position, 0, size - 1)))
+
+
+def batch_dynamic_converger(current,
+                            expected,
+                            number_of_steps,
+                            period_to_begin_to_converge,
+                            valuation_interval_in_years):
+    """Vectorized dynamic_converger: one row per sample, one column per year"""
+    weights = batch_convergence_weights(number_of_steps, period_to_begin_to_converge, valuation_interval_in_years)
+    return(current[:, None] + weights * (expected - current)[:, None])
+
+
+def batch_dynamic_converger_multiple_phase(growth_rates_for_each_cylce,
+                                           length_of_each_cylce,
+                                           convergance_periods,
+                                           valuation_interval_in_years):
+    """Vectorized dynamic_converger_multiple_phase - cycles are laid out one after the other in each row"""
+    years = np.arange(valuation_interval_in_years)[None, :]
+    lengths = np.trunc(np.stack(length_of_each_cylce)).astype(np.intp)
+    starts = np.concatenate([np.zeros((1, lengths.shape[1]), dtype=np.intp), np.cumsum(lengths, axis=0)[:-1]])
+    ### Cycle each year belongs to
+    cycle = (years >= starts[1][:, None]).astype(int) + (years >= starts[2][:, None])
+    def pick(values):
+        return(np.choose(cycle, [np.asarray(v)[:, None] for v in values]))
+    current = pick([rates[0] for rates in growth_rates_for_each_cylce])
+    expected = pick([rates[1] for rates in growth_rates_for_each_cylce])
+    weights = batch_convergence_weights(pick(lengths), pick(convergance_periods), valuation_interval_in_years,
+                                        position=years - pick(starts))
+    return(current + weights * (expected - current))
+
+
+########################################################
+# VALUATION STAGES
+########################################################
+
+def _converge(c, current, expected, period, horizon, max_horizon):
+    return(batch_dynamic_converger(current, expected, horizon, c[period], max_horizon))
+
+
+def _cost_of_capital_stage(c, s, horizon, max_horizon):
+    marginal_tax_rate = c['marginal_tax_rate']
+    debt_value = c['debt_value']
+    equity_value = c['equity_value']
+    leverage = 1 + (1 - marginal_tax_rate) * (debt_value / equity_value)
+    terminal_beta = c['terminal_unlevered_beta'] * leverage
+    beta = _converge(c, c['unlevered_beta'] * leverage, terminal_beta,
+                     'year_beta_begins_to_converge_to_terminal_beta', horizon, max_horizon)
+    pre_tax_cost_of_debt = _converge(c, c['current_pretax_cost_of_debt'], c['terminal_pretax_cost_of_debt'],
+                                     'year_cost_of_debt_begins_to_converge_to_terminal_cost_of_debt', horizon, max_horizon)
+    total_capital = equity_value + debt_value
+    after_tax_cost_of_debt = pre_tax_cost_of_debt * (1 - marginal_tax_rate)[:, None]
+    cost_of_equity = c['risk_free_rate'][:, None] + beta * c['ERP'][:, None]
+    cost_of_capital = ((equity_value / total_capital)[:, None] * cost_of_equity +
+                       (debt_value / total_capital)[:, None] * after_tax_cost_of_debt)
+    return({'terminal_beta': terminal_beta,
+            'beta': beta,
+            'ERP': np.ones((len(horizon), max_horizon)) * c['ERP'][:, None],
+            'after_tax_cost_of_debt': after_tax_cost_of_debt,
+            'cost_of_equity': cost_of_equity,
+            'cost_of_capital': cost_of_capital,
+            'cost_of_capital_cumulative': np.cumprod(1 + cost_of_capital, axis=1),
+            'cost_of_equity_cumulative': np.cumprod(1 + cost_of_equity, axis=1)})
+
+
+def _revenue_stage(c, s, horizon, max_horizon):
+    revenue_growth = batch_dynamic_converger_multiple_phase(
+        growth_rates_for_each_cylce=[[c['revenue_growth_rate_cycle1_begin'], c['revenue_growth_rate_cycle1_end']],
+                                     [c['revenue_growth_rate_cycle2_begin'], c['revenue_growth_rate_cycle2_end']],
+                                     [c['revenue_growth_rate_cycle3_begin'], c['revenue_growth_rate_cycle3_end']]],
+        length_of_each_cylce=[np.trunc(c['length_of_cycle1']), np.trunc(c['length_of_cycle2']), np.trunc(c['length_of_cycle3'])],
+        convergance_periods=[c['revenue_convergance_periods_cycle1'],
+                             c['revenue_convergance_periods_cycle2'],
+                             c['revenue_convergance_periods_cycle3']],
+        valuation_interval_in_years=max_horizon)
+    return({'revenue_growth': revenue_growth,
+            'revenues': c['revenue_base'][:, None] * np.cumprod(1 + revenue_growth, axis=1)})
+
+
+def _tax_rate_stage(c, s, horizon, max_horizon):
+    return({'tax_rates': _converge(c, c['current_effective_tax_rate'], c['marginal_tax_rate'],
+                                   'year_effective_tax_rate_begin_to_converge_marginal_tax_rate', horizon, max_horizon)})
+
+
+def _sales_to_capital_stage(c, s, horizon, max_horizon):
+    return({'sales_to_capital_ratios': _converge(c, c['current_sales_to_capital_ratio'], c['terminal_sales_to_capital_ratio'],
+                                                 'year_sales_to_capital_begins_to_converge_to_terminal_sales_to_capital',
+                                                 horizon, max_horizon)})
+
+
+def _margin_stage(c, s, horizon, max_horizon):
+    return({'operating_margins': _converge(c, c['current_operating_margin'], c['terminal_operating_margin'],
+                                           'year_operating_margin_begins_to_converge_to_terminal_operating_margin',
+                                           horizon, max_horizon)})
+
+
+def _reinvestment_stage(c, s, horizon, max_horizon):
+    revenue_base = c['revenue_base']
+    reinvestment = np.diff(s['revenues'], axis=1, prepend=revenue_base[:, None]) / s['sales_to_capital_ratios']
+    reinvestment = np.where(reinvestment > 0, reinvestment,
+                            reinvestment * c['asset_liquidation_during_negative_growth'][:, None])
+    current_invested_capital = c['current_invested_capital']
+    current_invested_capital = np.where(np.isnan(current_invested_capital),
+                                        revenue_base / c['current_sales_to_capital_ratio'],
+                                        current_invested_capital)
+    return({'reinvestment': reinvestment,
+            'invested_capital': np.cumsum(reinvestment, axis=1) + current_invested_capital[:, None]})
+
+
+def _operating_income_stage(c, s, horizon, max_horizon):
+    operating_income = s['revenues'] * s['operating_margins']
+    operating_income_after_tax = operating_income * (1 - s['tax_rates'])
+    return({'operating_income': operating_income,
+            'operating_income_after_tax': operating_income_after_tax,
+            'FCFF': operating_income_after_tax - s['reinvestment'],
+            'ROIC': operating_income_after_tax / s['invested_capital'],
+            'reinvestment_rate': s['reinvestment'] / operating_income_after_tax})
+
+
+def _terminal_stage(c, s, horizon, max_horizon):
+    terminal_growth_rate = c['revenue_growth_rate_cycle3_end']
+    terminal_cost_of_capital = last_year(s['cost_of_capital'], horizon)
+    terminal_cost_of_equity = last_year(s['cost_of_equity'], horizon)
+    cum_cost_of_capital_at_the_end_of_valuation = last_year(s['cost_of_capital_cumulative'], horizon)
+    cum_cost_of_equity_at_the_end_of_valuation = last_year(s['cost_of_equity_cumulative'], horizon)
+    terminal_reinvestment_rate = np.where(terminal_growth_rate < 0, 0,
+                                          terminal_growth_rate / (terminal_cost_of_capital + c['additional_return_on_cost_of_capital_in_perpetuity']))
+    terminal_revenue = last_year(s['revenues'], horizon) * (1 + terminal_growth_rate)
+    terminal_operating_income = terminal_revenue * c['terminal_operating_margin']
+    terminal_operating_income_after_tax = terminal_operating_income * (1 - c['marginal_tax_rate'])
+    terminal_reinvestment = terminal_operating_income_after_tax * terminal_reinvestment_rate
+    terminal_FCFF = terminal_operating_income_after_tax - terminal_reinvestment
+    return({'terminal_cost_of_capital': terminal_cost_of_capital,
+            'cum_cost_of_equity_at_the_end_of_valuation': cum_cost_of_equity_at_the_end_of_valuation,
+            'terminal_revenue': terminal_revenue,
+            'terminal_operating_income': terminal_operating_income,
+            'terminal_operating_income_after_tax': terminal_operating_income_after_tax,
+            'terminal_reinvestment': terminal_reinvestment,
+            'terminal_FCFF': terminal_FCFF,
+            'terminal_value': terminal_FCFF / (terminal_cost_of_capital - terminal_growth_rate),
+            'terminal_discount_rate': (terminal_cost_of_capital - terminal_growth_rate) * cum_cost_of_capital_at_the_end_of_valuation,
+            'terminal_equity_discount_rate': (terminal_cost_of_equity - terminal_growth_rate) * cum_cost_of_equity_at_the_end_of_valuation,
+            'terminal_after_tax_cost_of_debt': last_year(s['after_tax_cost_of_debt'], horizon)})
+
+
+def _present_value_stage(c, s, horizon, max_horizon):
+    PVFCFF = s['FCFF'] / s['cost_of_capital_cumulative']
+    terminal_PVFCFF = s['terminal_FCFF'] / s['terminal_discount_rate']
+    value_of_operating_assets = np.where(horizon_mask(horizon, max_horizon), PVFCFF, 0).sum(axis=1) + terminal_PVFCFF
+    firm_value = value_of_operating_assets + c['cash_and_non_operating_asset']
+    return({'PVFCFF': PVFCFF,
+            'terminal_PVFCFF': terminal_PVFCFF,
+            'value_of_operating_assets': value_of_operating_assets,
+            'firm_value': firm_value,
+            'intrinsic_equity_present_value': firm_value - c['debt_value']})
+
+
+def _return_stage(c, s, horizon, max_horizon):
+    equity_value = c['equity_value']
+    years = np.arange(max_horizon)
+    intrinsic_equity_present_value = s['intrinsic_equity_present_value']
+    cum_cost_of_equity_at_the_end_of_valuation = s['cum_cost_of_equity_at_the_end_of_valuation']
+    intrinsic_equity_future_value = intrinsic_equity_present_value * cum_cost_of_equity_at_the_end_of_valuation
+    with np.errstate(invalid='ignore'):
+        acceptable_annualized_return_on_equity = (cum_cost_of_equity_at_the_end_of_valuation ** (1 / horizon)) - 1
+        expected_annualized_return_on_equity = ((intrinsic_equity_future_value / equity_value) ** (1 / horizon)) - 1
+        excess_annualized_return_on_equity = ((intrinsic_equity_present_value / equity_value) ** (1 / horizon)) - 1
+
+    def cum_return_calculator(value):
+        return((1 + value)[:, None] ** (years + 1))
+
+    cum_expected_annualized_return_on_equity = cum_return_calculator(expected_annualized_return_on_equity)
+    return({'cum_acceptable_annualized_return_on_equity': cum_return_calculator(acceptable_annualized_return_on_equity),
+            'cum_expected_annualized_return_on_equity': cum_expected_annualized_return_on_equity,
+            'cum_excess_annualized_return_on_equity': cum_return_calculator(excess_annualized_return_on_equity),
+            'cum_excess_annualized_return_on_equity_realized': cum_expected_annualized_return_on_equity / s['cost_of_equity_cumulative'],
+            'excess_annualized_return_on_equity': np.ones((len(horizon), max_horizon)) * excess_annualized_return_on_equity[:, None]})
+
+
+### Stages of the valuation in dependency order: (name, function, sampled inputs read, stages read).
+### Every stage also reads the cycle lengths through the horizon. See stages_to_recompute
+VALUATION_STAGES = [
+    ('cost_of_capital', _cost_of_capital_stage,
+     ('marginal_tax_rate', 'debt_value', 'equity_value', 'unlevered_beta', 'terminal_unlevered_beta',
+      'year_beta_begins_to_converge_to_terminal_beta', 'current_pretax_cost_of_debt', 'terminal_pretax_cost_of_debt',
+      'year_cost_of_debt_begins_to_converge_to_terminal_cost_of_debt', 'risk_free_rate', 'ERP'), ()),
+    ('revenues', _revenue_stage,
+     ('revenue_base', 'revenue_growth_rate_cycle1_begin', 'revenue_growth_rate_cycle1_end',
+      'revenue_growth_rate_cycle2_begin', 'revenue_growth_rate_cycle2_end',
+      'revenue_growth_rate_cycle3_begin', 'revenue_growth_rate_cycle3_end',
+      'revenue_convergance_periods_cycle1', 'revenue_convergance_periods_cycle2', 'revenue_convergance_periods_cycle3'), ()),
+    ('tax_rates', _tax_rate_stage,
+     ('current_effective_tax_rate', 'marginal_tax_rate', 'year_effective_tax_rate_begin_to_converge_marginal_tax_rate'), ()),
+    ('sales_to_capital', _sales_to_capital_stage,
+     ('current_sales_to_capital_ratio', 'terminal_sales_to_capital_ratio',
+      'year_sales_to_capital_begins_to_converge_to_terminal_sales_to_capital'), ()),
+    ('margins', _margin_stage,
+     ('current_operating_margin', 'terminal_operating_margin',
+      'year_operating_margin_begins_to_converge_to_terminal_operating_margin'), ()),
+    ('reinvestment', _reinvestment_stage,
+     ('revenue_base', 'asset_liquidation_during_negative_growth', 'current_invested_capital', 'current_sales_to_capital_ratio'),
+     ('revenues', 'sales_to_capital')),
+    ('operating_income', _operating_income_stage, (), ('revenues', 'margins', 'tax_rates', 'reinvestment')),
+    ('terminal', _terminal_stage,
+     ('revenue_growth_rate_cycle3_end', 'additional_return_on_cost_of_capital_in_perpetuity', 'terminal_operating_margin',
+      'marginal_tax_rate'),
+     ('cost_of_capital', 'revenues')),
+    ('present_value', _present_value_stage, ('cash_and_non_operating_asset', 'debt_value'),
+     ('operating_income', 'cost_of_capital', 'terminal')),
+    ('returns', _return_stage, ('equity_value',), ('present_value', 'terminal', 'cost_of_capital')),
+]
+
+### Inputs every stage depends on
+HORIZON_VARIABLE_NAMES = ('length_of_cycle1', 'length_of_cycle2', 'length_of_cycle3')
+
+### State entry of each per year series of the valuation, and the stage computing it
+SERIES_STATE = {'cumWACC': 'cost_of_capital_cumulative',
+                'cumCostOfEquity': 'cost_of_equity_cumulative',
+                'beta': 'beta',
+                'ERP': 'ERP',
+                'projected_after_tax_cost_of_debt': 'after_tax_cost_of_debt',
+                'revenueGrowth': 'revenue_growth',
+                'revenues': 'revenues',
+                'margins': 'operating_margins',
+                'ebit': 'operating_income',
+                'sales_to_capital_ratio': 'sales_to_capital_ratios',
+                'taxRate': 'tax_rates',
+                'afterTaxOperatingIncome': 'operating_income_after_tax',
+                'reinvestment': 'reinvestment',
+                'invested_capital': 'invested_capital',
+                'ROIC': 'ROIC',
+                'reinvestmentRate': 'reinvestment_rate',
+                'FCFF': 'FCFF',
+                'projected_FCFF_value': 'FCFF',
+                'PVFCFF': 'PVFCFF',
+                'cum_acceptable_annualized_return_on_equity': 'cum_acceptable_annualized_return_on_equity',
+                'cum_expected_annualized_return_on_equity': 'cum_expected_annualized_return_on_equity',
+                'cum_excess_annualized_return_on_equity': 'cum_excess_annualized_return_on_equity',
+                'cum_excess_annualized_return_on_equity_realized': 'cum_excess_annualized_return_on_equity_realized',
+                'excess_annualized_return_on_equity': 'excess_annualized_return_on_equity'}
+
+
+### Stage of VALUATION_STAGES computing each per year series
+SERIES_STAGE = {'cumWACC': 'cost_of_capital',
+                'cumCostOfEquity': 'cost_of_capital',
+                'beta': 'cost_of_capital',
+                'ERP': 'cost_of_capital',
+                'projected_after_tax_cost_of_debt': 'cost_of_capital',
+                'revenueGrowth': 'revenues',
+                'revenues': 'revenues',
+                'margins': 'margins',
+                'ebit': 'operating_income',
+                'sales_to_capital_ratio': 'sales_to_capital',
+                'taxRate': 'tax_rates',
+                'afterTaxOperatingIncome': 'operating_income',
+                'reinvestment': 'reinvestment',
+                'invested_capital': 'reinvestment',
+                'ROIC': 'operating_income',
+                'reinvestmentRate': 'operating_income',
+                'FCFF': 'operating_income',
+                'projected_FCFF_value': 'operating_income',
+                'PVFCFF': 'present_value',
+                'cum_acceptable_annualized_return_on_equity': 'returns',
+                'cum_expected_annualized_return_on_equity': 'returns',
+                'cum_excess_annualized_return_on_equity': 'returns',
+                'cum_excess_annualized_return_on_equity_realized': 'returns',
+                'excess_annualized_return_on_equity': 'returns'}
+
+
+def stages_for_series(series):
+    """
+    Names of the VALUATION_STAGES to run for a valuation with only these per year series, in dependency order:
+    present_value and its upstream stages (the scalar outputs) and the stages computing the series.
+    """
+    needed = {'present_value'} | {SERIES_STAGE[name] for name in series}
+    for name, _, _, upstream in reversed(VALUATION_STAGES):
+        if name in needed:
+            needed.update(upstream)
+    return([name for name, _, _, _ in VALUATION_STAGES if name in needed])
+
+
+def stages_to_recompute(changed_variables):
+    """
+    Names of the VALUATION_STAGES to run again when the sampled inputs changed_variables change,
+    in dependency order - every stage when a cycle length changes.
+    """
+    changed_variables = set(changed_variables)
+    if changed_variables & set(HORIZON_VARIABLE_NAMES):
+        return([name for name, _, _, _ in VALUATION_STAGES])
+    stale = []
+    for name, _, variables, upstream in VALUATION_STAGES:
+        if changed_variables.intersection(variables) or any(stage in stale for stage in upstream):
+            stale.append(name)
+    return(stale)
+
+
+def run_valuation_stages(columns, horizon, max_horizon, state=None, stages=None):
+    """
+    Run the stages (default all) of the valuation on the sample columns (see sample_columns) and
+    update state, the dict of every stage's intermediate arrays. Returns state.
+    """
+    state = {} if state is None else state
+    for name, function, _, _ in VALUATION_STAGES:
+        if stages is None or name in stages:
+            state.update(function(columns, state, horizon, max_horizon))
+    return(state)
+
+
+def assemble_valuation(c, s, horizon, max_horizon, series=None):
+    """
+    Output dict of batch_valuator_multi_phase from the sample columns c and the state s of run_valuation_stages.
+    series: per year series to mask into 'valuation' (default all of SERIES_STATE).
+    """
+    valid = horizon_mask(horizon, max_horizon)
+    ### Years past the valuation interval of a sample are padding
+    valuation = {col: np.where(valid, s[SERIES_STATE[col]], np.nan) for col in (SERIES_STATE if series is None else series)}
+    missing = np.full_like(c['revenue_base'], np.nan)
+    terminal = {'cumWACC': s['terminal_discount_rate'],
+                'cumCostOfEquity': s['terminal_equity_discount_rate'],
+                'beta': s['terminal_beta'],
+                'ERP': c['ERP'],
+                'projected_after_tax_cost_of_debt': s['terminal_after_tax_cost_of_debt'],
+                'revenueGrowth': c['revenue_growth_rate_cycle3_end'],
+                'revenues': s['terminal_revenue'],
+                'margins': c['terminal_operating_margin'],
+                'ebit': s['terminal_operating_income'],
+                'sales_to_capital_ratio': c['terminal_sales_to_capital_ratio'],
+                'taxRate': c['marginal_tax_rate'],
+                'afterTaxOperatingIncome': s['terminal_operating_income_after_tax'],
+                'reinvestment': s['terminal_reinvestment'],
+                'invested_capital': missing,
+                'ROIC': s['terminal_cost_of_capital'] + c['additional_return_on_cost_of_capital_in_perpetuity'],
+                'reinvestmentRate': s['terminal_reinvestment'] / s['terminal_operating_income_after_tax'],
+                'FCFF': s['terminal_FCFF'],
+                'projected_FCFF_value': s['terminal_value'],
+                'PVFCFF': s['terminal_PVFCFF'],
+                'cum_acceptable_annualized_return_on_equity': missing,
+                'cum_expected_annualized_return_on_equity': missing,
+                'cum_excess_annualized_return_on_equity': missing,
+                'cum_excess_annualized_return_on_equity_realized': missing,
+                'excess_annualized_return_on_equity': missing}
+    return({'valuation': valuation,
+            'terminal': terminal,
+            'firm_value': s['firm_value'],
+            'equity_value': s['intrinsic_equity_present_value'],
+            'cash_and_non_operating_asset': c['cash_and_non_operating_asset'],
+            'debt_value': c['debt_value'],
+            'value_of_operating_assets': s['value_of_operating_assets'],
+            'valuation_interval_in_years': horizon})
+
+
+def sample_horizon(columns):
+    """valuation_interval_in_years of every sample: the sum of the truncated cycle lengths"""
+    return(sum(np.trunc(columns[name]) for name in HORIZON_VARIABLE_NAMES).astype(int))
+
+
+########################################################
+# BATCH VALUATOR MULTI PHASE
+########################################################
+
+def batch_valuator_multi_phase(samples,
+                               max_horizon=None,
+                               series=None):
+    """
+    Value every sample of a Monte Carlo run at once.
+
+    Same model as valuator_multi_phase but every quantity is a NumPy array:
+    scalars are (n,) and per year series are (n, max_horizon).
+    Samples can have different valuation_interval_in_years: per year series are
+    padded with NaN after the last projected year of each sample (see horizon_mask).
+    The model runs as the VALUATION_STAGES, so a change of a few inputs can rerun only the stages reading them.
+
+    samples: sample matrix - see sample_columns.
+    current_invested_capital set to NaN is treated as 'implicit'.
+
+    max_horizon: width of the per year arrays, defaults to the longest valuation interval.
+    Pass it to get the same layout across several calls.
+
+    series: per year series of 'valuation' (default all) - only the stages they and the scalar
+    outputs need run, see stages_for_series.
+
+    Returns a dict with the same keys as valuator_multi_phase, where 'valuation'
+    is a dict of per year arrays and 'terminal' holds the terminal year values.
+    """
+    c = sample_columns(samples)
+    horizon = sample_horizon(c)
+    if max_horizon is None:
+        max_horizon = int(horizon.max(initial=1))
+    elif np.any(horizon > max_horizon):
+        raise ValueError(f"valuation_interval_in_years exceeds max_horizon={max_horizon}")
+    stages = None if series is None else stages_for_series(series)
+    return(assemble_valuation(c, run_valuation_stages(c, horizon, max_horizon, stages=stages), horizon, max_horizon, series))
@@ -0,0 +1,89 @@
+import sys
+import math
+import time
+import threading
+
+########################################################
+# COST MODEL
+########################################################
+
+class CostModel:
+    """
+    Seconds to process n samples, modelled as fixed + per_sample * n.
+    Both terms follow the observed timings through exponentially weighted sums: the line is refitted by least
+    squares once the observed sample sizes spread enough to tell the terms apart, and until then the prior line
+    is scaled through the mean observation - so the model adapts to the machine and to the load across requests.
+    """
+
+    ### Smallest coefficient of variation of the observed sample sizes the least squares fit is trusted from
+    MIN_SIZE_VARIATION = 0.1
+
+    def __init__(self, fixed, per_sample, smoothing=0.3):
+        self.fixed = fixed
+        self.per_sample = per_sample
+        self.smoothing = smoothing
+        self._prior = (fixed, per_sample)
+        ### Exponentially weighted sums of 1, n, n^2, t and n t over the observations
+        self._sums = [0.0] * 5
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"CostModel(fixed={self.fixed:.3g}, per_sample={self.per_sample:.3g})"
+
+    def predict(self, sample_size):
+        return self.fixed + self.per_sample * sample_size
+
+    def affordable(self, seconds):
+        """Largest sample size predicted to fit in seconds (0 if not even the fixed cost fits, sys.maxsize for inf)"""
+        if not math.isfinite(seconds):
+            return sys.maxsize if seconds > 0 else 0
+        return max(int((seconds - self.fixed) / self.per_sample), 0)
+
+    def update(self, sample_size, seconds):
+        if sample_size <= 0:
+            return
+        terms = (1.0, sample_size, sample_size ** 2, seconds, sample_size * seconds)
+        with self._lock:
+            self._sums = [(1 - self.smoothing) * total + self.smoothing * term for total, term in zip(self._sums, terms)]
+            weight, n, n2, t, nt = self._sums
+            mean_n, mean_t = n / weight, t / weight
+            variance_n = max(n2 / weight - mean_n ** 2, 0)
+            if variance_n > (self.MIN_SIZE_VARIATION * mean_n) ** 2:
+                per_sample = (nt / weight - mean_n * mean_t) / variance_n
+                fixed = mean_t - per_sample * mean_n
+                if per_sample > 0 and fixed >= 0:
+                    self.fixed, self.per_sample = fixed, per_sample
+                    return
+            prior_fixed, prior_per_sample = self._prior
+            scale = mean_t / (prior_fixed + prior_per_sample * mean_n)
+            self.fixed, self.per_sample = prior_fixed * scale, prior_per_sample * scale
+
+
+### Sampling plus valuation of a batch, valuation_describer with the charts, and without them (summaries and
+### confidence intervals) - shared by every request
+VALUATION_COST = CostModel(fixed=0.005, per_sample=2e-5)
+DESCRIBER_COST = CostModel(fixed=0.5, per_sample=5e-5)
+SUMMARY_COST = CostModel(fixed=0.005, per_sample=1e-6)
+
+
+def describer_cost(include_plots=True):
+    """Cost model of valuation_describer with or without the plots"""
+    return DESCRIBER_COST if include_plots else SUMMARY_COST
+
+
+########################################################
+# DEADLINE
+########################################################
+
+def deadline_from_budget(time_budget, start=None):
+    """time.monotonic() deadline of a time budget in seconds - None for no budget"""
+    if time_budget is None:
+        return None
+    return (time.monotonic() if start is None else start) + time_budget
+
+
+def remaining_seconds(deadline):
+    """Seconds left before the deadline (inf without one)"""
+    if deadline is None:
+        return float('inf')
+    return deadline - time.monotonic()
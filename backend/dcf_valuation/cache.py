@@ -0,0 +1,164 @@
+import os
+import sys
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from .batch import VARIABLE_NAMES
+from .results import SimulationResults
+from .sampling import Marginal, canonical_correlations
+
+########################################################
+# VARIABLES
+########################################################
+
+### Bounds of RESULT_CACHE - an entry larger than the byte bound is not cached
+DEFAULT_CACHE_ENTRIES = int(os.environ.get("DCF_RESULT_CACHE_ENTRIES", "64"))
+DEFAULT_CACHE_BYTES = int(os.environ.get("DCF_RESULT_CACHE_BYTES", str(256 * 1024 * 1024)))
+
+### Keep the SimulationResults of each run next to its describer output (off: only the response is cached)
+CACHE_SIMULATION_RESULTS = os.environ.get("DCF_RESULT_CACHE_SIMULATION_RESULTS", "0") == "1"
+
+
+########################################################
+# CONTENT ADDRESS
+########################################################
+
+def _canonical(value):
+    """JSON friendly canonical form of a monte_carlo_input value"""
+    if isinstance(value, Marginal):
+        return [value.family, [[name, value.params[name]] for name in Marginal.PARAMETERS[value.family]]]
+    if isinstance(value, dict):
+        return {str(key): _canonical(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(item) for item in value]
+    if isinstance(value, (bool, str)) or value is None:
+        return value
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    if isinstance(value, (float, np.floating)):
+        return float(value)
+    ### OpenTURNS distributions print their parameters
+    return repr(value)
+
+
+def result_key(monte_carlo_input, shares_outstanding=None, **options):
+    """
+    Stable hash (hex SHA-256) of everything a valuation's response depends on: the marginals of
+    monte_carlo_input - the normalized input_list, see adjust_parameters_input_to_api - the canonical
+    correlation list (see canonical_correlations), the sample size, sampling mode and seed when present,
+    the shares outstanding and the run options (adaptive, variance_reduction, surrogate...).
+    """
+    content = {name: _canonical(value) for name, value in monte_carlo_input.items()
+               if name != 'list_of_correlation_between_variables'}
+    content['list_of_correlation_between_variables'] = [list(pair) for pair in canonical_correlations(
+        VARIABLE_NAMES, monte_carlo_input.get('list_of_correlation_between_variables', []))]
+    content['shares_outstanding'] = _canonical(shares_outstanding)
+    content['options'] = _canonical(options)
+    encoded = json.dumps(content, sort_keys=True, separators=(',', ':'), allow_nan=True)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+def seed_from_key(key):
+    """Seed derived from a result_key: identical inputs draw identical samples, so their results can be cached"""
+    return int(key[:16], 16)
+
+
+########################################################
+# SIZE OF AN ENTRY
+########################################################
+
+def approximate_nbytes(value):
+    """Bytes held by a response or SimulationResults - arrays and strings counted by their data"""
+    if isinstance(value, SimulationResults):
+        return value.nbytes
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(approximate_nbytes(key) + approximate_nbytes(item) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return sum(approximate_nbytes(item) for item in value)
+    return sys.getsizeof(value)
+
+
+########################################################
+# RESULT CACHE
+########################################################
+
+class ResultCache:
+    """
+    LRU cache of valuation responses by result_key, bounded by a number of entries and by bytes.
+    Entries are stored as given and must not be mutated by the callers. Thread safe.
+    """
+
+    def __init__(self, max_entries=DEFAULT_CACHE_ENTRIES, max_bytes=DEFAULT_CACHE_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key):
+        """Cached value of the key, or None - counts a hit or a miss"""
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key][0]
+
+    def peek(self, key):
+        """Cached value of the key, or None - without touching the counters or the LRU order"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return None if entry is None else entry[0]
+
+    def put(self, key, value, nbytes=None):
+        """Store value, evicting the least recently used entries to stay within the bounds"""
+        nbytes = approximate_nbytes(value) if nbytes is None else nbytes
+        with self._lock:
+            if key in self._entries:
+                self._nbytes -= self._entries.pop(key)[1]
+            if self.max_entries <= 0 or nbytes > self.max_bytes:
+                return False
+            self._entries[key] = (value, nbytes)
+            self._nbytes += nbytes
+            while len(self._entries) > self.max_entries or self._nbytes > self.max_bytes:
+                _, (_, evicted_nbytes) = self._entries.popitem(last=False)
+                self._nbytes -= evicted_nbytes
+                self.evictions += 1
+            return True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"entries": len(self._entries),
+                    "bytes": self._nbytes,
+                    "max_entries": self.max_entries,
+                    "max_bytes": self.max_bytes,
+                    "hits": self.hits,
+                    "misses": self.misses,
+                    "hit_rate": self.hits / lookups if lookups else 0.0,
+                    "evictions": self.evictions}
+
+
+### Responses of /dcf shared by every request
+RESULT_CACHE = ResultCache()
@@ -0,0 +1,133 @@
+import numpy as np
+import scipy.stats
+
+########################################################
+# VARIABLES
+########################################################
+
+### Percentiles of the equity value reported in valuation_summary, and in tail_summary for the risk reviews
+REPORTED_PERCENTILES = (20, 50, 80)
+TAIL_PERCENTILES = (1, 5, 95, 99)
+
+CONFIDENCE_INTERVAL_METHODS = ('order_statistic', 'bootstrap')
+TOLERANCE_TYPES = ('relative', 'absolute')
+
+
+########################################################
+# WEIGHTED PERCENTILE
+########################################################
+
+def weighted_percentile(values, weights, percentiles):
+    """
+    Percentiles of weighted samples: the weighted ECDF, evaluated at the middle of each
+    sample's weight, is interpolated. Negative weights (control variates) are allowed - the
+    cumulative weights are made non decreasing first.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    ### Stable: tied values accumulate their weights in sample order, as in DistributionSummary
+    order = np.argsort(values, kind='stable')
+    sorted_weights = np.asarray(weights, dtype=np.float64)[order]
+    cumulative = np.cumsum(sorted_weights)
+    cumulative = np.maximum.accumulate((cumulative - sorted_weights / 2) / cumulative[-1])
+    return np.interp(np.asarray(percentiles, dtype=np.float64) / 100, cumulative, values[order])
+
+
+########################################################
+# PERCENTILE CONFIDENCE INTERVALS
+########################################################
+
+def order_statistic_confidence_intervals(values, percentiles, confidence=0.95):
+    """
+    Distribution free confidence intervals of the percentiles of values.
+    The number of samples below a quantile is binomial, so the bounds are the sorted
+    values at the alpha/2 and 1 - alpha/2 binomial ranks. Returns (lower, upper) arrays.
+    """
+    values = np.sort(np.asarray(values, dtype=np.float64))
+    n = len(values)
+    q = np.asarray(percentiles, dtype=np.float64) / 100
+    alpha = 1 - confidence
+    lower_rank = scipy.stats.binom.ppf(alpha / 2, n, q).astype(np.int64) - 1
+    upper_rank = scipy.stats.binom.ppf(1 - alpha / 2, n, q).astype(np.int64)
+    return values[np.clip(lower_rank, 0, n - 1)], values[np.clip(upper_rank, 0, n - 1)]
+
+
+def bootstrap_confidence_intervals(values, percentiles, confidence=0.95, n_resamples=200, rng=None, block_size=20):
+    """Percentile bootstrap confidence intervals of the percentiles of values. Returns (lower, upper) arrays."""
+    values = np.asarray(values, dtype=np.float64)
+    rng = np.random.default_rng(rng)
+    n = len(values)
+    estimates = []
+    ### Resample in blocks so at most block_size * n values are drawn at once
+    for start in range(0, n_resamples, block_size):
+        resamples = values[rng.integers(0, n, (min(block_size, n_resamples - start), n))]
+        estimates.append(np.percentile(resamples, percentiles, axis=1).T)
+    estimates = np.concatenate(estimates)
+    alpha = 1 - confidence
+    return np.percentile(estimates, 100 * alpha / 2, axis=0), np.percentile(estimates, 100 * (1 - alpha / 2), axis=0)
+
+
+def weighted_confidence_intervals(values, weights, percentiles, confidence=0.95):
+    """
+    Confidence intervals of the weighted percentiles of values (importance or control variate weights).
+    The weighted CDF at the estimate q_p has variance sum(w^2 (1{x <= q_p} - p)^2) for normalized weights;
+    the bounds are the weighted percentiles at p -/+ z standard deviations.
+    Returns (lower, upper, effective_sample_size) arrays - effective_sample_size is p(1 - p) over that variance,
+    the independent equally weighted samples with the same precision at each percentile.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    weights = np.asarray(weights, dtype=np.float64) / np.sum(weights)
+    q = np.asarray(percentiles, dtype=np.float64) / 100
+    estimates = weighted_percentile(values, weights, percentiles)
+    below = values[None, :] <= estimates[:, None]
+    variance = np.sum(weights[None, :] ** 2 * (below - q[:, None]) ** 2, axis=1)
+    z = scipy.stats.norm.ppf(0.5 + confidence / 2)
+    lower = weighted_percentile(values, weights, 100 * np.clip(q - z * np.sqrt(variance), 0, 1))
+    upper = weighted_percentile(values, weights, 100 * np.clip(q + z * np.sqrt(variance), 0, 1))
+    with np.errstate(divide='ignore'):
+        effective_sample_size = np.where(variance > 0, q * (1 - q) / variance, len(values))
+    return lower, upper, effective_sample_size
+
+
+def percentile_confidence_intervals(values, percentiles=REPORTED_PERCENTILES, confidence=0.95, method='order_statistic', rng=None, weights=None):
+    """
+    Estimate and confidence interval of each percentile of values.
+    Returns one dict per percentile: percentiles, equity_value, lower, upper and
+    standard_error (half width of the interval over the normal quantile of the confidence level).
+    With weights the method is 'weighted' (see weighted_confidence_intervals) and each dict
+    also has the effective_sample_size of its percentile.
+    """
+    z = scipy.stats.norm.ppf(0.5 + confidence / 2)
+    if weights is not None:
+        lower, upper, effective_sample_size = weighted_confidence_intervals(values, weights, percentiles, confidence)
+        estimates = weighted_percentile(values, weights, percentiles)
+        return [{"percentiles": percentile,
+                 "equity_value": float(estimate),
+                 "lower": float(low),
+                 "upper": float(high),
+                 "standard_error": float((high - low) / (2 * z)),
+                 "effective_sample_size": float(size)}
+                for percentile, estimate, low, high, size in zip(percentiles, estimates, lower, upper, effective_sample_size)]
+    if method == 'order_statistic':
+        lower, upper = order_statistic_confidence_intervals(values, percentiles, confidence)
+    elif method == 'bootstrap':
+        lower, upper = bootstrap_confidence_intervals(values, percentiles, confidence, rng=rng)
+    else:
+        raise ValueError(f"Unknown confidence interval method: {method}")
+    estimates = np.percentile(values, percentiles)
+    return [{"percentiles": percentile,
+             "equity_value": float(estimate),
+             "lower": float(low),
+             "upper": float(high),
+             "standard_error": float((high - low) / (2 * z))}
+            for percentile, estimate, low, high in zip(percentiles, estimates, lower, upper)]
+
+
+def within_tolerance(confidence_intervals, tolerance, tolerance_type='relative'):
+    """True when the standard error of every percentile is under the tolerance (relative to the estimate, or absolute)"""
+    if tolerance_type not in TOLERANCE_TYPES:
+        raise ValueError(f"Unknown tolerance type: {tolerance_type}")
+    for interval in confidence_intervals:
+        scale = abs(interval["equity_value"]) if tolerance_type == 'relative' else 1
+        if not interval["standard_error"] <= tolerance * scale:
+            return False
+    return True
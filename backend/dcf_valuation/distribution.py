@@ -0,0 +1,144 @@
+import numpy as np
+from functools import cached_property
+from .confidence import REPORTED_PERCENTILES, percentile_confidence_intervals
+
+########################################################
+# VARIABLES
+########################################################
+
+### Largest sample the ECDF plot embeds - the figure carries every point
+PLOT_SAMPLE_SIZE = 50000
+
+
+########################################################
+# DISTRIBUTION SUMMARY
+########################################################
+
+class DistributionSummary:
+    """
+    Sorted sample of a scalar output, shared by valuation_describer and its plots.
+    The values are sorted once; a percentile is then an index (or a binary search when weighted),
+    an ECDF value or histogram edge a binary search, and the moments are computed once.
+
+    values: (n,) sample
+    weights: (n,) sample weights of any scale (importance or control variate weights, negative allowed),
+             or None when every sample counts the same
+
+    Percentiles match np.percentile unweighted and weighted_percentile weighted.
+    """
+
+    def __init__(self, values, weights=None):
+        values = np.asarray(values, dtype=np.float64)
+        order = np.argsort(values, kind='stable')
+        self.values = values[order]
+        if weights is None:
+            self.weights = None
+            self._cumulative = np.arange(1, len(values) + 1) / len(values)
+        else:
+            sorted_weights = np.asarray(weights, dtype=np.float64)[order]
+            cumulative = np.cumsum(sorted_weights)
+            self.weights = sorted_weights / cumulative[-1]
+            ### Same midpoint rule as weighted_percentile, made non decreasing for negative weights
+            self._midpoints = np.maximum.accumulate((cumulative - sorted_weights / 2) / cumulative[-1])
+            self._cumulative = np.clip(np.maximum.accumulate(cumulative / cumulative[-1]), 0, 1)
+
+    def __len__(self):
+        return len(self.values)
+
+    @property
+    def min(self):
+        return float(self.values[0])
+
+    @property
+    def max(self):
+        return float(self.values[-1])
+
+    @property
+    def median(self):
+        return float(self.percentile(50))
+
+    @property
+    def effective_sample_size(self):
+        """Kish's effective sample size - n when unweighted"""
+        if self.weights is None:
+            return float(len(self))
+        return float(1 / np.sum(self.weights ** 2))
+
+    def percentile(self, percentiles):
+        """Percentiles (0 to 100) of the sample, shaped as percentiles"""
+        q = np.asarray(percentiles, dtype=np.float64) / 100
+        if self.weights is not None:
+            return np.interp(q, self._midpoints, self.values)
+        position = q * (len(self) - 1)
+        lower = np.clip(np.floor(position), 0, len(self) - 1).astype(np.int64)
+        upper = np.minimum(lower + 1, len(self) - 1)
+        fraction = position - lower
+        below, above = self.values[lower], self.values[upper]
+        difference = above - below
+        ### Same interpolation as np.percentile
+        return np.where(fraction >= 0.5, above - difference * (1 - fraction), below + difference * fraction)
+
+    def ecdf(self, x):
+        """Share of the sample's weight at or below x"""
+        index = np.searchsorted(self.values, x, side='right')
+        return np.where(index > 0, self._cumulative[np.maximum(index - 1, 0)], 0.0)
+
+    def histogram(self, bins=30, range=None):
+        """
+        Share of the sample's weight in each of bins equal width bins over range (the sample's range by default):
+        (shares, edges) - the bins of np.histogram, times n the counts of an unweighted sample.
+        """
+        lower, upper = (self.min, self.max) if range is None else range
+        if lower == upper:
+            lower, upper = lower - 0.5, upper + 0.5
+        edges = np.linspace(lower, upper, bins + 1)
+        ### Bins are closed on the left, the last one on both sides
+        index = np.searchsorted(self.values, edges, side='left')
+        index[-1] = np.searchsorted(self.values, edges[-1], side='right')
+        cumulative = np.concatenate([[0.0], self._cumulative])[index]
+        return np.diff(cumulative), edges
+
+    @cached_property
+    def _central_moments(self):
+        weights = np.full(len(self), 1 / len(self)) if self.weights is None else self.weights
+        mean = np.dot(weights, self.values)
+        deviations = self.values - mean
+        return (mean,) + tuple(np.dot(weights, deviations ** power) for power in (2, 3, 4))
+
+    @property
+    def mean(self):
+        return float(self._central_moments[0])
+
+    @property
+    def std(self):
+        return float(np.sqrt(self._central_moments[1]))
+
+    @property
+    def skewness(self):
+        _, variance, third, _ = self._central_moments
+        return float(third / variance ** 1.5) if variance > 0 else float('nan')
+
+    @property
+    def kurtosis(self):
+        """Excess kurtosis"""
+        _, variance, _, fourth = self._central_moments
+        return float(fourth / variance ** 2 - 3) if variance > 0 else float('nan')
+
+    def plot_sample(self, size=PLOT_SAMPLE_SIZE):
+        """
+        The sorted values when small and unweighted, otherwise evenly spaced (weighted) percentiles of them:
+        the plots keep the shape of the distribution without embedding millions of points.
+        """
+        if self.weights is None and len(self) <= size:
+            return self.values
+        size = min(size, len(self))
+        return self.percentile(100 * (np.arange(size) + 0.5) / size)
+
+    def ecdf_points(self, size=PLOT_SAMPLE_SIZE):
+        """(x, y) steps of the ECDF of plot_sample"""
+        x = self.plot_sample(size)
+        return x, np.arange(1, len(x) + 1) / len(x)
+
+    def confidence_intervals(self, percentiles=REPORTED_PERCENTILES, confidence=0.95, method='order_statistic', rng=None):
+        """percentile_confidence_intervals of the sample - 'weighted' when it has weights"""
+        return percentile_confidence_intervals(self.values, percentiles, confidence, method, rng, weights=self.weights)
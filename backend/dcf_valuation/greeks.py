@@ -0,0 +1,89 @@
+import numpy as np
+from .batch import VARIABLE_NAMES, INTEGER_VARIABLE_NAMES, batch_valuator_multi_phase
+
+########################################################
+# VARIABLES
+########################################################
+
+### Central difference step of a continuous input, relative to its value
+DEFAULT_RELATIVE_STEP = 1e-4
+
+### Smallest scale the relative step applies to - inputs at or near 0 (additional return, cash) are bumped by
+### DEFAULT_RELATIVE_STEP * STEP_SCALE_FLOOR
+STEP_SCALE_FLOOR = 1e-2
+
+### Defaults of valuator_multi_phase's optional arguments, NaN current_invested_capital is 'implicit'
+BASE_CASE_DEFAULTS = {"additional_return_on_cost_of_capital_in_perpetuity": 0.0,
+                      "cash_and_non_operating_asset": 0.0,
+                      "asset_liquidation_during_negative_growth": 0,
+                      "current_invested_capital": np.nan}
+
+_YEAR_INPUTS = np.array([name in INTEGER_VARIABLE_NAMES for name in VARIABLE_NAMES])
+
+
+########################################################
+# CENTRAL DIFFERENCES
+########################################################
+
+def central_differences(point, steps, output='equity_value'):
+    """
+    Value of an output at point (in VARIABLE_NAMES order) and its central difference slopes over +/- steps.
+    The base point and every input bumped up and down are valued as one batch of 1 + 2d rows.
+    Slopes of inputs with a 0 step, or that are not finite, are 0.
+    """
+    point = np.asarray(point, dtype=np.float64)
+    steps = np.asarray(steps, dtype=np.float64)
+    bumps = np.diag(steps)
+    values = batch_valuator_multi_phase(np.vstack([point, point + bumps, point - bumps]))[output]
+    dimension = len(point)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        gradient = (values[1:dimension + 1] - values[dimension + 1:]) / (2 * steps)
+    gradient = np.where((steps > 0) & np.isfinite(gradient), gradient, 0)
+    return float(values[0]), gradient
+
+
+########################################################
+# GREEKS
+########################################################
+
+def base_case_point(base_case):
+    """
+    Point in VARIABLE_NAMES order of a base case given as keyword arguments of valuator_multi_phase.
+    current_invested_capital 'implicit' or None is NaN, year inputs are truncated as valuator_multi_phase's int() does.
+    Raises ValueError when a required input is missing.
+    """
+    values = {**BASE_CASE_DEFAULTS, **{name: value for name, value in base_case.items() if value is not None}}
+    if values.get("current_invested_capital") == 'implicit':
+        values["current_invested_capital"] = np.nan
+    missing = [name for name in VARIABLE_NAMES if name not in values]
+    if missing:
+        raise ValueError(f"Missing base case inputs: {', '.join(missing)}")
+    point = np.array([float(values[name]) for name in VARIABLE_NAMES])
+    return np.where(_YEAR_INPUTS, np.trunc(point), point)
+
+
+def valuation_greeks(base_case, relative_step=DEFAULT_RELATIVE_STEP, output='equity_value'):
+    """
+    Partial derivative and elasticity of an output of the deterministic valuation with respect to every input,
+    at a base case (keyword arguments of valuator_multi_phase, see base_case_point).
+    Continuous inputs are bumped by relative_step of their value (at least of STEP_SCALE_FLOOR), year inputs by
+    one year - their derivative is the change per year. An implicit current_invested_capital has no derivative.
+    Returns a dict: the output's value at the base case and one row per input with value, step,
+    derivative and elasticity (derivative * value / output).
+    """
+    point = base_case_point(base_case)
+    steps = np.where(_YEAR_INPUTS, 1.0, relative_step * np.maximum(np.abs(point), STEP_SCALE_FLOOR))
+    steps = np.where(np.isfinite(point), steps, 0)
+    value, gradient = central_differences(point, steps, output)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        elasticity = np.where(value != 0, gradient * point / value, np.nan)
+    return {"output": output,
+            "value": value,
+            "greeks": [{"input": name,
+                        "value": None if np.isnan(point[i]) else float(point[i]),
+                        "step": float(steps[i]),
+                        "discrete": bool(_YEAR_INPUTS[i]),
+                        "derivative": float(gradient[i]) if steps[i] > 0 else None,
+                        "elasticity": float(elasticity[i]) if steps[i] > 0 and np.isfinite(elasticity[i]) else None}
+                       for i, name in enumerate(VARIABLE_NAMES)],
+            "evaluations": 2 * len(VARIABLE_NAMES) + 1}
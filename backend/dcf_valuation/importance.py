@@ -0,0 +1,73 @@
+import numpy as np
+from scipy.special import logsumexp
+from .sampling import independent_normals
+from .variance import linear_control, marginal_moments
+from .batch import VARIABLE_NAMES, INTEGER_VARIABLE_NAMES
+
+########################################################
+# VARIABLES
+########################################################
+
+### Shift of the tail components along the direction, in standard deviations - about the normal P1 / P99
+DEFAULT_TAIL_SHIFT = 2.33
+
+### Share of the samples drawn from the unshifted distribution, the rest is split between the two tails.
+### The unshifted component bounds every likelihood ratio by 1 / DEFENSIVE_SHARE
+DEFENSIVE_SHARE = 1 / 3
+
+
+########################################################
+# TAIL DIRECTION
+########################################################
+
+def tail_direction(variables_distributsion, structure):
+    """
+    Unit direction of the copula's independent normals along which the intrinsic equity value moves most,
+    from the linear control of variance.linear_control: the slope of each input times its standard deviation,
+    carried back through the Cholesky factor of the CorrelationStructure.
+    """
+    _, gradient, _ = linear_control(variables_distributsion)
+    stds = np.array([marginal_moments(marginal, name in INTEGER_VARIABLE_NAMES)[1]
+                     for marginal, name in zip(variables_distributsion, VARIABLE_NAMES)])
+    sensitivity = np.nan_to_num(gradient * stds)
+    direction = structure.cholesky.T @ sensitivity
+    norm = np.linalg.norm(direction)
+    if norm == 0:
+        raise ValueError("The equity value does not depend on the sampled inputs")
+    return direction / norm
+
+
+########################################################
+# TAIL IMPORTANCE PROPOSAL
+########################################################
+
+class TailImportanceProposal:
+    """
+    Defensive mixture of the copula's independent normals: N(0, I) with probability defensive_share,
+    and N(-shift * direction, I), N(+shift * direction, I) sharing the rest.
+    Each component gets a fixed share of the rows, and every row carries the likelihood ratio
+    of the target N(0, I) to the mixture, so weighted statistics are unbiased for the target.
+    """
+
+    def __init__(self, direction, shift=DEFAULT_TAIL_SHIFT, defensive_share=DEFENSIVE_SHARE):
+        self.direction = np.asarray(direction, dtype=np.float64)
+        self.shift = float(shift)
+        self.defensive_share = float(defensive_share)
+        self.means = np.array([0.0, -self.shift, self.shift])
+        tail_share = (1 - self.defensive_share) / 2
+        self.shares = np.array([self.defensive_share, tail_share, tail_share])
+
+    def likelihood_ratio(self, normals):
+        """phi(u) / sum_k share_k phi(u - mean_k direction), through the projection of u on the direction"""
+        projection = normals @ self.direction
+        log_mixture = logsumexp(np.log(self.shares)[None, :] + projection[:, None] * self.means - self.means ** 2 / 2, axis=1)
+        return np.exp(-log_mixture)
+
+    def sample(self, sample_size, rng=None, sampling='random'):
+        """(sample_size, d) independent normals of the mixture and their likelihood ratios"""
+        normals = independent_normals(sample_size, len(self.direction), rng, sampling)
+        counts = np.floor(self.shares * sample_size).astype(np.int64)
+        counts[0] += sample_size - counts.sum()
+        component = np.repeat(np.arange(len(self.means)), counts)
+        normals += (self.means[component])[:, None] * self.direction
+        return normals, self.likelihood_ratio(normals)
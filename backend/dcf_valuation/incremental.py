@@ -0,0 +1,149 @@
+import os
+import threading
+import numpy as np
+from .batch import (VARIABLE_NAMES, INTEGER_VARIABLE_NAMES, HORIZON_VARIABLE_NAMES, VALUATION_STAGES, SERIES_STATE,
+                    run_valuation_stages, stages_to_recompute, assemble_valuation, sample_horizon, horizon_mask)
+from .results import SCALAR_OUTPUTS, SERIES_OUTPUTS, SimulationResults
+from .sampling import Marginal, GaussianCopulaSampler, canonical_correlations, correlation_structure, stream_normals
+from .cache import ResultCache
+
+########################################################
+# VARIABLES
+########################################################
+
+### Bounds of SESSIONS - a session keeps the scores, inputs and stage arrays of its last run
+DEFAULT_SESSION_ENTRIES = int(os.environ.get("DCF_SESSION_ENTRIES", "16"))
+DEFAULT_SESSION_BYTES = int(os.environ.get("DCF_SESSION_BYTES", str(1024 * 1024 * 1024)))
+
+
+########################################################
+# VALUATION SESSION
+########################################################
+
+def _same_distribution(a, b):
+    if a is b:
+        return True
+    return isinstance(a, Marginal) and isinstance(b, Marginal) and a.family == b.family and a.params == b.params
+
+
+class ValuationSession:
+    """
+    Common random numbers across the runs of a session. The copula's normal scores of the first run are kept;
+    a run that changes some marginals maps only those columns through their inverse CDF again and reruns only
+    the VALUATION_STAGES reading them - revenue paths are kept when a tax input changes.
+    A run with the same seed, sample size, sampling, antithetic pairs and correlations values exactly the sample
+    a fresh run would, and anything else starts the session over. Use one session from one thread at a time (lock).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.seed = None
+        self.signature = None
+        self.distributions = None
+        self.scores = None
+        self.inputs = None
+        self.columns = None
+        self.horizon = None
+        self.max_horizon = None
+        self.state = None
+        self._masked = {}
+
+    @property
+    def nbytes(self):
+        arrays = [self.scores, self.inputs, self.horizon] + list((self.columns or {}).values()) + list((self.state or {}).values())
+        arrays += [masked for _, masked in self._masked.values()]
+        return sum(array.nbytes for array in arrays if isinstance(array, np.ndarray))
+
+    def _map_columns(self, sampler, indices):
+        """Inverse CDF of the marginals at the kept scores for the columns at indices, year columns rounded"""
+        for i in indices:
+            name = VARIABLE_NAMES[i]
+            values = sampler.marginals[i].from_normal(self.scores[:, i])
+            if name in INTEGER_VARIABLE_NAMES:
+                values = np.round(values)
+            self.inputs[:, i] = values
+            self.columns[name] = values
+
+    def revalue(self, variables_distributsion, list_of_correlation_between_variables, sample_size,
+                seed, sampling='random', antithetic=False):
+        """
+        Value the inputs, reusing the last run's scores and stages where the signature allows.
+        Returns SimulationResults with results.metadata['incremental']: full_run, changed_inputs and recomputed_stages.
+        """
+        structure = correlation_structure(VARIABLE_NAMES, list_of_correlation_between_variables)
+        sampler = GaussianCopulaSampler(variables_distributsion, structure)
+        signature = (int(sample_size), sampling, bool(antithetic), seed,
+                     canonical_correlations(VARIABLE_NAMES, list_of_correlation_between_variables))
+        full_run = signature != self.signature
+        ### A run that fails part way leaves the session to start over
+        self.signature = None
+        if full_run:
+            ### Same scores as CopulaSampleStream.rows of a fresh run
+            self.scores = sampler.correlate(stream_normals(seed, 0, sample_size, sampler.dimension,
+                                                           sampling, antithetic, sample_size))
+            self.inputs = np.empty(self.scores.shape)
+            self.columns = {}
+            changed = list(range(len(VARIABLE_NAMES)))
+        else:
+            self.inputs = self.inputs.copy()
+            changed = [i for i, (old, new) in enumerate(zip(self.distributions, variables_distributsion))
+                       if not _same_distribution(old, new)]
+        self._map_columns(sampler, changed)
+        changed_inputs = [VARIABLE_NAMES[i] for i in changed]
+
+        if full_run or set(changed_inputs) & set(HORIZON_VARIABLE_NAMES):
+            self.horizon = sample_horizon(self.columns)
+            self.max_horizon = int(self.horizon.max(initial=1))
+            self.state = {}
+            self._masked = {}
+            stages = [name for name, _, _, _ in VALUATION_STAGES]
+        else:
+            stages = stages_to_recompute(changed_inputs)
+        run_valuation_stages(self.columns, self.horizon, self.max_horizon, self.state, stages)
+        self.signature = signature
+        self.seed = seed
+        self.distributions = list(variables_distributsion)
+
+        full_valuation = assemble_valuation(self.columns, self.state, self.horizon, self.max_horizon, series=())
+        scalars = {name: full_valuation[key] if section is None else full_valuation[section][key]
+                   for name, (section, key) in SCALAR_OUTPUTS.items()}
+        results = SimulationResults(self.inputs, scalars,
+                                    {name: self._masked_series(name) for name in SERIES_OUTPUTS},
+                                    self.horizon)
+        results.metadata['incremental'] = {"full_run": full_run,
+                                           "changed_inputs": [] if full_run else changed_inputs,
+                                           "recomputed_stages": stages}
+        return results
+
+    def _masked_series(self, name):
+        """NaN padded per year series, masked again only when its stage reran"""
+        values = self.state[SERIES_STATE[name]]
+        cached = self._masked.get(name)
+        if cached is None or cached[0] is not values:
+            cached = (values, np.where(horizon_mask(self.horizon, self.max_horizon), values, np.nan))
+            self._masked[name] = cached
+        return cached[1]
+
+
+########################################################
+# SESSIONS
+########################################################
+
+### Sessions by id, least recently used evicted first
+SESSIONS = ResultCache(max_entries=DEFAULT_SESSION_ENTRIES, max_bytes=DEFAULT_SESSION_BYTES)
+_sessions_lock = threading.Lock()
+
+
+def valuation_session(session_id):
+    """ValuationSession of the id, created on first use"""
+    with _sessions_lock:
+        session = SESSIONS.get(session_id)
+        if session is None:
+            session = ValuationSession()
+            SESSIONS.put(session_id, session, 0)
+        return session
+
+
+def update_session_size(session_id, session):
+    """Account for the session's arrays after a run - evicts older sessions over the byte bound"""
+    SESSIONS.put(session_id, session, session.nbytes)
@@ -0,0 +1,210 @@
+import os
+import sys
+import atexit
+import logging
+import threading
+import multiprocessing
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from .batch import VARIABLE_NAMES, batch_valuator_multi_phase
+from .results import SCALAR_OUTPUTS, SimulationResults, output_schema
+
+logger = logging.getLogger(__name__)
+
+########################################################
+# VARIABLES
+########################################################
+
+### Defaults used when monte_carlo_valuator_multi_phase is not given n_workers / chunk_size
+DEFAULT_WORKERS = int(os.environ.get("DCF_VALUATION_WORKERS", "1"))
+DEFAULT_CHUNK_SIZE = int(os.environ.get("DCF_VALUATION_CHUNK_SIZE", "50000"))
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+########################################################
+# PROCESS POOL
+########################################################
+
+def get_process_pool(n_workers):
+    """
+    Long lived pool of worker processes shared by every request.
+    The pool is rebuilt only when a larger worker count is asked for.
+    """
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers < n_workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            ### spawn: forking a process that runs the web server threads is not safe
+            _pool = ProcessPoolExecutor(max_workers=n_workers,
+                                        mp_context=multiprocessing.get_context("spawn"))
+            _pool_workers = n_workers
+            logger.info(f"[PARALLEL] Started process pool with {n_workers} workers")
+        return _pool
+
+
+def shutdown_process_pool():
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True, cancel_futures=True)
+            _pool = None
+            _pool_workers = 0
+
+
+atexit.register(shutdown_process_pool)
+
+
+########################################################
+# SHARED MEMORY LAYOUT
+########################################################
+
+def _attach(name):
+    """
+    Attach to a block created by the parent. Spawned workers share the parent's
+    resource tracker, so the parent stays the only one to unlink the block.
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    return shared_memory.SharedMemory(name=name)
+
+
+def _views(input_block, output_block, sample_size, max_horizon, n_scalars, n_series):
+    """NumPy views on the shared blocks: inputs (n, d), scalars (n_scalars, n), series (n_series, n, H)"""
+    inputs = np.ndarray((sample_size, len(VARIABLE_NAMES)), dtype=np.float64, buffer=input_block.buf)
+    scalars = np.ndarray((n_scalars, sample_size), dtype=np.float64, buffer=output_block.buf)
+    series = np.ndarray((n_series, sample_size, max_horizon), dtype=np.float64,
+                        buffer=output_block.buf, offset=scalars.nbytes)
+    return inputs, scalars, series
+
+
+def _value_chunk(inputs, scalars, series, start, stop, max_horizon, scalar_names, series_names):
+    """Value rows [start, stop) of the inputs and write the declared outputs in place"""
+    full_valuation = batch_valuator_multi_phase(inputs[start:stop], max_horizon=max_horizon, series=series_names)
+    for i, name in enumerate(scalar_names):
+        section, key = SCALAR_OUTPUTS[name]
+        scalars[i, start:stop] = full_valuation[key] if section is None else full_valuation[section][key]
+    for i, name in enumerate(series_names):
+        series[i, start:stop] = full_valuation['valuation'][name]
+
+
+def _sample_shared_chunk(input_name, sample_size, stream, start, stop):
+    """Worker side of chunked_batch_valuator for a CopulaSampleStream: draw rows [start, stop) into the shared inputs"""
+    input_block = _attach(input_name)
+    try:
+        inputs = np.ndarray((sample_size, len(VARIABLE_NAMES)), dtype=np.float64, buffer=input_block.buf)
+        inputs[start:stop] = stream.rows(start, stop)
+        del inputs
+    finally:
+        input_block.close()
+    return stop - start
+
+
+def _value_shared_chunk(input_name, output_name, sample_size, max_horizon, scalar_names, series_names, start, stop):
+    """Worker side of chunked_batch_valuator"""
+    input_block = _attach(input_name)
+    output_block = _attach(output_name)
+    try:
+        inputs, scalars, series = _views(input_block, output_block, sample_size, max_horizon,
+                                         len(scalar_names), len(series_names))
+        _value_chunk(inputs, scalars, series, start, stop, max_horizon, scalar_names, series_names)
+        del inputs, scalars, series
+    finally:
+        input_block.close()
+        output_block.close()
+    return stop - start
+
+
+########################################################
+# CHUNKED BATCH VALUATOR
+########################################################
+
+def _horizons(inputs):
+    """Longest valuation interval of a sample matrix, and the interval of each row"""
+    lengths = np.trunc(inputs[:, [VARIABLE_NAMES.index(f'length_of_cycle{i}') for i in (1, 2, 3)]])
+    valuation_interval_in_years = lengths.sum(axis=1).astype(np.int64)
+    return int(valuation_interval_in_years.max(initial=1)), valuation_interval_in_years
+
+
+def chunked_batch_valuator(inputs,
+                           n_workers=None,
+                           chunk_size=None,
+                           outputs=None):
+    """
+    Value a sample matrix (columns in VARIABLE_NAMES order) in chunks and return SimulationResults.
+
+    inputs: (n, d) sample matrix, or a CopulaSampleStream whose chunks are drawn where they are valued
+    n_workers: number of worker processes - 1 values the chunks in this process
+    chunk_size: rows per chunk - defaults to DEFAULT_CHUNK_SIZE, or an even split across the workers
+    outputs: names of the scalar and per year outputs to compute and keep (see output_schema), None for all -
+    an equity only run skips the return stage and the per year arrays
+
+    Inputs and outputs go through shared memory, only the chunk bounds (and the stream) are pickled.
+    Every row is drawn from its own position in the stream and valued independently on the same
+    max_horizon layout, so the results do not depend on n_workers or chunk_size.
+    """
+    stream = inputs if hasattr(inputs, 'rows') else None
+    scalar_names, series_names = output_schema(outputs)
+    sample_size = len(inputs)
+    n_workers = DEFAULT_WORKERS if n_workers is None else int(n_workers)
+    if chunk_size is None:
+        chunk_size = DEFAULT_CHUNK_SIZE if n_workers <= 1 else -(-sample_size // n_workers)
+    chunk_size = max(int(chunk_size), 1)
+    bounds = [(start, min(start + chunk_size, sample_size)) for start in range(0, sample_size, chunk_size)]
+    parallel = n_workers > 1 and len(bounds) > 1
+
+    if not parallel:
+        if stream is not None:
+            inputs = np.empty((sample_size, len(VARIABLE_NAMES)))
+            for start, stop in bounds:
+                inputs[start:stop] = stream.rows(start, stop)
+        inputs = np.ascontiguousarray(inputs, dtype=np.float64)
+        max_horizon, valuation_interval_in_years = _horizons(inputs)
+        scalars = np.empty((len(scalar_names), sample_size))
+        series = np.empty((len(series_names), sample_size, max_horizon))
+        for start, stop in bounds:
+            _value_chunk(inputs, scalars, series, start, stop, max_horizon, scalar_names, series_names)
+    else:
+        pool = get_process_pool(n_workers)
+        input_block = shared_memory.SharedMemory(create=True, size=max(sample_size * len(VARIABLE_NAMES) * 8, 1))
+        output_block = None
+        try:
+            shared_inputs = np.ndarray((sample_size, len(VARIABLE_NAMES)), dtype=np.float64, buffer=input_block.buf)
+            if stream is None:
+                shared_inputs[:] = inputs
+            else:
+                futures = [pool.submit(_sample_shared_chunk, input_block.name, sample_size, stream, start, stop)
+                           for start, stop in bounds]
+                for future in futures:
+                    future.result()
+            inputs = shared_inputs.copy()
+            del shared_inputs
+            max_horizon, valuation_interval_in_years = _horizons(inputs)
+            output_block = shared_memory.SharedMemory(create=True,
+                                                      size=max(sample_size * (len(scalar_names) + len(series_names) * max_horizon) * 8, 1))
+            _, shared_scalars, shared_series = _views(input_block, output_block, sample_size, max_horizon,
+                                                      len(scalar_names), len(series_names))
+            futures = [pool.submit(_value_shared_chunk, input_block.name, output_block.name,
+                                   sample_size, max_horizon, scalar_names, series_names, start, stop)
+                       for start, stop in bounds]
+            for future in futures:
+                future.result()
+            ### Copy out before the blocks are released
+            scalars = shared_scalars.copy()
+            series = shared_series.copy()
+            del shared_scalars, shared_series
+        finally:
+            input_block.close()
+            input_block.unlink()
+            if output_block is not None:
+                output_block.close()
+                output_block.unlink()
+
+    return SimulationResults(inputs,
+                             dict(zip(scalar_names, scalars)),
+                             dict(zip(series_names, series)),
+                             valuation_interval_in_years)
@@ -0,0 +1,39 @@
+import numpy as np
+from .batch import SERIES_NAMES, batch_valuator_multi_phase
+from .greeks import base_case_point
+
+########################################################
+# POINT VALUATION
+########################################################
+
+def _to_list(values):
+    """JSON friendly list of a float array - NaN is None"""
+    return [None if value != value else value for value in values.tolist()]
+
+
+def point_valuation(base_case, series=SERIES_NAMES):
+    """
+    Deterministic valuation of one base case (keyword arguments of valuator_multi_phase, see base_case_point)
+    on the batch path: no DataFrame, nothing printed.
+    Returns a dict: equity_value, firm_value, value_of_operating_assets, cash_and_non_operating_asset, debt_value,
+    valuation_interval_in_years and table - the year labels (1 to the interval, then 'Terminal') and one list
+    per series, the per year table of valuator_multi_phase as columns.
+    series: per year columns of the table, () for the values only.
+    """
+    point = base_case_point(base_case)
+    valuation = batch_valuator_multi_phase(point)
+    horizon = int(valuation['valuation_interval_in_years'][0])
+    table = {"year": list(range(1, horizon + 1)) + ["Terminal"]}
+    if series:
+        rows = np.empty((len(series), horizon + 1))
+        for i, name in enumerate(series):
+            rows[i, :horizon] = valuation['valuation'][name][0, :horizon]
+            rows[i, horizon] = valuation['terminal'][name][0]
+        table.update(zip(series, map(_to_list, rows)))
+    return {"equity_value": float(valuation['equity_value'][0]),
+            "firm_value": float(valuation['firm_value'][0]),
+            "value_of_operating_assets": float(valuation['value_of_operating_assets'][0]),
+            "cash_and_non_operating_asset": float(valuation['cash_and_non_operating_asset'][0]),
+            "debt_value": float(valuation['debt_value'][0]),
+            "valuation_interval_in_years": horizon,
+            "table": table}
@@ -0,0 +1,139 @@
+import numpy as np
+import pandas as pd
+from .batch import VARIABLE_NAMES
+
+########################################################
+# VARIABLES
+########################################################
+
+### Scalar outputs kept for each sample: name in the results -> (section, key) of batch_valuator_multi_phase
+SCALAR_OUTPUTS = {'equity_valuation': (None, 'equity_value'),
+                  'firm_valuation': (None, 'firm_value'),
+                  'terminal_revenue': ('terminal', 'revenues'),
+                  'terminal_operating_margin': ('terminal', 'margins'),
+                  'terminal_reinvestmentRate': ('terminal', 'reinvestmentRate'),
+                  'terminal_afterTaxOperatingIncome': ('terminal', 'afterTaxOperatingIncome'),
+                  'terminal_FCFF': ('terminal', 'FCFF')}
+
+### Per year outputs kept for each sample
+SERIES_OUTPUTS = ['cumWACC',
+                  'cumCostOfEquity',
+                  'cum_acceptable_annualized_return_on_equity',
+                  'cum_expected_annualized_return_on_equity',
+                  'cum_excess_annualized_return_on_equity',
+                  'cum_excess_annualized_return_on_equity_realized',
+                  'excess_annualized_return_on_equity',
+                  'ROIC',
+                  'invested_capital']
+
+
+### Outputs the summary of valuation_describer reads - an equity only run
+SUMMARY_OUTPUTS = ('equity_valuation',)
+
+
+def output_schema(outputs=None):
+    """
+    Scalar and per year outputs of a run declared by their names in SCALAR_OUTPUTS / SERIES_OUTPUTS,
+    in that order - None declares every output. Raises ValueError on an unknown name.
+    """
+    if outputs is None:
+        return list(SCALAR_OUTPUTS), list(SERIES_OUTPUTS)
+    unknown = set(outputs) - set(SCALAR_OUTPUTS) - set(SERIES_OUTPUTS)
+    if unknown:
+        raise ValueError(f"Unknown outputs: {', '.join(sorted(unknown))}")
+    return ([name for name in SCALAR_OUTPUTS if name in outputs],
+            [name for name in SERIES_OUTPUTS if name in outputs])
+
+
+########################################################
+# SIMULATION RESULTS
+########################################################
+
+class SimulationResults:
+    """
+    Columnar store of a Monte Carlo valuation.
+
+    inputs: (n, len(VARIABLE_NAMES)) float64 sample matrix
+    scalars: dict of (n,) float64 arrays, e.g. equity_valuation
+    series: dict of (n, max_horizon) float64 arrays, NaN padded past valuation_interval_in_years
+    valuation_interval_in_years: (n,) int array
+    metadata: dict describing how the sample was drawn, reported by valuation_describer
+    weights: (n,) sample weights summing to 1, or None when every sample counts the same
+    surrogate: dict of scalar outputs evaluated by a surrogate on a larger sample, see distribution
+
+    results[name] returns the scalar output, the per year output or the sampled input
+    with that name, in that order - so results['equity_value'] is the sampled equity value
+    and results['equity_valuation'] the intrinsic one.
+    """
+
+    def __init__(self, inputs, scalars, series, valuation_interval_in_years, metadata=None, weights=None):
+        self.inputs = np.asarray(inputs, dtype=np.float64)
+        self.scalars = {name: np.asarray(values, dtype=np.float64) for name, values in scalars.items()}
+        self.series = {name: np.asarray(values, dtype=np.float64) for name, values in series.items()}
+        self.valuation_interval_in_years = np.asarray(valuation_interval_in_years, dtype=np.int64)
+        self.metadata = dict(metadata or {})
+        self.weights = None if weights is None else np.asarray(weights, dtype=np.float64)
+        self.surrogate = {}
+        self._input_index = {name: i for i, name in enumerate(VARIABLE_NAMES)}
+
+    @classmethod
+    def concatenate(cls, results):
+        """
+        Stack the samples of several SimulationResults - per year outputs are NaN padded to the longest horizon.
+        Weights are dropped: they are only meaningful for the sample they were computed on.
+        """
+        results = list(results)
+        max_horizon = max(result.max_horizon for result in results)
+
+        def padded(values):
+            return np.pad(values, ((0, 0), (0, max_horizon - values.shape[1])), constant_values=np.nan)
+
+        return cls(np.concatenate([result.inputs for result in results]),
+                   {name: np.concatenate([result.scalars[name] for result in results]) for name in results[0].scalars},
+                   {name: np.concatenate([padded(result.series[name]) for result in results]) for name in results[0].series},
+                   np.concatenate([result.valuation_interval_in_years for result in results]),
+                   results[0].metadata)
+
+    def __len__(self):
+        return len(self.inputs)
+
+    def __contains__(self, name):
+        return name in self.scalars or name in self.series or name in self._input_index
+
+    def __getitem__(self, name):
+        if name in self.scalars:
+            return self.scalars[name]
+        if name in self.series:
+            return self.series[name]
+        if name in self._input_index:
+            return self.inputs[:, self._input_index[name]]
+        raise KeyError(name)
+
+    def distribution(self, name):
+        """Values describing the distribution of a scalar output: the surrogate sample when there is one"""
+        if name in self.surrogate:
+            return self.surrogate[name]
+        return self[name]
+
+    @property
+    def shape(self):
+        return (len(self), len(self.scalars) + len(self.series) + len(self._input_index))
+
+    @property
+    def max_horizon(self):
+        return max((values.shape[1] for values in self.series.values()), default=0)
+
+    @property
+    def nbytes(self):
+        return (self.inputs.nbytes + self.valuation_interval_in_years.nbytes +
+                (0 if self.weights is None else self.weights.nbytes) +
+                sum(values.nbytes for values in self.surrogate.values()) +
+                sum(values.nbytes for values in self.scalars.values()) +
+                sum(values.nbytes for values in self.series.values()))
+
+    def to_frame(self, columns=None):
+        """DataFrame of the sampled inputs and scalar outputs (per year outputs are left out)"""
+        if columns is None:
+            columns = VARIABLE_NAMES + [name for name in self.scalars if name not in self._input_index]
+        return pd.DataFrame({name: self[name] for name in columns})
+
@@ -0,0 +1,84 @@
+import numpy as np
+from .batch import VARIABLE_NAMES, INTEGER_VARIABLE_NAMES
+from .sampling import Marginal
+
+########################################################
+# VARIABLES
+########################################################
+
+### Reweighting gives way to a full run below this share of the sample as effective sample size
+DEFAULT_MIN_EFFECTIVE_SAMPLE_FRACTION = 0.1
+
+### Largest probability the new distribution may put outside the range the old one sampled
+SUPPORT_TOLERANCE = 1e-3
+
+
+########################################################
+# LIKELIHOOD RATIO
+########################################################
+
+def changed_variables(old_distributions, new_distributions):
+    """Positions in VARIABLE_NAMES of the distributions that differ"""
+    def same(a, b):
+        return a is b or (isinstance(a, Marginal) and isinstance(b, Marginal)
+                          and a.family == b.family and a.params == b.params)
+    return [i for i, (old, new) in enumerate(zip(old_distributions, new_distributions)) if not same(old, new)]
+
+
+def likelihood_ratio(inputs, structure, old_distributions, new_distributions):
+    """
+    Ratio of the new to the old joint density of each sample (n,), for the same normal copula.
+    The density of the copula sample is phi_R(z) * prod f_i(x_i) / phi(z_i) with z_i the normal score of x_i,
+    so only the changed marginals and the copula terms coupling them to other inputs (through R^-1) enter the ratio.
+    Raises ValueError when the ratio is not defined: a changed or coupled input is a rounded year input
+    (its normal score is not known from the sample), a distribution is not a Marginal,
+    or the new distribution puts more than SUPPORT_TOLERANCE outside the range the old one sampled.
+    """
+    changed = changed_variables(old_distributions, new_distributions)
+    if not changed:
+        return np.ones(len(inputs))
+    precision = np.linalg.inv(structure.matrix)
+    coupled = sorted(set(changed) | set(np.flatnonzero(np.any(np.abs(precision[changed]) > 1e-12, axis=0))))
+    for i in coupled:
+        name = VARIABLE_NAMES[i]
+        if name in INTEGER_VARIABLE_NAMES:
+            raise ValueError(f"{name} is a rounded year input: it cannot be reweighted")
+        if not isinstance(old_distributions[i], Marginal) or not isinstance(new_distributions[i], Marginal):
+            raise ValueError(f"{name} is not a supported distribution")
+    for i in changed:
+        lower, upper = old_distributions[i].support()
+        outside = new_distributions[i].cdf(lower) + 1 - new_distributions[i].cdf(upper)
+        if outside > SUPPORT_TOLERANCE:
+            raise ValueError(f"The new {VARIABLE_NAMES[i]} puts {outside:.2%} of its mass outside the sampled range")
+
+    old_scores = np.column_stack([old_distributions[i].to_normal(inputs[:, i]) for i in coupled])
+    new_scores = old_scores.copy()
+    log_ratio = np.zeros(len(inputs))
+    for i in changed:
+        k = coupled.index(i)
+        values = inputs[:, i]
+        new_scores[:, k] = new_distributions[i].to_normal(values)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            log_ratio += (new_distributions[i].logpdf(values) - old_distributions[i].logpdf(values)
+                          + (new_scores[:, k] ** 2 - old_scores[:, k] ** 2) / 2)
+    ### Copula terms: the quadratic forms differ only on the changed inputs and the inputs coupled to them
+    block = precision[np.ix_(coupled, coupled)]
+    log_ratio -= (np.einsum('ij,jk,ik->i', new_scores, block, new_scores)
+                  - np.einsum('ij,jk,ik->i', old_scores, block, old_scores)) / 2
+    log_ratio = np.where(np.isnan(log_ratio), -np.inf, log_ratio)
+    return np.exp(log_ratio - log_ratio.max(initial=-np.inf)) if np.isfinite(log_ratio).any() else np.zeros(len(inputs))
+
+
+def reweight(inputs, structure, old_distributions, new_distributions, weights=None):
+    """
+    Weights of the samples under the new distributions: the old weights (uniform when None) times the likelihood
+    ratio, normalized. Returns (weights, effective_sample_size) - Kish's 1 / sum w^2, 0 when every weight vanishes.
+    """
+    ratio = likelihood_ratio(inputs, structure, old_distributions, new_distributions)
+    if weights is not None:
+        ratio = ratio * weights
+    total = ratio.sum()
+    if not total > 0:
+        return np.zeros(len(inputs)), 0.0
+    new_weights = ratio / total
+    return new_weights, float(1 / np.sum(new_weights ** 2))
@@ -1,26 +1,140 @@
-from .utils import monte_carlo_valuator_multi_phase, valuation_describer
+from .utils import (monte_carlo_valuator_multi_phase, adaptive_monte_carlo_valuator_multi_phase,
+                    surrogate_monte_carlo_valuator_multi_phase, incremental_monte_carlo_valuator_multi_phase,
+                    valuation_describer, reweighted_valuation_describer)
+from .incremental import valuation_session, update_session_size
+from .reweight import DEFAULT_MIN_EFFECTIVE_SAMPLE_FRACTION, changed_variables, reweight
+from .sensitivity import DEFAULT_SOBOL_SAMPLE_SIZE, sensitivity_analysis
+from .results import SUMMARY_OUTPUTS, SimulationResults, output_schema
+from .batch import VARIABLE_NAMES
+from .sampling import correlation_structure
+from .budget import describer_cost, remaining_seconds
+from .cache import RESULT_CACHE, CACHE_SIMULATION_RESULTS, result_key, seed_from_key
 import logging
 import time
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
-def generate_valuation(monte_carlo_input, shares_outstanding):
+def generate_valuation(monte_carlo_input, shares_outstanding, adaptive=None, deadline=None, variance_reduction=None, surrogate=None,
+                       use_cache=True, session_id=None, include_plots=True, outputs=None):
+    """
+    adaptive: keyword arguments of adaptive_monte_carlo_valuator_multi_phase, or None for a fixed sample_size
+    deadline: time.monotonic() deadline - samples are valued in batches until only the describer's time is left
+    variance_reduction: antithetic / control_variate flags of monte_carlo_valuator_multi_phase
+    surrogate: options of surrogate_monte_carlo_valuator_multi_phase - takes precedence over the other modes
+    use_cache: answer from RESULT_CACHE when the same inputs and options were valued before.
+    The sampler is seeded from the result key unless monte_carlo_input has a seed, so identical requests give
+    identical results - the seed is echoed in the response.
+    Runs with a deadline are not cached: their sample size depends on the machine's load.
+    session_id: revalue incrementally with the common random numbers of the session's last run (fixed sample size
+    without importance sampling only - see incremental_monte_carlo_valuator_multi_phase). The session's seed is
+    kept unless monte_carlo_input has one.
+    Cached runs other than surrogate ones keep their sample under charts["run_id"] for reweight_valuation.
+    include_plots: render the plots - summaries and confidence intervals only otherwise.
+    outputs: declared outputs of the run (names of SCALAR_OUTPUTS / SERIES_OUTPUTS) - the engine computes and keeps
+    only these and the equity value of the summary, and plots missing their outputs are left out.
+    Defaults to every output, or to SUMMARY_OUTPUTS without plots. Session and surrogate runs compute their own outputs.
+    """
+    variance_reduction = dict(variance_reduction or {})
+    if not variance_reduction.get('importance_sampling'):
+        ### Only the importance sampling mode reads the shift
+        variance_reduction.pop('importance_sampling', None)
+        variance_reduction.pop('tail_shift', None)
     start_time = time.time()
+    simulation_start = time.monotonic()
     start_datetime = datetime.now().isoformat()
+    session = None
+    if (session_id is not None and surrogate is None and adaptive is None and deadline is None
+            and not variance_reduction.get('importance_sampling')):
+        session = valuation_session(session_id)
+        if 'seed' not in monte_carlo_input and session.seed is not None:
+            monte_carlo_input = {**monte_carlo_input, "seed": session.seed}
+    if outputs is None and not include_plots:
+        outputs = SUMMARY_OUTPUTS
+    if outputs is not None:
+        scalar_names, series_names = output_schema(set(outputs) | set(SUMMARY_OUTPUTS))
+        outputs = scalar_names + series_names
+    key = result_key(monte_carlo_input, shares_outstanding,
+                     adaptive=adaptive, variance_reduction=variance_reduction, surrogate=surrogate, plots=include_plots,
+                     outputs=outputs)
+    seed = monte_carlo_input.get('seed', seed_from_key(key))
+    cacheable = use_cache and deadline is None
+    
+    if cacheable:
+        cached = RESULT_CACHE.get(key)
+        if cached is not None:
+            logger.info(f"[VALUATION] Result cache hit {key[:12]}")
+            charts = dict(cached["charts"])
+            charts["cache"] = {"key": key, "hit": True}
+            charts["timing"] = {
+                "simulation_seconds": 0.0,
+                "describer_seconds": 0.0,
+                "total_seconds": time.monotonic() - simulation_start,
+                "deadline_met": True
+            }
+            return charts
     
     logger.info(f"[VALUATION] Starting scenario generation at {start_datetime}")
     
     try:
         logger.info(f"[VALUATION] Running Monte Carlo simulation...")
-        df_valuation = monte_carlo_valuator_multi_phase(**monte_carlo_input)
+        if surrogate is not None:
+            surrogate = dict(surrogate)
+            surrogate_outputs = ('equity_valuation', 'firm_valuation') if surrogate.pop('include_firm_valuation', False) else ('equity_valuation',)
+            df_valuation = surrogate_monte_carlo_valuator_multi_phase(monte_carlo_input, outputs=surrogate_outputs, seed=seed, **surrogate)
+        elif session is not None:
+            df_valuation = incremental_monte_carlo_valuator_multi_phase(monte_carlo_input, session, seed=seed, **variance_reduction)
+            update_session_size(session_id, session)
+        elif adaptive is None and deadline is None:
+            df_valuation = monte_carlo_valuator_multi_phase(**{**monte_carlo_input, "seed": seed}, outputs=outputs, **variance_reduction)
+        else:
+            ### A time budget alone runs until the deadline: no tolerance, a small minimum sample
+            adaptive = adaptive or {"tolerance": None, "min_sample_size": 1000}
+            df_valuation = adaptive_monte_carlo_valuator_multi_phase(monte_carlo_input, deadline=deadline, seed=seed, outputs=outputs,
+                                                                     include_plots=include_plots, **adaptive, **variance_reduction)
+        df_valuation.metadata['seed'] = seed
+        simulation_seconds = time.monotonic() - simulation_start
         logger.info(f"[VALUATION] Monte Carlo simulation completed. Generated {len(df_valuation)} scenarios")
         
         logger.info(f"[VALUATION] Generating charts and descriptions...")
+        describer_start = time.monotonic()
         charts = valuation_describer(
             df_valuation,
-            sharesOutstanding=shares_outstanding
+            sharesOutstanding=shares_outstanding,
+            include_plots=include_plots
         )
+        describer_seconds = time.monotonic() - describer_start
+        describer_cost(include_plots).update(len(df_valuation.distribution('equity_valuation')), describer_seconds)
+        charts["timing"] = {
+            "simulation_seconds": simulation_seconds,
+            "describer_seconds": describer_seconds,
+            "total_seconds": time.monotonic() - simulation_start,
+            "deadline_met": remaining_seconds(deadline) >= 0
+        }
+        charts["seed"] = seed
+        charts["cache"] = {"key": key, "hit": False}
+        if cacheable:
+            entry = {"charts": charts,
+                     "results": df_valuation if CACHE_SIMULATION_RESULTS else None,
+                     "run": None}
+            if surrogate is None:
+                charts["run_id"] = key
+                ### The sample and its equity values - importance weights kept, control variate weights are
+                ### fitted to the run's own distributions
+                base_weights = df_valuation.weights if 'importance_sampling' in df_valuation.metadata else None
+                entry["run"] = {"monte_carlo_input": monte_carlo_input,
+                                "shares_outstanding": shares_outstanding,
+                                "adaptive": adaptive,
+                                "variance_reduction": variance_reduction,
+                                "results": SimulationResults(df_valuation.inputs,
+                                                             {'equity_valuation': df_valuation['equity_valuation']},
+                                                             {},
+                                                             df_valuation.valuation_interval_in_years,
+                                                             weights=base_weights)}
+            if not RESULT_CACHE.put(key, entry) and entry["run"] is not None:
+                ### Too large with its sample: cache the response alone
+                charts.pop("run_id")
+                RESULT_CACHE.put(key, dict(entry, run=None))
         
         end_time = time.time()
         duration = end_time - start_time
@@ -34,4 +148,94 @@ def generate_valuation(monte_carlo_input, shares_outstanding):
         duration = end_time - start_time
         logger.error(f"[VALUATION] ERROR in valuation generation after {duration:.2f} seconds: {str(e)}")
         logger.error(f"[VALUATION] Error type: {type(e).__name__}")
-        raise
\ No newline at end of file
+        raise
+
+def reweight_valuation(run_id, changes, min_effective_sample_fraction=DEFAULT_MIN_EFFECTIVE_SAMPLE_FRACTION,
+                       fallback=True, include_histogram=True):
+    """
+    Describe a cached run (charts["run_id"] of generate_valuation) under modified input distributions without
+    valuing again: the run's equity values are weighted by the likelihood ratio of the new to the old inputs.
+    changes: {input name: Marginal} of the modified distributions
+    min_effective_sample_fraction: the weights are degenerate below this effective sample size over the sample size
+    fallback: value the modified inputs with generate_valuation when the weights are degenerate or undefined
+    (see likelihood_ratio), otherwise raise ValueError.
+    Raises KeyError when the run is not cached. The response has charts["reweighting"]: effective_sample_size,
+    sample_size, changed_inputs, fallback and the reason of a fallback.
+    """
+    start = time.monotonic()
+    entry = RESULT_CACHE.get(run_id)
+    if entry is None or entry.get("run") is None:
+        raise KeyError(run_id)
+    run = entry["run"]
+    results = run["results"]
+    monte_carlo_input = {**run["monte_carlo_input"], **changes}
+    old_distributions = [run["monte_carlo_input"][name] for name in VARIABLE_NAMES]
+    new_distributions = [monte_carlo_input[name] for name in VARIABLE_NAMES]
+    reweighting = {"run_id": run_id,
+                   "sample_size": len(results),
+                   "min_effective_sample_size": min_effective_sample_fraction * len(results),
+                   "changed_inputs": [VARIABLE_NAMES[i] for i in changed_variables(old_distributions, new_distributions)],
+                   "effective_sample_size": None,
+                   "fallback": False,
+                   "reason": None}
+    try:
+        structure = correlation_structure(VARIABLE_NAMES, monte_carlo_input['list_of_correlation_between_variables'])
+        weights, effective_sample_size = reweight(results.inputs, structure, old_distributions, new_distributions,
+                                                  results.weights)
+        reweighting["effective_sample_size"] = effective_sample_size
+        if effective_sample_size < reweighting["min_effective_sample_size"]:
+            reweighting["reason"] = (f"Effective sample size {effective_sample_size:.0f} below "
+                                     f"{reweighting['min_effective_sample_size']:.0f}")
+    except ValueError as e:
+        reweighting["reason"] = str(e)
+
+    if reweighting["reason"] is not None:
+        if not fallback:
+            raise ValueError(reweighting["reason"])
+        logger.info(f"[VALUATION] Reweighting {run_id[:12]} falls back to a full run: {reweighting['reason']}")
+        charts = dict(generate_valuation(monte_carlo_input, run["shares_outstanding"], adaptive=run["adaptive"],
+                                         variance_reduction=run["variance_reduction"]))
+        charts["reweighting"] = dict(reweighting, fallback=True)
+        return charts
+
+    charts = reweighted_valuation_describer(results, weights, run["shares_outstanding"], include_histogram)
+    charts["reweighting"] = reweighting
+    charts["timing"] = {"total_seconds": time.monotonic() - start}
+    logger.info(f"[VALUATION] Reweighted {run_id[:12]} in {charts['timing']['total_seconds']:.3f} seconds, "
+                f"effective sample size {reweighting['effective_sample_size']:.0f}")
+    return charts
+
+
+def generate_sensitivity(monte_carlo_input, shares_outstanding, sample_size=DEFAULT_SOBOL_SAMPLE_SIZE, sampling='sobol',
+                         use_cache=True):
+    """
+    Sobol indices and tornado swings of the intrinsic equity value over the inputs of monte_carlo_input
+    (see sensitivity_analysis), cached in RESULT_CACHE by the hash of the marginals and the options.
+    The correlations and the valuation's sample size do not enter the analysis, nor its key.
+    Tornado values are also given per share.
+    """
+    start = time.monotonic()
+    monte_carlo_input = {name: value for name, value in monte_carlo_input.items()
+                         if name not in ('sample_size', 'list_of_correlation_between_variables')}
+    options = {"sample_size": sample_size, "sampling": sampling}
+    key = result_key(monte_carlo_input, shares_outstanding, sensitivity=options)
+    seed = monte_carlo_input.get('seed', seed_from_key(key))
+    if use_cache:
+        cached = RESULT_CACHE.get(key)
+        if cached is not None:
+            logger.info(f"[SENSITIVITY] Result cache hit {key[:12]}")
+            return dict(cached, cache={"key": key, "hit": True}, timing={"total_seconds": time.monotonic() - start})
+
+    distributions = [monte_carlo_input[name] for name in VARIABLE_NAMES]
+    analysis = sensitivity_analysis(distributions, sample_size=sample_size, seed=seed, sampling=sampling)
+    tornado = analysis["tornado"]
+    tornado["base_per_share"] = tornado["base"] / shares_outstanding
+    for row in tornado["swings"]:
+        row["low_per_share"] = row["low"] / shares_outstanding
+        row["high_per_share"] = row["high"] / shares_outstanding
+    analysis["seed"] = seed
+    if use_cache:
+        RESULT_CACHE.put(key, analysis)
+    analysis = dict(analysis, cache={"key": key, "hit": False}, timing={"total_seconds": time.monotonic() - start})
+    logger.info(f"[SENSITIVITY] {analysis['evaluations']} valuations in {analysis['timing']['total_seconds']:.2f} seconds")
+    return analysis
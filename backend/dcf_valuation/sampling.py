@@ -0,0 +1,521 @@
+import warnings
+import threading
+import numpy as np
+from functools import lru_cache
+import openturns as ot
+import scipy.stats
+from scipy.stats import qmc
+from scipy.special import ndtr, ndtri
+
+########################################################
+# VARIABLES
+########################################################
+
+### Keep probabilities away from 0 and 1 so unbounded marginals stay finite
+_PROBABILITY_FLOOR = 1e-16
+_PROBABILITY_CEILING = np.nextafter(1.0, 0.0)
+
+### Normal scores where the skew-normal quantiles are tabulated - the copula's scores never get near the edges
+_NORMAL_SCORE_GRID = np.linspace(-8.5, 8.5, 4097)
+_NORMAL_SCORE_GRID.flags.writeable = False
+
+
+########################################################
+# SKEW NORMAL QUANTILE TABLE
+########################################################
+
+@lru_cache(maxsize=64)
+def skewnorm_quantile_table(skewness):
+    """
+    Quantiles of the standard skew-normal (loc 0, scale 1) at each normal score of _NORMAL_SCORE_GRID.
+    A skew-normal value is then loc + scale * np.interp(z, _NORMAL_SCORE_GRID, table):
+    no SciPy root finding per point. Read only.
+    """
+    lower = _NORMAL_SCORE_GRID <= 0
+    table = np.empty_like(_NORMAL_SCORE_GRID)
+    ### Upper half from the survival function keeps the precision of the right tail
+    table[lower] = scipy.stats.skewnorm.ppf(ndtr(_NORMAL_SCORE_GRID[lower]), skewness)
+    table[~lower] = scipy.stats.skewnorm.isf(ndtr(-_NORMAL_SCORE_GRID[~lower]), skewness)
+    table.flags.writeable = False
+    return table
+
+
+########################################################
+# MARGINAL
+########################################################
+
+class Marginal:
+    """
+    One of the input distributions of adjust_parameters_input_to_api, with a vectorized inverse CDF.
+    Build them with make_marginal to share cached instances.
+
+    family: 'normal' (mean, std), 'triangular' (min, mode, max),
+            'uniform' (low, high) or 'skewnorm' (skewness, loc, scale)
+    """
+
+    PARAMETERS = {'normal': ('mean', 'std'),
+                  'triangular': ('min', 'mode', 'max'),
+                  'uniform': ('low', 'high'),
+                  'skewnorm': ('skewness', 'loc', 'scale')}
+
+    def __init__(self, family, **params):
+        if family not in self.PARAMETERS:
+            raise ValueError(f"Unsupported distribution: {family}")
+        self.family = family
+        self.params = {name: float(params[name]) for name in self.PARAMETERS[family]}
+
+    def __repr__(self):
+        params = ", ".join(f"{name}={value}" for name, value in self.params.items())
+        return f"Marginal({self.family!r}, {params})"
+
+    def ppf(self, u):
+        """Inverse CDF of probabilities u"""
+        u = np.asarray(u, dtype=np.float64)
+        p = self.params
+        if self.family == 'normal':
+            return p['mean'] + p['std'] * ndtri(u)
+        if self.family == 'uniform':
+            return p['low'] + u * (p['high'] - p['low'])
+        if self.family == 'triangular':
+            a, c, b = p['min'], p['mode'], p['max']
+            split = (c - a) / (b - a)
+            return np.where(u < split,
+                            a + np.sqrt(u * (b - a) * (c - a)),
+                            b - np.sqrt((1 - u) * (b - a) * (b - c)))
+        return self.from_normal(ndtri(u))
+
+    def from_normal(self, z):
+        """Map standard normal scores of the copula to this marginal"""
+        z = np.asarray(z, dtype=np.float64)
+        p = self.params
+        if self.family == 'normal':
+            return p['mean'] + p['std'] * z
+        if self.family == 'skewnorm':
+            return p['loc'] + p['scale'] * np.interp(z, _NORMAL_SCORE_GRID, skewnorm_quantile_table(p['skewness']))
+        return self.ppf(np.clip(ndtr(z), _PROBABILITY_FLOOR, _PROBABILITY_CEILING))
+
+    def to_normal(self, x):
+        """Normal scores of values - the inverse of from_normal"""
+        x = np.asarray(x, dtype=np.float64)
+        p = self.params
+        if self.family == 'normal':
+            return (x - p['mean']) / p['std']
+        if self.family == 'skewnorm':
+            return np.interp((x - p['loc']) / p['scale'], skewnorm_quantile_table(p['skewness']), _NORMAL_SCORE_GRID)
+        return ndtri(np.clip(self.cdf(x), _PROBABILITY_FLOOR, _PROBABILITY_CEILING))
+
+    def support(self):
+        """(lower, upper) bounds of the values"""
+        p = self.params
+        if self.family == 'triangular':
+            return p['min'], p['max']
+        if self.family == 'uniform':
+            return p['low'], p['high']
+        return -np.inf, np.inf
+
+    def cdf(self, x):
+        x = np.asarray(x, dtype=np.float64)
+        p = self.params
+        if self.family == 'normal':
+            return ndtr((x - p['mean']) / p['std'])
+        if self.family == 'uniform':
+            return np.clip((x - p['low']) / (p['high'] - p['low']), 0, 1)
+        if self.family == 'triangular':
+            a, c, b = p['min'], p['mode'], p['max']
+            with np.errstate(divide='ignore', invalid='ignore'):
+                lower = (x - a) ** 2 / ((b - a) * (c - a))
+                upper = 1 - (b - x) ** 2 / ((b - a) * (b - c))
+            return np.where(x <= a, 0.0, np.where(x >= b, 1.0, np.where(x <= c, lower, upper)))
+        return scipy.stats.skewnorm.cdf(x, p['skewness'], loc=p['loc'], scale=p['scale'])
+
+    def logpdf(self, x):
+        """Log density of values (-inf outside the support)"""
+        x = np.asarray(x, dtype=np.float64)
+        p = self.params
+        if self.family == 'normal':
+            return -0.5 * ((x - p['mean']) / p['std']) ** 2 - np.log(p['std'] * np.sqrt(2 * np.pi))
+        if self.family == 'uniform':
+            inside = (x >= p['low']) & (x <= p['high'])
+            return np.where(inside, -np.log(p['high'] - p['low']), -np.inf)
+        if self.family == 'triangular':
+            a, c, b = p['min'], p['mode'], p['max']
+            with np.errstate(divide='ignore', invalid='ignore'):
+                density = np.where(x <= c, 2 * (x - a) / ((b - a) * (c - a)), 2 * (b - x) / ((b - a) * (b - c)))
+                return np.where((x >= a) & (x <= b), np.log(np.maximum(density, 0)), -np.inf)
+        return scipy.stats.skewnorm.logpdf(x, p['skewness'], loc=p['loc'], scale=p['scale'])
+
+    def to_openturns(self):
+        """Equivalent OpenTURNS distribution, for the reference sampler"""
+        p = self.params
+        if self.family == 'normal':
+            return ot.Normal(p['mean'], p['std'])
+        if self.family == 'triangular':
+            return ot.Triangular(p['min'], p['mode'], p['max'])
+        if self.family == 'uniform':
+            return ot.Uniform(p['low'], p['high'])
+        return _openturns_skewnorm(p['skewness'], p['loc'], p['scale'])
+
+
+@lru_cache(maxsize=256)
+def _openturns_skewnorm(skewness, loc, scale):
+    return ot.Distribution(ot.SciPyDistribution(scipy.stats.skewnorm(skewness, loc=loc, scale=scale)))
+
+
+@lru_cache(maxsize=1024)
+def _cached_marginal(family, params):
+    return Marginal(family, **dict(params))
+
+
+def make_marginal(family, values):
+    """
+    Marginal of the family with the parameters found in values.
+    Marginals are cached by their parameters, e.g. (skewness, loc, scale),
+    so repeated requests reuse the same objects and tables.
+    """
+    if family not in Marginal.PARAMETERS:
+        raise ValueError(f"Unsupported distribution: {family}")
+    return _cached_marginal(family, tuple((name, float(values[name])) for name in Marginal.PARAMETERS[family]))
+
+
+class OpenTURNSMarginal:
+    """Wrap any univariate OpenTURNS distribution so the native sampler can use it (slower than Marginal)"""
+
+    def __init__(self, distribution):
+        self.distribution = distribution
+
+    def ppf(self, u):
+        u = np.asarray(u, dtype=np.float64)
+        return np.asarray(self.distribution.computeQuantile(u.ravel().tolist())).reshape(u.shape)
+
+    def from_normal(self, z):
+        return self.ppf(np.clip(ndtr(z), _PROBABILITY_FLOOR, _PROBABILITY_CEILING))
+
+    def to_openturns(self):
+        return self.distribution
+
+
+def as_marginal(distribution):
+    """Marginal or OpenTURNS distribution -> object with from_normal / to_openturns"""
+    if isinstance(distribution, (Marginal, OpenTURNSMarginal)):
+        return distribution
+    return OpenTURNSMarginal(distribution)
+
+
+########################################################
+# CORRELATION MATRIX
+########################################################
+
+def correlation_matrix(variable_names, list_of_correlation_between_variables):
+    """Symmetric correlation matrix from [name_1, name_2, correlation] pairs"""
+    location = {name: i for i, name in enumerate(variable_names)}
+    R = np.eye(len(variable_names))
+    for name_1, name_2, correlation in list_of_correlation_between_variables:
+        i, j = location[name_1], location[name_2]
+        R[i, j] = R[j, i] = correlation
+    return R
+
+
+def nearest_positive_definite(R, min_eigenvalue=1e-8, iterations=100, tolerance=1e-10):
+    """
+    Nearest correlation matrix to R (Higham 2002: alternating projections with Dykstra's correction),
+    with its eigenvalues then floored at min_eigenvalue so the Cholesky factor exists.
+    """
+    Y = np.array(R, dtype=np.float64)
+    correction = np.zeros_like(Y)
+    for _ in range(iterations):
+        shifted = Y - correction
+        eigenvalues, eigenvectors = np.linalg.eigh(shifted)
+        X = (eigenvectors * np.maximum(eigenvalues, 0)) @ eigenvectors.T
+        correction = X - shifted
+        previous, Y = Y, X.copy()
+        np.fill_diagonal(Y, 1)
+        if np.linalg.norm(Y - previous) <= tolerance * np.linalg.norm(Y):
+            break
+    eigenvalues, eigenvectors = np.linalg.eigh((Y + Y.T) / 2)
+    Y = (eigenvectors * np.maximum(eigenvalues, min_eigenvalue)) @ eigenvectors.T
+    scale = 1 / np.sqrt(np.diag(Y))
+    return Y * scale[:, None] * scale[None, :]
+
+
+class CorrelationStructure:
+    """
+    Correlation matrix of the normal copula with its Cholesky factor, and the OpenTURNS NormalCopula built on first use.
+    A matrix that is not positive definite is replaced by the nearest one and flagged as repaired.
+    Shared between requests through correlation_structure - the arrays are read only.
+    """
+
+    def __init__(self, R):
+        R = np.array(R, dtype=np.float64)
+        self.repaired = False
+        try:
+            cholesky = np.linalg.cholesky(R)
+        except np.linalg.LinAlgError:
+            R = nearest_positive_definite(R)
+            cholesky = np.linalg.cholesky(R)
+            self.repaired = True
+        self.matrix = R
+        self.cholesky = cholesky
+        self.matrix.flags.writeable = False
+        self.cholesky.flags.writeable = False
+        self._copula = None
+
+    @property
+    def dimension(self):
+        return len(self.matrix)
+
+    @property
+    def copula(self):
+        """ot.NormalCopula of the matrix, for the reference sampler"""
+        if self._copula is None:
+            R = ot.CorrelationMatrix(self.dimension)
+            for i in range(self.dimension):
+                for j in range(i):
+                    if self.matrix[i, j] != 0:
+                        R[i, j] = self.matrix[i, j]
+            self._copula = ot.NormalCopula(R)
+        return self._copula
+
+
+def canonical_correlations(variable_names, list_of_correlation_between_variables):
+    """
+    Hashable canonical form of a correlation list: sorted (i, j, correlation) with i > j the positions in variable_names.
+    Pair order and list order do not matter; a pair listed twice keeps its last value, like correlation_matrix.
+    """
+    location = {name: i for i, name in enumerate(variable_names)}
+    pairs = {}
+    for name_1, name_2, correlation in list_of_correlation_between_variables:
+        if name_1 not in location or name_2 not in location:
+            raise ValueError(f"Unknown variable in correlation: {name_1}, {name_2}")
+        i, j = location[name_1], location[name_2]
+        if i == j:
+            raise ValueError(f"A variable cannot be correlated with itself: {name_1}")
+        pairs[max(i, j), min(i, j)] = float(correlation)
+    return tuple(sorted((i, j, correlation) for (i, j), correlation in pairs.items()))
+
+
+@lru_cache(maxsize=64)
+def _cached_correlation_structure(dimension, correlations):
+    R = np.eye(dimension)
+    for i, j, correlation in correlations:
+        R[i, j] = R[j, i] = correlation
+    return CorrelationStructure(R)
+
+
+### Structures kept whatever the LRU evicts, e.g. the default correlation set
+_pinned_correlation_structures = {}
+
+
+def correlation_structure(variable_names, list_of_correlation_between_variables, pin=False):
+    """
+    CorrelationStructure of [name_1, name_2, correlation] pairs, cached by canonical_correlations (LRU, 64 entries).
+    pin: keep it for the life of the process.
+    """
+    key = (len(variable_names), canonical_correlations(variable_names, list_of_correlation_between_variables))
+    if key in _pinned_correlation_structures:
+        return _pinned_correlation_structures[key]
+    structure = _cached_correlation_structure(*key)
+    if pin:
+        _pinned_correlation_structures[key] = structure
+    return structure
+
+
+########################################################
+# RANDOM STREAMS
+########################################################
+
+### Rows of pseudo-random normals drawn from each child stream of a run
+STREAM_BLOCK_SIZE = 4096
+
+
+def seed_sequence(seed=None):
+    """
+    SeedSequence of a run: from an int seed, a SeedSequence, a NumPy Generator (one draw of it) or None for fresh entropy.
+    Every random draw of the run comes from child_stream of it - no global random state is used.
+    """
+    if isinstance(seed, np.random.SeedSequence):
+        return seed
+    if isinstance(seed, np.random.Generator):
+        return np.random.SeedSequence(int(seed.integers(2 ** 63)))
+    return np.random.SeedSequence(seed)
+
+
+def child_stream(seed, *key):
+    """
+    Independent child stream of a run addressed by integer keys - the SeedSequence that spawn would give,
+    without spawn's counter, so the same key gives the same stream in any process and in any order.
+    """
+    parent = seed_sequence(seed)
+    return np.random.SeedSequence(parent.entropy, spawn_key=parent.spawn_key + tuple(key), pool_size=parent.pool_size)
+
+
+########################################################
+# SAMPLING STRATEGIES
+########################################################
+
+SAMPLING_STRATEGIES = ('random', 'sobol', 'halton', 'lhs')
+
+
+def stream_normals(seed, start, stop, dimension, sampling='random', antithetic=False, design_size=None):
+    """
+    Rows [start, stop) of the independent standard normals of a run - the same values whichever chunks,
+    processes or order the rows are drawn in.
+    sampling: 'random' pseudo-random, block b of STREAM_BLOCK_SIZE rows from child_stream(seed, 0, b);
+    'sobol' or 'halton' one scrambled low discrepancy sequence (child_stream(seed, 1)) fast forwarded to start;
+    'lhs' one Latin Hypercube of design_size rows (default stop), rebuilt by every chunk.
+    The last three are mapped to normals through the inverse normal CDF.
+    Sobol points are best balanced when the sample size is a power of 2.
+    antithetic: rows 2i and 2i + 1 are row i of the underlying normals and its mirror - see antithetic_normals.
+    """
+    seed = seed_sequence(seed)
+    if antithetic:
+        design_size = stop if design_size is None else design_size
+        base = stream_normals(seed, start // 2, -(-stop // 2), dimension, sampling, design_size=-(-design_size // 2))
+        offset = start % 2
+        return antithetic_normals(base)[offset:offset + stop - start]
+    if sampling == 'random':
+        normals = np.empty((stop - start, dimension))
+        for block in range(start // STREAM_BLOCK_SIZE, -(-stop // STREAM_BLOCK_SIZE)):
+            block_start = block * STREAM_BLOCK_SIZE
+            values = np.random.default_rng(child_stream(seed, 0, block)).standard_normal((STREAM_BLOCK_SIZE, dimension))
+            first, last = max(start, block_start), min(stop, block_start + STREAM_BLOCK_SIZE)
+            normals[first - start:last - start] = values[first - block_start:last - block_start]
+        return normals
+    rng = np.random.default_rng(child_stream(seed, 1))
+    with warnings.catch_warnings():
+        ### Sobol warns when the sample size is not a power of 2 - still a valid (less balanced) design
+        warnings.simplefilter("ignore", UserWarning)
+        if sampling in ('sobol', 'halton'):
+            engine = (qmc.Sobol if sampling == 'sobol' else qmc.Halton)(dimension, scramble=True, seed=rng)
+            if start > 0:
+                engine.fast_forward(start)
+            uniforms = engine.random(stop - start)
+        elif sampling == 'lhs':
+            uniforms = qmc.LatinHypercube(dimension, seed=rng).random(stop if design_size is None else design_size)[start:stop]
+        else:
+            raise ValueError(f"Unknown sampling strategy: {sampling}")
+    return ndtri(np.clip(uniforms, _PROBABILITY_FLOOR, _PROBABILITY_CEILING))
+
+
+def independent_normals(sample_size, dimension, rng=None, sampling='random'):
+    """(sample_size, dimension) independent standard normals of the seed rng - see stream_normals"""
+    return stream_normals(rng, 0, sample_size, dimension, sampling)
+
+
+########################################################
+# ANTITHETIC PAIRS
+########################################################
+
+def antithetic_normals(normals):
+    """
+    Interleave normal scores with their mirror images: rows 2i and 2i + 1 are z and -z.
+    Pairs stay aligned when samples of even size are concatenated.
+    """
+    paired = np.empty((2 * len(normals), normals.shape[1]))
+    paired[0::2] = normals
+    paired[1::2] = -normals
+    return paired
+
+
+########################################################
+# GAUSSIAN COPULA SAMPLER
+########################################################
+
+class GaussianCopulaSampler:
+    """
+    Sample marginals joined by a normal copula.
+    correlation: CorrelationStructure (see correlation_structure), or a matrix - repaired when not positive definite.
+    The Cholesky factor of the correlation matrix is computed once; each sample is
+    one matrix multiply for the correlated normal scores plus one vectorized inverse CDF per column.
+    """
+
+    def __init__(self, marginals, correlation):
+        self.marginals = [as_marginal(marginal) for marginal in marginals]
+        self.structure = correlation if isinstance(correlation, CorrelationStructure) else CorrelationStructure(correlation)
+        self.correlation = self.structure.matrix
+        self.cholesky = self.structure.cholesky
+        self._off_diagonal = [tuple(index) for index in np.argwhere(np.tril(self.cholesky, -1) != 0)]
+
+    @property
+    def dimension(self):
+        return len(self.marginals)
+
+    def correlate(self, independent_normals):
+        """
+        Independent standard normals (n, d) -> normal scores with the copula correlation.
+        Sums over the nonzero entries of the Cholesky factor row by row rather than through a BLAS matrix product,
+        whose blocking makes the rounding depend on the number of rows: a row gets the same scores in any chunk.
+        """
+        scores = independent_normals * np.diag(self.cholesky)
+        for i, j in self._off_diagonal:
+            scores[:, i] += independent_normals[:, j] * self.cholesky[i, j]
+        return scores
+
+    def transform(self, normal_scores):
+        """Correlated normal scores (n, d) -> (n, d) float64 sample of the marginals"""
+        sample = np.empty(normal_scores.shape)
+        for i, marginal in enumerate(self.marginals):
+            sample[:, i] = marginal.from_normal(normal_scores[:, i])
+        return sample
+
+    def sample(self, sample_size, rng=None, sampling='random', antithetic=False):
+        """
+        (sample_size, d) float64 sample of the seed rng - see stream_normals for the sampling strategies.
+        antithetic: rows 2i and 2i + 1 mirror each other in normal space - see antithetic_normals.
+        """
+        return CopulaSampleStream(self, sample_size, rng, sampling, antithetic).sample()
+
+
+class CopulaSampleStream:
+    """
+    Sample of a run that can be drawn by rows: rows(start, stop) gives the same values in any chunks and in any process.
+    The GaussianCopulaSampler applied to stream_normals of the seed, with rounded_columns rounded.
+    Picklable, so chunked_batch_valuator's workers can draw their own chunks.
+    """
+
+    def __init__(self, sampler, sample_size, seed=None, sampling='random', antithetic=False, rounded_columns=()):
+        if sampling not in SAMPLING_STRATEGIES:
+            raise ValueError(f"Unknown sampling strategy: {sampling}")
+        self.sampler = sampler
+        self.sample_size = int(sample_size)
+        self.seed = seed_sequence(seed)
+        self.sampling = sampling
+        self.antithetic = antithetic
+        self.rounded_columns = list(rounded_columns)
+
+    def __len__(self):
+        return self.sample_size
+
+    @property
+    def dimension(self):
+        return self.sampler.dimension
+
+    def rows(self, start, stop):
+        """(stop - start, d) float64 rows [start, stop) of the sample"""
+        normals = stream_normals(self.seed, start, stop, self.sampler.dimension,
+                                 self.sampling, self.antithetic, self.sample_size)
+        sample = self.sampler.transform(self.sampler.correlate(normals))
+        if self.rounded_columns:
+            sample[:, self.rounded_columns] = np.round(sample[:, self.rounded_columns])
+        return sample
+
+    def sample(self):
+        return self.rows(0, self.sample_size)
+
+
+### OpenTURNS draws from one global RandomGenerator - seeding and sampling must not interleave between threads
+_openturns_lock = threading.Lock()
+
+
+def openturns_sample(marginals, correlation, sample_size, seed=None):
+    """
+    Reference sampler: OpenTURNS ComposedDistribution with a NormalCopula.
+    OpenTURNS' global RandomGenerator is seeded from child_stream(seed, 2) under a lock, so runs are reproducible
+    and concurrent requests do not share draws; without a seed it continues the global stream.
+    """
+    structure = correlation if isinstance(correlation, CorrelationStructure) else CorrelationStructure(correlation)
+    distribution = ot.ComposedDistribution([as_marginal(marginal).to_openturns() for marginal in marginals],
+                                           structure.copula)
+    with _openturns_lock:
+        if seed is not None:
+            ot.RandomGenerator.SetSeed(int(child_stream(seed, 2).generate_state(1)[0]))
+        return np.array(distribution.getSample(sample_size))
@@ -0,0 +1,171 @@
+import numpy as np
+import scipy.stats
+from .batch import VARIABLE_NAMES, INTEGER_VARIABLE_NAMES
+from .parallel import chunked_batch_valuator
+from .sampling import stream_normals, child_stream
+
+########################################################
+# VARIABLES
+########################################################
+
+### Rows of each of the Saltelli matrices A and B - the design values (d + 2) times as many samples
+DEFAULT_SOBOL_SAMPLE_SIZE = 1024
+
+### Bootstrap resamples of the Sobol index confidence intervals
+SOBOL_BOOTSTRAP_RESAMPLES = 200
+
+### Percentiles of each marginal the tornado swings between, the other inputs at their medians
+TORNADO_PERCENTILES = (10, 90)
+
+_ROUNDED_COLUMNS = [VARIABLE_NAMES.index(name) for name in INTEGER_VARIABLE_NAMES]
+
+
+########################################################
+# SALTELLI DESIGN
+########################################################
+
+def _marginal_inputs(distributions, normals):
+    """Sample matrix of independent normal scores through each marginal, year columns rounded"""
+    inputs = np.empty(normals.shape)
+    for i, marginal in enumerate(distributions):
+        inputs[:, i] = marginal.from_normal(normals[:, i])
+    inputs[:, _ROUNDED_COLUMNS] = np.round(inputs[:, _ROUNDED_COLUMNS])
+    return inputs
+
+
+def saltelli_design(distributions, sample_size=DEFAULT_SOBOL_SAMPLE_SIZE, seed=None, sampling='sobol'):
+    """
+    (sample_size * (d + 2), d) sample matrix stacking A, B and the d matrices AB_i - A with column i taken from B.
+    A and B are the two halves of one 2d dimensional design of stream_normals, mapped through the marginals.
+    """
+    dimension = len(distributions)
+    normals = stream_normals(seed, 0, sample_size, 2 * dimension, sampling, design_size=sample_size)
+    a = _marginal_inputs(distributions, normals[:, :dimension])
+    b = _marginal_inputs(distributions, normals[:, dimension:])
+    design = np.empty(((dimension + 2) * sample_size, dimension))
+    design[:sample_size] = a
+    design[sample_size:2 * sample_size] = b
+    for i in range(dimension):
+        block = design[(i + 2) * sample_size:(i + 3) * sample_size]
+        block[:] = a
+        block[:, i] = b[:, i]
+    return design
+
+
+def sobol_estimates(f_a, f_b, f_ab):
+    """
+    First order (Saltelli 2010) and total (Jansen 1999) Sobol indices from the outputs on A and B (..., n)
+    and on the AB_i (..., d, n). Leading axes are kept, e.g. bootstrap resamples.
+    """
+    variance = np.var(np.concatenate([f_a, f_b], axis=-1), axis=-1)[..., None]
+    first_order = np.mean(f_b[..., None, :] * (f_ab - f_a[..., None, :]), axis=-1) / variance
+    total = np.mean((f_a[..., None, :] - f_ab) ** 2, axis=-1) / (2 * variance)
+    return first_order, total
+
+
+def sobol_indices(values, sample_size, dimension, confidence=0.95, rng=None, n_resamples=SOBOL_BOOTSTRAP_RESAMPLES,
+                  block_size=20):
+    """
+    First order and total Sobol indices of the outputs of a saltelli_design, with percentile bootstrap
+    confidence intervals over the rows of A. Rows whose output is not finite in A, B or any AB_i are left out.
+    Returns a dict of (d,) arrays: first_order, first_order_lower, first_order_upper, total, total_lower,
+    total_upper, and the number of rows used.
+    """
+    values = np.asarray(values, dtype=np.float64).reshape(dimension + 2, sample_size)
+    values = values[:, np.all(np.isfinite(values), axis=0)]
+    f_a, f_b, f_ab = values[0], values[1], values[2:]
+    first_order, total = sobol_estimates(f_a, f_b, f_ab)
+    rng = np.random.default_rng(rng)
+    resampled_first_order, resampled_total = [], []
+    for start in range(0, n_resamples, block_size):
+        rows = rng.integers(0, values.shape[1], (min(block_size, n_resamples - start), values.shape[1]))
+        estimates = sobol_estimates(f_a[rows], f_b[rows], np.moveaxis(f_ab[:, rows], 0, 1))
+        resampled_first_order.append(estimates[0])
+        resampled_total.append(estimates[1])
+    resampled_first_order, resampled_total = np.concatenate(resampled_first_order), np.concatenate(resampled_total)
+    alpha = 1 - confidence
+    bounds = [100 * alpha / 2, 100 * (1 - alpha / 2)]
+    first_order_lower, first_order_upper = np.percentile(resampled_first_order, bounds, axis=0)
+    total_lower, total_upper = np.percentile(resampled_total, bounds, axis=0)
+    return {"first_order": first_order,
+            "first_order_lower": first_order_lower,
+            "first_order_upper": first_order_upper,
+            "total": total,
+            "total_lower": total_lower,
+            "total_upper": total_upper,
+            "rows": values.shape[1]}
+
+
+########################################################
+# TORNADO
+########################################################
+
+def tornado_design(distributions, percentiles=TORNADO_PERCENTILES):
+    """
+    (2d + 1, d) sample matrix: every input at its median, then input i at the low and at the high
+    percentile for each i. Returns the matrix and the (d, 2) low / high input values.
+    """
+    dimension = len(distributions)
+    levels = scipy.stats.norm.ppf(np.asarray(percentiles, dtype=np.float64) / 100)
+    scores = np.zeros((2 * dimension + 1, dimension))
+    for i in range(dimension):
+        scores[1 + 2 * i:3 + 2 * i, i] = levels
+    design = _marginal_inputs(distributions, scores)
+    bounds = np.array([design[1 + 2 * i:3 + 2 * i, i] for i in range(dimension)])
+    return design, bounds
+
+
+########################################################
+# SENSITIVITY ANALYSIS
+########################################################
+
+def sensitivity_analysis(distributions,
+                         sample_size=DEFAULT_SOBOL_SAMPLE_SIZE,
+                         seed=None,
+                         sampling='sobol',
+                         output='equity_valuation',
+                         confidence=0.95,
+                         n_workers=None,
+                         chunk_size=None):
+    """
+    Sobol indices and tornado swings of a valuation output over the inputs (marginals in VARIABLE_NAMES order).
+    The Saltelli design and the tornado rows are valued in one chunked_batch_valuator call, across n_workers.
+    The inputs are taken independent: Sobol indices of correlated inputs are not a variance decomposition,
+    so the correlations of the copula are left out of both analyses.
+    seed: the design draws child_stream(seed, 0) and the bootstrap child_stream(seed, 1).
+    Returns a dict: sobol - one row per input, sorted by total index; tornado - base value and one row per
+    input, sorted by swing; sample_size and evaluations.
+    """
+    dimension = len(distributions)
+    saltelli = saltelli_design(distributions, sample_size, child_stream(seed, 0), sampling)
+    tornado, bounds = tornado_design(distributions)
+    results = chunked_batch_valuator(np.concatenate([saltelli, tornado]), n_workers=n_workers, chunk_size=chunk_size,
+                                     outputs=(output,))
+    values = results[output]
+
+    indices = sobol_indices(values[:len(saltelli)], sample_size, dimension, confidence,
+                            np.random.default_rng(child_stream(seed, 1)))
+    sobol = [{"input": name, **{key: float(indices[key][i]) for key in indices if key != "rows"}}
+             for i, name in enumerate(VARIABLE_NAMES)]
+    sobol.sort(key=lambda row: -np.nan_to_num(row["total"], nan=-np.inf))
+
+    swings = values[len(saltelli):]
+    base = float(swings[0])
+    low, high = swings[1::2], swings[2::2]
+    tornado_rows = [{"input": name,
+                     "low_input": float(bounds[i, 0]),
+                     "high_input": float(bounds[i, 1]),
+                     "low": float(low[i]),
+                     "high": float(high[i]),
+                     "swing": float(abs(high[i] - low[i]))}
+                    for i, name in enumerate(VARIABLE_NAMES)]
+    tornado_rows.sort(key=lambda row: -np.nan_to_num(row["swing"], nan=-np.inf))
+
+    return {"output": output,
+            "sobol": sobol,
+            "tornado": {"percentiles": list(TORNADO_PERCENTILES), "base": base, "swings": tornado_rows},
+            "sample_size": sample_size,
+            "valid_rows": indices["rows"],
+            "evaluations": len(results),
+            "sampling": sampling,
+            "confidence": confidence}
@@ -0,0 +1,123 @@
+import numpy as np
+import openturns as ot
+
+########################################################
+# VARIABLES
+########################################################
+
+### Scalar outputs of SimulationResults the surrogate can be fitted to
+SURROGATE_OUTPUTS = ('equity_valuation', 'firm_valuation')
+
+### Rows per block when the surrogate is evaluated
+_PREDICT_CHUNK_SIZE = 1 << 16
+
+### Total degrees of the expansion predict can evaluate in quadratic form
+SURROGATE_DEGREES = (1, 2)
+
+
+########################################################
+# POLYNOMIAL CHAOS SURROGATE
+########################################################
+
+class PolynomialChaosSurrogate:
+    """
+    Functional chaos expansion of scalar valuation outputs in the sampled inputs.
+    The inputs are standardized with the design's mean and standard deviation (constant inputs are dropped),
+    the expansion uses every orthonormal Hermite product of total degree <= degree (1 or 2) and is fitted
+    by least squares with OpenTURNS' FunctionalChaosAlgorithm. Inputs rather than copula normal scores
+    are used because the year inputs are rounded: the valuation is smooth in the rounded values, not in the scores.
+    The expansion is rewritten as constant + u @ linear + u' quadratic u of the standardized inputs u,
+    so predict costs two small matrix products per block - OpenTURNS evaluates point by point.
+    """
+
+    def __init__(self, active, center, scale, multi_indices, coefficients, output_names):
+        self.active = np.asarray(active)
+        self.center = np.asarray(center, dtype=np.float64)
+        self.scale = np.asarray(scale, dtype=np.float64)
+        self.multi_indices = np.asarray(multi_indices, dtype=np.int64)
+        self.coefficients = np.asarray(coefficients, dtype=np.float64)
+        self.output_names = list(output_names)
+        self.degree = int(self.multi_indices.sum(axis=1).max(initial=0))
+        if self.degree > max(SURROGATE_DEGREES):
+            raise ValueError(f"Unsupported expansion degree: {self.degree}")
+        ### He_1(u) = u, He_2(u) = (u^2 - 1) / sqrt(2)
+        dimension, outputs = self.multi_indices.shape[1], self.coefficients.shape[1]
+        self.constant = np.zeros(outputs)
+        self.linear = np.zeros((dimension, outputs))
+        self.quadratic = np.zeros((outputs, dimension, dimension))
+        for multi_index, coefficient in zip(self.multi_indices, self.coefficients):
+            variables = np.flatnonzero(multi_index)
+            if len(variables) == 0:
+                self.constant += coefficient
+            elif len(variables) == 2:
+                i, j = variables
+                self.quadratic[:, i, j] += coefficient / 2
+                self.quadratic[:, j, i] += coefficient / 2
+            elif multi_index[variables[0]] == 1:
+                self.linear[variables[0]] += coefficient
+            else:
+                i = variables[0]
+                self.quadratic[:, i, i] += coefficient / np.sqrt(2)
+                self.constant -= coefficient / np.sqrt(2)
+
+    @property
+    def number_of_terms(self):
+        return len(self.multi_indices)
+
+    @classmethod
+    def fit(cls, inputs, outputs, degree=2):
+        """
+        inputs: (n, d) sample matrix of the exact design
+        outputs: dict name -> (n,) exact values
+        """
+        if degree not in SURROGATE_DEGREES:
+            raise ValueError(f"Unsupported expansion degree: {degree}")
+        inputs = np.asarray(inputs, dtype=np.float64)
+        center, scale = inputs.mean(axis=0), inputs.std(axis=0)
+        active = np.flatnonzero(scale > 1e-12 * np.maximum(np.abs(center), 1))
+        dimension = len(active)
+        enumerate_function = ot.LinearEnumerateFunction(dimension)
+        number_of_terms = enumerate_function.getStrataCumulatedCardinal(degree)
+        if len(inputs) <= number_of_terms:
+            raise ValueError(f"The design needs more than {number_of_terms} samples for a degree {degree} expansion")
+        standardized = (inputs[:, active] - center[active]) / scale[active]
+        basis = ot.OrthogonalProductPolynomialFactory([ot.HermiteFactory()] * dimension, enumerate_function)
+        algorithm = ot.FunctionalChaosAlgorithm(ot.Sample(standardized),
+                                                ot.Sample(np.column_stack(list(outputs.values()))),
+                                                ot.ComposedDistribution([ot.Normal()] * dimension),
+                                                ot.FixedStrategy(basis, number_of_terms),
+                                                ot.LeastSquaresStrategy(ot.PenalizedLeastSquaresAlgorithmFactory()))
+        algorithm.run()
+        result = algorithm.getResult()
+        multi_indices = [list(enumerate_function(int(index))) for index in result.getIndices()]
+        return cls(active, center[active], scale[active], multi_indices, np.array(result.getCoefficients()), outputs)
+
+    def predict(self, inputs):
+        """(n, d) sample matrix -> dict name -> (n,) surrogate values"""
+        inputs = np.asarray(inputs, dtype=np.float64)
+        predictions = np.empty((len(inputs), len(self.output_names)))
+        for start in range(0, len(inputs), _PREDICT_CHUNK_SIZE):
+            u = (inputs[start:start + _PREDICT_CHUNK_SIZE, self.active] - self.center) / self.scale
+            block = predictions[start:start + len(u)]
+            block[:] = self.constant + u @ self.linear
+            if self.degree == 2:
+                for k in range(len(self.output_names)):
+                    block[:, k] += np.einsum('ij,ij->i', u @ self.quadratic[k], u)
+        return dict(zip(self.output_names, predictions.T))
+
+    def validation_error(self, inputs, outputs):
+        """
+        Error on held out exact evaluations, per output: relative_rmse (RMSE over the standard deviation
+        of the exact values) and q2 (1 - MSE / variance, the share of the variance the surrogate explains)
+        """
+        predictions = self.predict(inputs)
+        errors = {}
+        for name in self.output_names:
+            residuals = predictions[name] - outputs[name]
+            variance = np.var(outputs[name])
+            mse = np.mean(residuals ** 2)
+            if variance > 0:
+                errors[name] = {"relative_rmse": float(np.sqrt(mse / variance)), "q2": float(1 - mse / variance)}
+            else:
+                errors[name] = {"relative_rmse": 0.0 if mse == 0 else float('inf'), "q2": 1.0 if mse == 0 else float('-inf')}
+        return errors
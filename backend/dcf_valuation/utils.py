@@ -1,8 +1,23 @@
+import time
+import logging
+import warnings
 import numpy as np
 import pandas as pd
-import openturns as ot
 from plotly.io import to_html
-import scipy.stats
+from .batch import VARIABLE_NAMES, INTEGER_VARIABLE_NAMES, convergence_weights
+from .parallel import chunked_batch_valuator
+from .results import SUMMARY_OUTPUTS, SimulationResults
+from .budget import VALUATION_COST, describer_cost, remaining_seconds
+from .confidence import REPORTED_PERCENTILES, TAIL_PERCENTILES, percentile_confidence_intervals, within_tolerance
+from .distribution import DistributionSummary
+from .variance import apply_variance_reduction
+from .surrogate import PolynomialChaosSurrogate
+from .incremental import ValuationSession
+from .importance import DEFAULT_TAIL_SHIFT, TailImportanceProposal, tail_direction
+from .sampling import (Marginal, make_marginal, GaussianCopulaSampler, CopulaSampleStream, correlation_structure,
+                       openturns_sample, seed_sequence, child_stream)
+
+logger = logging.getLogger(__name__)
 
 ########################################################
 # DATA FRAME FLATTENER
@@ -53,20 +68,8 @@ def dynamic_converger(current,
     expected: final growth rate
     period_to_begin_to_converge: Period to begin to transition to terminal growth value
     number_of_steps: number of period (years) to project growth."""
-    number_of_steps =  int(number_of_steps)
-    period_to_begin_to_converge = int(period_to_begin_to_converge)
-    def converger(current,
-                expected,
-                number_of_steps):
-        values = np.linspace(current,expected,number_of_steps+1)
-        return(values)
-
-    array_phase1 = np.array([current]*(period_to_begin_to_converge-1))
-
-    array_phase2 = converger(current,
-                       expected,
-                       number_of_steps-period_to_begin_to_converge)
-    result= pd.Series(np.concatenate((array_phase1,array_phase2)))
+    weights = convergence_weights(number_of_steps, period_to_begin_to_converge)
+    result= pd.Series(current + weights*(expected-current))
     return(result)
 
 
@@ -604,6 +607,69 @@ def point_estimate_describer(base_case_valuation):
     return(df_valuation)
 
 
+########################################################
+# MONTE CARLO SAMPLE GENERATOR
+########################################################
+
+def monte_carlo_sample_stream(variables_distributsion,
+                              list_of_correlation_between_variables,
+                              sample_size,
+                              seed=None,
+                              sampling='random',
+                              antithetic=False):
+    """
+    CopulaSampleStream of the input distributions (listed in VARIABLE_NAMES order) joined by a normal copula,
+    with the year columns rounded: its rows can be drawn in any chunks, in this process or in the workers.
+    """
+    ### Correlation between the variables - location of each variable in the matrix is its position in VARIABLE_NAMES
+    ### The normal copula needs a positive definite correlation matrix: correlation_structure replaces any other by the nearest one
+    ### and caches the matrix, its Cholesky factor and the OpenTURNS copula by the canonical form of the list
+    R = correlation_structure(VARIABLE_NAMES, list_of_correlation_between_variables)
+    if R.repaired:
+        logger.warning("[SAMPLING] Correlation matrix is not positive definite - using the nearest positive definite matrix")
+    return CopulaSampleStream(GaussianCopulaSampler(variables_distributsion, R),
+                              sample_size,
+                              seed=seed,
+                              sampling=sampling,
+                              antithetic=antithetic,
+                              rounded_columns=[VARIABLE_NAMES.index(col) for col in INTEGER_VARIABLE_NAMES])
+
+
+def monte_carlo_sample_generator(variables_distributsion,
+                                 list_of_correlation_between_variables,
+                                 sample_size,
+                                 sampler='numpy',
+                                 seed=None,
+                                 sampling='random',
+                                 antithetic=False,
+                                 normals=None):
+    """
+    Sample matrix of the input distributions (listed in VARIABLE_NAMES order) joined by a normal copula,
+    with the year columns rounded. See monte_carlo_valuator_multi_phase for the options.
+    normals: independent standard normals to transform instead of fresh draws, e.g. from TailImportanceProposal.
+    """
+    variable_names = VARIABLE_NAMES
+    list_of_columns_with_year_to_be_int = INTEGER_VARIABLE_NAMES
+
+    ### Generate samples
+    if sampler == 'openturns':
+        if sampling != 'random' or antithetic or normals is not None:
+            raise ValueError("The openturns sampler only supports sampling='random' without antithetic pairs or importance sampling")
+        R = correlation_structure(variable_names, list_of_correlation_between_variables)
+        generated_sample = openturns_sample(variables_distributsion, R, sample_size, seed=seed)
+    elif sampler == 'numpy':
+        stream = monte_carlo_sample_stream(variables_distributsion, list_of_correlation_between_variables,
+                                           sample_size, seed=seed, sampling=sampling, antithetic=antithetic)
+        if normals is None:
+            return(stream.sample())
+        generated_sample = stream.sampler.transform(stream.sampler.correlate(normals))
+    else:
+        raise ValueError(f"Unknown sampler: {sampler}")
+    year_columns = [variable_names.index(col) for col in list_of_columns_with_year_to_be_int]
+    generated_sample[:, year_columns] = np.round(generated_sample[:, year_columns])
+    return(generated_sample)
+
+
 ########################################################
 # MONTE CARLO VALUATOR MULTI PHASE
 ########################################################
@@ -647,7 +713,32 @@ def monte_carlo_valuator_multi_phase(
     current_invested_capital,
     sample_size=1000,
     list_of_correlation_between_variables=[['additional_return_on_cost_of_capital_in_perpetuity','terminal_sales_to_capital_ratio',0.4],
-                                           ['additional_return_on_cost_of_capital_in_perpetuity','terminal_operating_margin',.6]]):
+                                           ['additional_return_on_cost_of_capital_in_perpetuity','terminal_operating_margin',.6]],
+    n_workers=None,
+    chunk_size=None,
+    sampler='numpy',
+    seed=None,
+    sampling='random',
+    antithetic=False,
+    control_variate=False,
+    importance_sampling=False,
+    tail_shift=DEFAULT_TAIL_SHIFT,
+    outputs=None):
+    """
+    Sample the input distributions with their correlations and value every sample.
+    Distributions are Marginal (see adjust_parameters_input_to_api) or OpenTURNS distributions.
+    n_workers, chunk_size: split the valuation across worker processes - see chunked_batch_valuator.
+    sampler: 'numpy' Gaussian copula sampler, or 'openturns' ComposedDistribution as a reference.
+    seed: int seed or SeedSequence of the run - every chunk draws from its own child stream (see stream_normals),
+    so a seed gives the same sample whatever n_workers and chunk_size. None draws fresh entropy.
+    sampling: 'random', 'sobol', 'halton' or 'lhs' draws for the numpy sampler - see stream_normals.
+    antithetic: draw the samples in mirrored pairs in the copula's normal space.
+    control_variate: weight the samples with a linear control anchored on the deterministic valuation at the input means.
+    importance_sampling: shift a third of the draws tail_shift standard deviations toward each tail of the equity value
+    and weight every sample by its likelihood ratio - see TailImportanceProposal. Not combined with the other two.
+    outputs: scalar and per year outputs to compute and keep, None for all - see chunked_batch_valuator.
+    Returns SimulationResults - see apply_variance_reduction for the estimates and effective sample sizes.
+    """
     variables_distributsion = [risk_free_rate,
                                    ERP,
                                    equity_value,
@@ -684,128 +775,297 @@ def monte_carlo_valuator_multi_phase(
                                     cash_and_non_operating_asset,
                                     asset_liquidation_during_negative_growth,
                                     current_invested_capital]
-    variable_names = ['risk_free_rate',
-                                   'ERP',
-                                   'equity_value',
-                                   'debt_value',
-                                   'unlevered_beta',
-                                    'terminal_unlevered_beta',
-                                    'year_beta_begins_to_converge_to_terminal_beta',
-                                    'current_pretax_cost_of_debt',
-                                    'terminal_pretax_cost_of_debt',
-                                    'year_cost_of_debt_begins_to_converge_to_terminal_cost_of_debt',
-                                    'current_effective_tax_rate',
-                                    'marginal_tax_rate',
-                                    'year_effective_tax_rate_begin_to_converge_marginal_tax_rate',
-                                    'revenue_base',
-                                    'revenue_growth_rate_cycle1_begin',
-                                    'revenue_growth_rate_cycle1_end',
-                                    'revenue_growth_rate_cycle2_begin',
-                                    'revenue_growth_rate_cycle2_end',
-                                    'revenue_growth_rate_cycle3_begin',
-                                    'revenue_growth_rate_cycle3_end',
-                                    'revenue_convergance_periods_cycle1',
-                                    'revenue_convergance_periods_cycle2',
-                                    'revenue_convergance_periods_cycle3',
-                                    'length_of_cycle1',
-                                    'length_of_cycle2',
-                                    'length_of_cycle3',
-                                    'current_sales_to_capital_ratio',
-                                    'terminal_sales_to_capital_ratio',
-                                    'year_sales_to_capital_begins_to_converge_to_terminal_sales_to_capital',
-                                    'current_operating_margin',
-                                    'terminal_operating_margin',
-                                    'year_operating_margin_begins_to_converge_to_terminal_operating_margin',
-                                    'additional_return_on_cost_of_capital_in_perpetuity',
-                                    'cash_and_non_operating_asset',
-                                    'asset_liquidation_during_negative_growth',
-                                    'current_invested_capital']
-    ### The following variable  should have "year" in their definition but I did not think of ut. So I am adding them to list_of_columns_with_year_to_be_int
-    list_of_columns_with_year_to_be_int = [s for s in variable_names if "year" in s] +['length_of_cycle1','length_of_cycle2','length_of_cycle3',
-                                                                                       'revenue_convergance_periods_cycle1',
-                                                                                       'revenue_convergance_periods_cycle2','revenue_convergance_periods_cycle3']
-    ### Build a DataFarame to have index - location of each variable in the correlation matrix
-    dict_of_varible = dict(zip(variable_names,
-                            range(0,len(variable_names))))
-    df_variables = pd.DataFrame([dict_of_varible])
-
-    ### Initaile Correlation Matrix
-    R = ot.CorrelationMatrix(len(variables_distributsion))
-    ### pair correlation between each variable
-    for pair_of_variable in list_of_correlation_between_variables:
-        location = df_variables[pair_of_variable[:2]].values[0]
-        #print(location)
-        R[int(location[0]),int(location[1])] = pair_of_variable[2]
-
-    ### Build the correlation into composed distribution function
-    ### For ot.NormalCopula The correlation matrix must be definite positive
-    ### Here is an implementaion on how to get the nearest psd matirx https://stackoverflow.com/questions/43238173/python-convert-matrix-to-positive-semi-definite
-    copula = ot.NormalCopula(R)
-    BuiltComposedDistribution = ot.ComposedDistribution(variables_distributsion,
-                                                        copula)
-    ### Generate samples
-    generated_sample = BuiltComposedDistribution.getSample(sample_size)
-    df_generated_sample = pd.DataFrame.from_records(generated_sample, columns= variable_names)
-    df_generated_sample[list_of_columns_with_year_to_be_int] = df_generated_sample[list_of_columns_with_year_to_be_int].apply(lambda x: round(x))
-    print("Scenario Generation Complete", df_generated_sample.shape)
-    df_generated_sample['full_valuation']= df_generated_sample.apply(lambda row:
-                                                                    valuator_multi_phase(
-                                                                        risk_free_rate = row['risk_free_rate'],
-                                                                        ERP = row['ERP'],
-                                                                        equity_value = row['equity_value'],
-                                                                        debt_value = row['debt_value'],
-                                                                        unlevered_beta = row['unlevered_beta'],
-                                                                        terminal_unlevered_beta = row['terminal_unlevered_beta'],
-                                                                        year_beta_begins_to_converge_to_terminal_beta = row['year_beta_begins_to_converge_to_terminal_beta'],
-                                                                        current_pretax_cost_of_debt = row['current_pretax_cost_of_debt'],
-                                                                        terminal_pretax_cost_of_debt = row['terminal_pretax_cost_of_debt'],
-                                                                        year_cost_of_debt_begins_to_converge_to_terminal_cost_of_debt = row['year_cost_of_debt_begins_to_converge_to_terminal_cost_of_debt'],
-                                                                        current_effective_tax_rate = row['current_effective_tax_rate'],
-                                                                        marginal_tax_rate = row['marginal_tax_rate'],
-                                                                        year_effective_tax_rate_begin_to_converge_marginal_tax_rate = row['year_effective_tax_rate_begin_to_converge_marginal_tax_rate'],
-                                                                        revenue_base = row['revenue_base'],
-                                                                        revenue_growth_rate_cycle1_begin = row['revenue_growth_rate_cycle1_begin'],
-                                                                        revenue_growth_rate_cycle1_end = row['revenue_growth_rate_cycle1_end'],
-                                                                        revenue_growth_rate_cycle2_begin = row['revenue_growth_rate_cycle2_begin'],
-                                                                        revenue_growth_rate_cycle2_end = row['revenue_growth_rate_cycle2_end'],
-                                                                        revenue_growth_rate_cycle3_begin = row['revenue_growth_rate_cycle3_begin'],
-                                                                        revenue_growth_rate_cycle3_end = row['revenue_growth_rate_cycle3_end'],
-                                                                        revenue_convergance_periods_cycle1 = row['revenue_convergance_periods_cycle1'],
-                                                                        revenue_convergance_periods_cycle2 = row['revenue_convergance_periods_cycle2'],
-                                                                        revenue_convergance_periods_cycle3 = row['revenue_convergance_periods_cycle3'],
-                                                                        length_of_cycle1 = row['length_of_cycle1'],
-                                                                        length_of_cycle2 = row['length_of_cycle2'],
-                                                                        length_of_cycle3 = row['length_of_cycle3'],
-                                                                        current_sales_to_capital_ratio = row['current_sales_to_capital_ratio'],
-                                                                        terminal_sales_to_capital_ratio = row['terminal_sales_to_capital_ratio'],
-                                                                        year_sales_to_capital_begins_to_converge_to_terminal_sales_to_capital = row['year_sales_to_capital_begins_to_converge_to_terminal_sales_to_capital'],
-                                                                        current_operating_margin = row['current_operating_margin'],
-                                                                        terminal_operating_margin = row['terminal_operating_margin'],
-                                                                        year_operating_margin_begins_to_converge_to_terminal_operating_margin = row['year_operating_margin_begins_to_converge_to_terminal_operating_margin'],
-                                                                        additional_return_on_cost_of_capital_in_perpetuity = row['additional_return_on_cost_of_capital_in_perpetuity'],
-                                                                        cash_and_non_operating_asset = row['cash_and_non_operating_asset'],
-                                                                        asset_liquidation_during_negative_growth=row['asset_liquidation_during_negative_growth'],
-                                                                        current_invested_capital=row['current_invested_capital']),
-                                                                        axis=1)
-    ### extract the valuation result
-    df_generated_sample['valuation'] = df_generated_sample['full_valuation'].apply(lambda x: x['valuation'])
-    df_generated_sample['equity_valuation'] = df_generated_sample['full_valuation'].apply(lambda x: x['equity_value'])
-    df_generated_sample['firm_valuation'] = df_generated_sample['full_valuation'].apply(lambda x: x['firm_value'])
-    df_generated_sample['terminal_revenue'] = df_generated_sample['valuation'].apply(lambda x: x['revenues'].values[-1])
-    df_generated_sample['terminal_operating_margin'] = df_generated_sample['valuation'].apply(lambda x: x['margins'].values[-1])
-    df_generated_sample['terminal_reinvestmentRate'] = df_generated_sample['valuation'].apply(lambda x: x['reinvestmentRate'].values[-1])
-    df_generated_sample['terminal_afterTaxOperatingIncome'] = df_generated_sample['valuation'].apply(lambda x: x['afterTaxOperatingIncome'].values[-1])
-    df_generated_sample['terminal_FCFF'] = df_generated_sample['valuation'].apply(lambda x: x['FCFF'].values[-1])
-    df_generated_sample['cumWACC'] = df_generated_sample['valuation'].apply(lambda x: x['cumWACC'][:-1].values)
-    df_generated_sample['cumCostOfEquity'] = df_generated_sample['valuation'].apply(lambda x: x['cumCostOfEquity'][:-1].values)
-    df_generated_sample['cum_acceptable_annualized_return_on_equity'] = df_generated_sample['valuation'].apply(lambda x: x['cum_acceptable_annualized_return_on_equity'][:-1].values)
-    df_generated_sample['cum_expected_annualized_return_on_equity'] = df_generated_sample['valuation'].apply(lambda x: x['cum_expected_annualized_return_on_equity'][:-1].values)
-    df_generated_sample['cum_excess_annualized_return_on_equity'] = df_generated_sample['valuation'].apply(lambda x: x['cum_excess_annualized_return_on_equity'][:-1].values)
-    df_generated_sample['cum_excess_annualized_return_on_equity_realized'] = df_generated_sample['valuation'].apply(lambda x: x['cum_excess_annualized_return_on_equity_realized'][:-1].values)
-    df_generated_sample['excess_annualized_return_on_equity'] = df_generated_sample['valuation'].apply(lambda x: x['excess_annualized_return_on_equity'][:-1].values)
-    df_generated_sample['ROIC'] = df_generated_sample['valuation'].apply(lambda x: x['ROIC'][:-1].values)
-    df_generated_sample['invested_capital'] = df_generated_sample['valuation'].apply(lambda x: x['invested_capital'][:-1].values)
-    return(df_generated_sample)
+    normals = None
+    if importance_sampling:
+        if antithetic or control_variate:
+            raise ValueError("importance_sampling cannot be combined with antithetic or control_variate")
+        R = correlation_structure(VARIABLE_NAMES, list_of_correlation_between_variables)
+        proposal = TailImportanceProposal(tail_direction(variables_distributsion, R), shift=tail_shift)
+        normals, likelihood_ratio = proposal.sample(sample_size, rng=seed, sampling=sampling)
+    if sampler == 'numpy' and normals is None:
+        ### The chunks are drawn where they are valued, each from its own position in the seed's streams
+        generated_sample = monte_carlo_sample_stream(variables_distributsion,
+                                                     list_of_correlation_between_variables,
+                                                     sample_size,
+                                                     seed=seed,
+                                                     sampling=sampling,
+                                                     antithetic=antithetic)
+    else:
+        generated_sample = monte_carlo_sample_generator(variables_distributsion,
+                                                        list_of_correlation_between_variables,
+                                                        sample_size,
+                                                        sampler=sampler,
+                                                        seed=seed,
+                                                        sampling=sampling,
+                                                        antithetic=antithetic,
+                                                        normals=normals)
+    logger.debug(f"[SAMPLING] {len(generated_sample)} samples")
+    ### Value the samples in vectorized chunks - per year series are NaN padded past each sample's valuation interval
+    df_valuation = chunked_batch_valuator(generated_sample,
+                                          n_workers=n_workers,
+                                          chunk_size=chunk_size,
+                                          outputs=outputs)
+    if importance_sampling:
+        df_valuation.weights = likelihood_ratio / likelihood_ratio.sum()
+        df_valuation.metadata['importance_sampling'] = {"tail_shift": tail_shift,
+                                                        "defensive_share": proposal.defensive_share,
+                                                        "effective_sample_size": float(1 / np.sum(df_valuation.weights ** 2))}
+    if antithetic or control_variate:
+        apply_variance_reduction(df_valuation, variables_distributsion, antithetic, control_variate)
+    return(df_valuation)
+
+
+########################################################
+# ADAPTIVE MONTE CARLO VALUATOR MULTI PHASE
+########################################################
+
+### Smallest batch worth valuing when the deadline is close
+MIN_BATCH_SIZE = 100
+
+
+def adaptive_monte_carlo_valuator_multi_phase(monte_carlo_input,
+                                               tolerance=0.01,
+                                               tolerance_type='relative',
+                                               method='order_statistic',
+                                               confidence=0.95,
+                                               percentiles=REPORTED_PERCENTILES,
+                                               batch_size=2000,
+                                               min_sample_size=2000,
+                                               max_sample_size=50000,
+                                               deadline=None,
+                                               n_workers=None,
+                                               chunk_size=None,
+                                               sampler='numpy',
+                                               seed=None,
+                                               sampling='random',
+                                               antithetic=False,
+                                               control_variate=False,
+                                               outputs=None,
+                                               include_plots=True):
+    """
+    Value batches of samples until the standard errors of the equity value percentiles are under the tolerance,
+    or until the time left before the deadline is only enough for valuation_describer.
+    monte_carlo_input: output of adjust_parameters_input_to_api - its sample_size is replaced by the stopping rule.
+    tolerance, tolerance_type: 'relative' to each percentile, or 'absolute' in equity value units - None to only stop on the caps or the deadline.
+    method: 'order_statistic' or 'bootstrap' confidence intervals at the confidence level - see percentile_confidence_intervals.
+    min_sample_size, max_sample_size: hard caps - the rule is first checked at min_sample_size,
+    and the run stops at max_sample_size whether or not it converged. min_sample_size is valued even past the deadline.
+    deadline: time.monotonic() deadline of the whole request - see deadline_from_budget.
+    antithetic, control_variate: variance reduction - see monte_carlo_valuator_multi_phase. The stopping rule
+    uses the plain confidence intervals, which are conservative under either.
+    outputs: scalar and per year outputs to compute and keep, None for all - see chunked_batch_valuator.
+    include_plots: whether valuation_describer renders the plots of the run - the headroom kept for it.
+    Batches are sized with VALUATION_COST, and describer_cost(include_plots) keeps the headroom for the describer.
+    Returns SimulationResults of every batch, with the sample size, the confidence intervals
+    and the reason the run stopped in results.metadata['sampling'].
+    """
+    if min_sample_size > max_sample_size:
+        raise ValueError("min_sample_size must not exceed max_sample_size")
+    variables_distributsion = [monte_carlo_input[name] for name in VARIABLE_NAMES]
+    ### Batch k draws from child stream (0, k) of the seed and the bootstrap from (1,), so the batches are independent
+    stream = seed_sequence(seed)
+    rng = np.random.default_rng(child_stream(stream, 1))
+    batches = []
+    sample_size = 0
+    confidence_intervals = None
+    stopped_by = 'max_sample_size'
+    while sample_size < max_sample_size:
+        ### The first batch goes straight to the minimum sample size
+        size = min(max(batch_size, min_sample_size - sample_size), max_sample_size - sample_size)
+        smallest_batch = min(batch_size, MIN_BATCH_SIZE, size)
+        if deadline is not None and sample_size >= min_sample_size:
+            ### Only value what fits before the deadline once the describer of the larger sample is paid for
+            available = remaining_seconds(deadline) - describer_cost(include_plots).predict(sample_size + size)
+            size = min(size, VALUATION_COST.affordable(available))
+        if antithetic and size > 1:
+            ### Even batches keep the antithetic pairs aligned across batches
+            size -= size % 2
+        if sample_size >= min_sample_size and size < smallest_batch:
+            stopped_by = 'time_budget'
+            break
+        batch_start = time.monotonic()
+        batch_seed = child_stream(stream, 0, len(batches))
+        if sampler == 'numpy':
+            generated_sample = monte_carlo_sample_stream(variables_distributsion,
+                                                         monte_carlo_input['list_of_correlation_between_variables'],
+                                                         size,
+                                                         seed=batch_seed,
+                                                         sampling=sampling,
+                                                         antithetic=antithetic)
+        else:
+            generated_sample = monte_carlo_sample_generator(variables_distributsion,
+                                                            monte_carlo_input['list_of_correlation_between_variables'],
+                                                            size,
+                                                            sampler=sampler,
+                                                            seed=batch_seed,
+                                                            sampling=sampling,
+                                                            antithetic=antithetic)
+        batches.append(chunked_batch_valuator(generated_sample,
+                                              n_workers=n_workers,
+                                              chunk_size=chunk_size,
+                                              outputs=outputs))
+        if outputs is None:
+            ### The cost model is kept for full runs
+            VALUATION_COST.update(size, time.monotonic() - batch_start)
+        sample_size += size
+        if sample_size < min_sample_size or tolerance is None:
+            continue
+        equity_valuation = np.concatenate([batch['equity_valuation'] for batch in batches])
+        confidence_intervals = percentile_confidence_intervals(equity_valuation, percentiles, confidence, method, rng)
+        logger.debug(f"[ADAPTIVE] {sample_size} samples, standard errors "
+                     f"{[round(interval['standard_error'], 4) for interval in confidence_intervals]}")
+        if within_tolerance(confidence_intervals, tolerance, tolerance_type):
+            stopped_by = 'tolerance'
+            break
+
+    df_valuation = SimulationResults.concatenate(batches)
+    df_valuation.metadata['sampling'] = {"sample_size": sample_size,
+                                         "converged": stopped_by == 'tolerance',
+                                         "stopped_by": stopped_by,
+                                         "batches": len(batches),
+                                         "method": method,
+                                         "confidence": confidence,
+                                         "tolerance": tolerance,
+                                         "tolerance_type": tolerance_type}
+    if confidence_intervals is not None:
+        df_valuation.metadata['sampling']["confidence_intervals"] = confidence_intervals
+    if antithetic or control_variate:
+        apply_variance_reduction(df_valuation, variables_distributsion, antithetic, control_variate)
+    return(df_valuation)
+
+
+########################################################
+# INCREMENTAL MONTE CARLO VALUATOR MULTI PHASE
+########################################################
+
+def incremental_monte_carlo_valuator_multi_phase(monte_carlo_input,
+                                                 session,
+                                                 seed=None,
+                                                 sampling='random',
+                                                 antithetic=False,
+                                                 control_variate=False):
+    """
+    Value monte_carlo_input with the common random numbers of a ValuationSession: only the marginals that
+    changed since the session's last run are sampled again, and only the valuation stages reading them rerun.
+    The results are those of monte_carlo_valuator_multi_phase with the same seed - a what-if differs from
+    the previous run only through the changed inputs, without fresh sampling noise.
+    seed: the session's seed - a different one starts the session over.
+    Returns SimulationResults with the reuse in results.metadata['incremental'].
+    """
+    variables_distributsion = [monte_carlo_input[name] for name in VARIABLE_NAMES]
+    with session.lock:
+        df_valuation = session.revalue(variables_distributsion,
+                                       monte_carlo_input['list_of_correlation_between_variables'],
+                                       monte_carlo_input['sample_size'],
+                                       seed,
+                                       sampling=monte_carlo_input.get('sampling', sampling),
+                                       antithetic=antithetic)
+    logger.info(f"[INCREMENTAL] {df_valuation.metadata['incremental']}")
+    if antithetic or control_variate:
+        apply_variance_reduction(df_valuation, variables_distributsion, antithetic, control_variate)
+    return(df_valuation)
+
+
+########################################################
+# SURROGATE MONTE CARLO VALUATOR MULTI PHASE
+########################################################
+
+### Rows sampled and evaluated at once by the surrogate
+SURROGATE_CHUNK_SIZE = 1 << 17
+
+
+def surrogate_monte_carlo_valuator_multi_phase(monte_carlo_input,
+                                               sample_size=1000000,
+                                               design_size=2000,
+                                               validation_size=500,
+                                               degree=2,
+                                               max_validation_error=0.05,
+                                               outputs=('equity_valuation',),
+                                               n_workers=None,
+                                               chunk_size=None,
+                                               sampler='numpy',
+                                               seed=None,
+                                               sampling='random'):
+    """
+    Fit a polynomial chaos surrogate of the outputs on design_size exact valuations and evaluate it on sample_size samples.
+    monte_carlo_input: output of adjust_parameters_input_to_api.
+    outputs: scalar outputs to fit - 'equity_valuation' and optionally 'firm_valuation'.
+    validation_size: extra exact valuations held out to measure the surrogate's error - see PolynomialChaosSurrogate.validation_error.
+    max_validation_error: largest relative RMSE accepted - above it the exact engine values
+    monte_carlo_input['sample_size'] samples instead, the design included.
+    Returns SimulationResults of the exact valuations, with the surrogate sample in results.surrogate
+    and the validation in results.metadata['surrogate'].
+    """
+    variables_distributsion = [monte_carlo_input[name] for name in VARIABLE_NAMES]
+    list_of_correlation_between_variables = monte_carlo_input['list_of_correlation_between_variables']
+    ### The design, the fallback and the surrogate sample draw from child streams (0,), (1,) and (2,) of the seed
+    stream = seed_sequence(seed)
+    generated_sample = monte_carlo_sample_generator(variables_distributsion,
+                                                    list_of_correlation_between_variables,
+                                                    design_size + validation_size,
+                                                    sampler=sampler,
+                                                    seed=child_stream(stream, 0),
+                                                    sampling=sampling)
+    df_valuation = chunked_batch_valuator(generated_sample,
+                                          n_workers=n_workers,
+                                          chunk_size=chunk_size)
+    surrogate = PolynomialChaosSurrogate.fit(df_valuation.inputs[:design_size],
+                                             {name: df_valuation[name][:design_size] for name in outputs},
+                                             degree=degree)
+    validation = surrogate.validation_error(df_valuation.inputs[design_size:],
+                                            {name: df_valuation[name][design_size:] for name in outputs})
+    validation_error = max(error['relative_rmse'] for error in validation.values())
+    summary = {"used": validation_error <= max_validation_error,
+               "design_size": design_size,
+               "validation_size": validation_size,
+               "degree": degree,
+               "number_of_terms": surrogate.number_of_terms,
+               "max_validation_error": max_validation_error,
+               "validation": validation}
+    logger.info(f"[SURROGATE] Validation {validation}")
+
+    if not summary["used"]:
+        ### Fall back to the exact engine - the design is a valid part of its sample
+        remaining = monte_carlo_input['sample_size'] - len(df_valuation)
+        if remaining > 0:
+            generated_sample = monte_carlo_sample_generator(variables_distributsion,
+                                                            list_of_correlation_between_variables,
+                                                            remaining,
+                                                            sampler=sampler,
+                                                            seed=child_stream(stream, 1),
+                                                            sampling=sampling)
+            df_valuation = SimulationResults.concatenate([df_valuation,
+                                                          chunked_batch_valuator(generated_sample,
+                                                                                 n_workers=n_workers,
+                                                                                 chunk_size=chunk_size)])
+        df_valuation.metadata['surrogate'] = summary
+        return(df_valuation)
+
+    ### Sample and evaluate in chunks - only the surrogate outputs are kept
+    predictions = {name: [] for name in outputs}
+    sample_stream = None
+    if sampler == 'numpy':
+        sample_stream = monte_carlo_sample_stream(variables_distributsion,
+                                                  list_of_correlation_between_variables,
+                                                  sample_size,
+                                                  seed=child_stream(stream, 2),
+                                                  sampling=sampling)
+    for chunk, start in enumerate(range(0, sample_size, SURROGATE_CHUNK_SIZE)):
+        stop = min(start + SURROGATE_CHUNK_SIZE, sample_size)
+        if sample_stream is not None:
+            generated_sample = sample_stream.rows(start, stop)
+        else:
+            generated_sample = monte_carlo_sample_generator(variables_distributsion,
+                                                            list_of_correlation_between_variables,
+                                                            stop - start,
+                                                            sampler=sampler,
+                                                            seed=child_stream(stream, 2, chunk),
+                                                            sampling=sampling)
+        for name, values in surrogate.predict(generated_sample).items():
+            predictions[name].append(values)
+    df_valuation.surrogate = {name: np.concatenate(values) for name, values in predictions.items()}
+    df_valuation.metadata['surrogate'] = summary
+    return(df_valuation)
 
 
 ########################################################
@@ -813,41 +1073,41 @@ def monte_carlo_valuator_multi_phase(
 ########################################################
 
 def histogram_plotter_plotly(
-        data,
-        column_name,
+        distribution,
         xlabel,
         title='Data',
         bins=30,
         percentile=[15, 50, 85],
         color=['#A2AF9B', '#DCCFC0', '#242424'],
         histnorm='percent',
-        marginal=None,
         height=700,
         width=800
     ):
+    """Plot the histogram of a DistributionSummary via Plotly - its bins are drawn as bars"""
     import plotly.graph_objects as go
-    import plotly.express as px
     import numpy as np
 
-    fig = px.histogram(
-        data,
-        x=column_name,
-        histnorm=histnorm,
-        nbins=bins,
-        labels={column_name: xlabel.title()},
-        marginal=marginal,
-        color_discrete_sequence=['#A2AF9B']
-    )
+    shares, edges = distribution.histogram(bins)
+    widths = np.diff(edges)
+    heights = shares / widths if histnorm == 'density' else shares * 100
+
+    fig = go.Figure(go.Bar(
+        x=edges[:-1] + widths / 2,
+        y=heights,
+        width=widths,
+        marker=dict(color='#A2AF9B', line=dict(width=0)),
+        hovertemplate=f"{xlabel.title()}=%{{x}}<br>{histnorm}=%{{y}}<extra></extra>",
+        showlegend=False
+    ))
 
-    # Estimate y_max for drawing vertical lines
-    n, _ = np.histogram(data[column_name], bins=bins, density=False)
-    y_max = np.max(n / n.sum()) * 100 * 1.65
+    # y_max for drawing vertical lines
+    y_max = np.max(heights) * 1.65
 
     # Add percentile lines
+    percentile_values = distribution.percentile(percentile)
     for i in range(len(percentile)):
-        percentile_value = np.percentile(data[column_name], percentile[i])
         fig.add_trace(go.Scatter(
-            x=[percentile_value, percentile_value],
+            x=[percentile_values[i], percentile_values[i]],
             y=(0, y_max),
             mode="lines",
             name=f"P{percentile[i]}",
@@ -858,6 +1118,7 @@ def histogram_plotter_plotly(
     fig.update_layout(
         height=height,
         width=width,
+        bargap=0,
         title=dict(
             text=title.title(),
             font=dict(color="#242424")
@@ -897,48 +1158,63 @@ def histogram_plotter_plotly(
 ########################################################
 
 def ecdf_plotter_plotly(
-        data,
-        column_name,
+        distribution,
         xlabel,
         title='Data',
         percentile=[15, 50, 85],
         color=['#A2AF9B', '#DCCFC0', '#242424'],
         marginal=None,
+        bins=50,
         height=700,
         width=800
     ):
-    """Plot ECDF via Plotly"""
-    import plotly.express as px
+    """Plot the ECDF of a DistributionSummary via Plotly - marginal='histogram' adds its histogram above"""
     import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
     import numpy as np
 
-    fig = px.ecdf(
-        data,
-        x=column_name,
-        labels={column_name: xlabel.title()},
-        marginal=marginal
-    )
+    if marginal == 'histogram':
+        fig = make_subplots(rows=2, cols=1, shared_xaxes=True, row_heights=[0.26, 0.74], vertical_spacing=0.03)
+        row, col = 2, 1
+        shares, edges = distribution.histogram(bins)
+        widths = np.diff(edges)
+        fig.add_trace(go.Bar(
+            x=edges[:-1] + widths / 2,
+            y=shares * len(distribution),
+            width=widths,
+            marker=dict(color='rgb(59, 117, 175)', line=dict(width=0)),
+            opacity=1.0,
+            showlegend=False
+        ), row=1, col=1)
+        fig.update_layout(bargap=0)
+    elif marginal is None:
+        fig = go.Figure()
+        row, col = None, None
+    else:
+        raise ValueError(f"Unsupported marginal: {marginal}")
 
-    # Update histogram trace styling (if any)
-    for trace in fig.data:
-        if trace.type == "histogram":
-            trace.update(
-                marker=dict(
-                    color='rgb(59, 117, 175)',
-                    line=dict(width=0)
-                ),
-                opacity=1.0
-            )
+    x, y = distribution.ecdf_points()
+    fig.add_trace(go.Scatter(
+        x=x,
+        y=y,
+        mode="lines",
+        line_shape="hv",
+        hovertemplate=f"{xlabel.title()}=%{{x}}<br>probability=%{{y}}<extra></extra>",
+        showlegend=False
+    ), row=row, col=col)
+    fig.update_xaxes(title_text=xlabel.title(), row=row, col=col)
+    fig.update_yaxes(title_text="Probability", row=row, col=col)
 
     # Add percentile lines
+    percentile_values = distribution.percentile(percentile)
     for i in range(len(percentile)):
         fig.add_trace(go.Scatter(
-            x=[np.percentile(data[column_name], percentile[i])] * 2,
+            x=[percentile_values[i]] * 2,
             y=[0, 1],
             mode="lines",
             name=f"P{percentile[i]}",
             marker=dict(color=color[i])
-        ))
+        ), row=row, col=col)
 
     # Dummy legend entry
     fig.add_trace(go.Scatter(
@@ -948,7 +1224,7 @@ def ecdf_plotter_plotly(
         name="Current Market Cap",
         line=dict(color="#242424", dash="dash"),
         showlegend=True
-    ))
+    ), row=row, col=col)
 
     # Transparent theme and base layout
     fig.update_layout(
@@ -1303,23 +1579,82 @@ def line_plotter_with_error_bound(df_data,
 # RETURN VALUES FROM LIST EXTRACTOR
 ########################################################
 
+### Statistics of describe, and the per year statistics the plots read
+DESCRIBE_STATISTICS = ('count', 'mean', 'std', 'min', '25%', '50%', '75%', 'max')
+PLOT_YEAR_STATISTICS = ('min', '50%', 'max')
+
+
+def padded_year_array(values):
+    """(n, H) float array of a per year output: the padded array of SimulationResults, or a sequence of lists NaN padded"""
+    if isinstance(values, np.ndarray) and values.ndim == 2:
+        return values
+    rows = [np.asarray(row, dtype=np.float64) for row in (values.values if hasattr(values, 'values') else values)]
+    padded = np.full((len(rows), max((len(row) for row in rows), default=0)), np.nan)
+    for i, row in enumerate(rows):
+        padded[i, :len(row)] = row
+    return padded
+
+
+def _sorted_quantile(ordered, count, q):
+    """Quantile q of each column of ordered (NaN last, count values each), with numpy's linear interpolation"""
+    position = q * (count - 1)
+    lower = np.maximum(np.floor(position), 0).astype(np.int64)
+    upper = np.maximum(np.minimum(lower + 1, count - 1), 0)
+    below = np.take_along_axis(ordered, lower[None, :], axis=0)[0]
+    above = np.take_along_axis(ordered, upper[None, :], axis=0)[0]
+    fraction = position - lower
+    difference = above - below
+    ### Same lerp as np.quantile, so the bands match describe's percentiles
+    return np.where(count > 0, np.where(fraction >= 0.5, above - difference * (1 - fraction), below + difference * fraction), np.nan)
+
+
+def per_year_statistics(df_data, cols, first_values, statistics=PLOT_YEAR_STATISTICS):
+    """
+    Statistics by year of the per year outputs cols of df_data, NaN padding left out: a (1 + H) row frame whose
+    first row is first_values[i] for cols[i] (the value before the first year), then one row per projected year.
+    Every (year, column) of the stacked (n, 1 + H, len(cols)) array is sorted in one call, NaN last, and
+    the percentiles, min and max are read from the sorted values - as nanquantile, without its per column loop.
+    statistics: any of DESCRIBE_STATISTICS, or other percentiles like '90%'; columns are named '<col> <statistic>'.
+    """
+    arrays = [padded_year_array(df_data[col]) for col in cols]
+    n = len(arrays[0]) if arrays else 0
+    years = 1 + max((array.shape[1] for array in arrays), default=0)
+    values = np.full((n, years, len(cols)), np.nan)
+    for i, (array, first_value) in enumerate(zip(arrays, first_values)):
+        values[:, 0, i] = first_value
+        values[:, 1:array.shape[1] + 1, i] = array
+    values = values.reshape(n, years * len(cols))
+    ordered = np.sort(values, axis=0)
+    count = n - np.isnan(ordered).sum(axis=0)
+    computed = {}
+    for statistic in statistics:
+        if statistic == 'count':
+            result = count.astype(np.float64)
+        elif statistic == 'min':
+            result = _sorted_quantile(ordered, count, 0.0)
+        elif statistic == 'max':
+            result = _sorted_quantile(ordered, count, 1.0)
+        elif statistic.endswith('%'):
+            result = _sorted_quantile(ordered, count, float(statistic[:-1]) / 100)
+        elif statistic in ('mean', 'std'):
+            with warnings.catch_warnings():
+                ### Years past every sample's horizon are all NaN
+                warnings.simplefilter("ignore", RuntimeWarning)
+                result = np.nanmean(values, axis=0) if statistic == 'mean' else np.nanstd(values, axis=0, ddof=1)
+        else:
+            raise ValueError(f"Unknown statistic: {statistic}")
+        computed[statistic] = result.reshape(years, len(cols))
+    return pd.DataFrame({f"{col} {statistic}": computed[statistic][:, i]
+                         for i, col in enumerate(cols) for statistic in statistics})
+
+
 def return_values_from_list_extractor(df_data,
                                         col,
-                                        add_1=True):
+                                        add_1=True,
+                                        statistics=DESCRIBE_STATISTICS):
     "This function is to get the cost stats of specied col by year"
-    df_cost_of_cap = pd.DataFrame(list(df_data[col].values))
-    if add_1:
-        df_cost_of_cap[-1] = 1.00
-    else:
-        df_cost_of_cap[-1] = 0
-    df_cost_of_cap = pd.melt(
-        df_cost_of_cap,
-        var_name='year',
-        value_name=col
-    ).dropna()
-    df_cost_of_cap = df_cost_of_cap.groupby(['year'])[[col]].describe().reset_index()
-    df_cost_of_cap = data_frame_flattener(df_cost_of_cap)
-    df_cost_of_cap = df_cost_of_cap.set_index("year")
+    df_cost_of_cap = per_year_statistics(df_data, [col], [1.00 if add_1 else 0], statistics)
+    df_cost_of_cap.index = pd.RangeIndex(-1, len(df_cost_of_cap) - 1, name='year')
     return(df_cost_of_cap)
 
 
@@ -1329,19 +1664,17 @@ def return_values_from_list_extractor(df_data,
 
 def return_values_from_list_extractor_step2(df_data,
                                             cum_ret_col,
-                                            ret_col):
-    list_of_df_return = []
-    for col in cum_ret_col:
-        df_res = return_values_from_list_extractor(df_data,
-                                                   col=col)
-        list_of_df_return.append(df_res)
-    for col in ret_col:
-        df_res = return_values_from_list_extractor(df_data,
-                                                   col=col,
-                                                   add_1=False)
-        list_of_df_return.append(df_res)
-    df_returns = pd.concat(list_of_df_return,axis=1)
-    df_returns = df_returns.reset_index(drop=True).reset_index().rename(columns={"index":"year"})
+                                            ret_col,
+                                            statistics=PLOT_YEAR_STATISTICS):
+    """
+    Per year statistics of the cumulative return columns (starting at 1) and of the other columns (starting at 0),
+    with a 'year' column counting from 0 - see per_year_statistics
+    """
+    df_returns = per_year_statistics(df_data,
+                                     list(cum_ret_col) + list(ret_col),
+                                     [1.00] * len(cum_ret_col) + [0] * len(ret_col),
+                                     statistics)
+    df_returns = df_returns.reset_index().rename(columns={"index":"year"})
     return(df_returns)
 
 
@@ -1349,28 +1682,51 @@ def return_values_from_list_extractor_step2(df_data,
 # VALUATION DESCRIBER
 ########################################################
 
-def valuation_describer(df_intc_valuation,
-                        sharesOutstanding=1):
-    
-    """Describe stats of monte dcf carlo simulation"""
+def to_centered_html(fig):
+    html = to_html(
+        fig,
+        include_plotlyjs="cdn",
+        full_html=True,
+        config={
+            "responsive": False,
+            "displayModeBar": False,
+            "displaylogo": False
+        }
+    )
+    # Inject CSS to center the figure's div
+    centered_style = """
+    <style>
+    body { display: flex; justify-content: center; align-items: center; height: 100vh; margin: 0; }
+    div.js-plotly-plot { margin: auto; }
+    </style>
+    """
+    return html.replace("</head>", centered_style + "</head>")
 
-    ### Get the Equity value at each percentile
-    current_market_cap = df_intc_valuation['equity_value'].median()
-    percentiles=np.arange(0, 110, 10)
-    equity_value_at_each_percentile = np.percentile(df_intc_valuation['equity_valuation'],
-                                                    percentiles)
+
+def equity_value_summary(distribution, current_market_cap, sharesOutstanding=1):
+    """
+    Reported and tail rows of the valuation summary: equity value, per share, Price/Value and PNL at each percentile
+    of the equity value's DistributionSummary
+    """
+    percentiles=np.union1d(np.arange(0, 110, 10), TAIL_PERCENTILES)
     df_valuation_res = pd.DataFrame({"percentiles":percentiles,
-                                     "equity_value":equity_value_at_each_percentile})
+                                     "equity_value":distribution.percentile(percentiles)})
     df_valuation_res['current_market_cap'] = current_market_cap
     df_valuation_res['current_price_per_share'] = current_market_cap/sharesOutstanding
     df_valuation_res['equity_value_per_share'] = df_valuation_res['equity_value']/sharesOutstanding
     df_valuation_res['Price/Value']= df_valuation_res['current_market_cap']/df_valuation_res['equity_value']
     df_valuation_res['PNL']= (df_valuation_res['equity_value']/df_valuation_res['current_market_cap'])-1
-    
-    ### Histogram
+
+    valuation_summary = df_valuation_res.to_dict(orient="records")
+    valuation_summary_filtered = [row for row in valuation_summary if row['percentiles'] in REPORTED_PERCENTILES]
+    tail_summary = [row for row in valuation_summary if row['percentiles'] in TAIL_PERCENTILES]
+    return valuation_summary_filtered, tail_summary
+
+
+def equity_histogram_plotter(distribution, current_market_cap):
+    """Histogram of the intrinsic equity value's DistributionSummary with the current market cap"""
     fig = histogram_plotter_plotly(
-        data=df_intc_valuation,
-        column_name ='equity_valuation',
+        distribution=distribution,
         xlabel ='Market Cap',
         title='Intrinsic Equity Value Distribution',
         bins=200,
@@ -1381,7 +1737,7 @@ def valuation_describer(df_intc_valuation,
         width=800
     )
     
-    fig = fig.add_vline(
+    return fig.add_vline(
         x = current_market_cap, 
         line_dash = 'dash',
         line_color='#242424',
@@ -1389,11 +1745,34 @@ def valuation_describer(df_intc_valuation,
         annotation_font_size=12,
         annotation_font_color='#242424'
     )
+
+
+### Per year outputs of the return plot - cumulative ones first - and of the ROIC plot
+RETURN_PLOT_OUTPUTS = ['cumWACC',
+                       'cumCostOfEquity',
+                       'cum_acceptable_annualized_return_on_equity',
+                       'cum_expected_annualized_return_on_equity',
+                       'cum_excess_annualized_return_on_equity',
+                       'cum_excess_annualized_return_on_equity_realized',
+                       'excess_annualized_return_on_equity']
+ROIC_PLOT_OUTPUTS = ['ROIC', 'invested_capital']
+
+### Outputs a run keeps for the whole describer, plots included
+PLOT_OUTPUTS = list(SUMMARY_OUTPUTS) + RETURN_PLOT_OUTPUTS + ROIC_PLOT_OUTPUTS
+
+
+def valuation_plotter(df_intc_valuation, distribution, current_market_cap):
+    """
+    Histogram, CDF, ROIC and return plots of valuation_describer as centered HTML -
+    the ROIC and return plots only when the run kept their per year outputs (see PLOT_OUTPUTS).
+    distribution: DistributionSummary of the intrinsic equity value
+    """
+    ### Histogram
+    fig = equity_histogram_plotter(distribution, current_market_cap)
     
     ### Plot cummultaive distribution of intrincsict equity value
     fig_cdf = ecdf_plotter_plotly(
-        data=df_intc_valuation,
-        column_name ='equity_valuation',
+        distribution=distribution,
         xlabel ='Market Cap',
         title='Intrinsic Equity Value Cumulative Distribution',
         percentile=[15,50,85],
@@ -1409,108 +1788,162 @@ def valuation_describer(df_intc_valuation,
         line_color='#242424'
     )
 
-    #### Return on Investment
-    df_returns = return_values_from_list_extractor_step2(
-        df_intc_valuation,
-        cum_ret_col = [
-            'cumWACC', 
-            'cumCostOfEquity',
-            'cum_acceptable_annualized_return_on_equity',
-            'cum_expected_annualized_return_on_equity',
-            'cum_excess_annualized_return_on_equity',
-            'cum_excess_annualized_return_on_equity_realized'
-        ],
-        ret_col=['excess_annualized_return_on_equity']
-    )
+    plots = {
+        "histogram": {
+            "html": to_centered_html(fig)
+        },
+        "cdf": {
+            "html": to_centered_html(fig_cdf)
+        }
+    }
 
-    ### Plot returns
-    fig_return = line_plotter_with_error_bound(
-        df_data = df_returns,
-        x='year',
-        list_of_mid_point = ['cum_expected_annualized_return_on_equity 50%','cumCostOfEquity 50%'],
-        list_of_lower_bound = ['cum_expected_annualized_return_on_equity min','cumCostOfEquity min'],
-        list_of_upper_bound = ['cum_expected_annualized_return_on_equity max','cumCostOfEquity max'],
-        list_of_bar=['excess_annualized_return_on_equity 50%'],
-        list_of_name=['Cum Expected Return','Cost of Equity'],
-        list_of_fillcolor= ['rgba(59, 237, 157, 0.5)','rgba(255,84,167, 0.3)'],
-        list_of_line_color= ['rgb(37, 162, 111)','rgb(238, 72, 103)'],
-        title='Return on Equity Investment',
-        yaxis_title='Cum Return',
-        height=700,
-        width=800
-    )
-    
-    #### ROIC and Invested Capital
-    df_roic = return_values_from_list_extractor_step2(
-        df_data = df_intc_valuation,
-        cum_ret_col = [],
-        ret_col = ['ROIC','invested_capital']
-    )[1:]
-
-    fig_roic_inv = plotly_line_dash_bar_chart(
-        df_roic,
-        x='year',
-        ybar=['invested_capital 50%'],
-        yline=['ROIC 50%'],
-        ydash=[],
-        height=700,
-        width=800,
-        rangemode=None,
-        title='Simulated Median ROIC and Invested Capital',
-        barmode='group'
-    )
-    
-    def to_centered_html(fig):
-        html = to_html(
-            fig,
-            include_plotlyjs="cdn",
-            full_html=True,
-            config={
-                "responsive": False,
-                "displayModeBar": False,
-                "displaylogo": False
-            }
+    if all(name in df_intc_valuation.series for name in ROIC_PLOT_OUTPUTS):
+        #### ROIC and Invested Capital
+        df_roic = return_values_from_list_extractor_step2(
+            df_data = df_intc_valuation,
+            cum_ret_col = [],
+            ret_col = ROIC_PLOT_OUTPUTS
+        )[1:]
+
+        fig_roic_inv = plotly_line_dash_bar_chart(
+            df_roic,
+            x='year',
+            ybar=['invested_capital 50%'],
+            yline=['ROIC 50%'],
+            ydash=[],
+            height=700,
+            width=800,
+            rangemode=None,
+            title='Simulated Median ROIC and Invested Capital',
+            barmode='group'
+        )
+        plots["roic"] = {
+            "html": to_centered_html(fig_roic_inv)
+        }
+
+    if all(name in df_intc_valuation.series for name in RETURN_PLOT_OUTPUTS):
+        #### Return on Investment
+        df_returns = return_values_from_list_extractor_step2(
+            df_intc_valuation,
+            cum_ret_col = RETURN_PLOT_OUTPUTS[:-1],
+            ret_col=RETURN_PLOT_OUTPUTS[-1:]
+        )
+
+        ### Plot returns
+        fig_return = line_plotter_with_error_bound(
+            df_data = df_returns,
+            x='year',
+            list_of_mid_point = ['cum_expected_annualized_return_on_equity 50%','cumCostOfEquity 50%'],
+            list_of_lower_bound = ['cum_expected_annualized_return_on_equity min','cumCostOfEquity min'],
+            list_of_upper_bound = ['cum_expected_annualized_return_on_equity max','cumCostOfEquity max'],
+            list_of_bar=['excess_annualized_return_on_equity 50%'],
+            list_of_name=['Cum Expected Return','Cost of Equity'],
+            list_of_fillcolor= ['rgba(59, 237, 157, 0.5)','rgba(255,84,167, 0.3)'],
+            list_of_line_color= ['rgb(37, 162, 111)','rgb(238, 72, 103)'],
+            title='Return on Equity Investment',
+            yaxis_title='Cum Return',
+            height=700,
+            width=800
         )
-        # Inject CSS to center the figure's div
-        centered_style = """
-        <style>
-        body { display: flex; justify-content: center; align-items: center; height: 100vh; margin: 0; }
-        div.js-plotly-plot { margin: auto; }
-        </style>
-        """
-        return html.replace("</head>", centered_style + "</head>")
+        plots["return"] = {
+            "html": to_centered_html(fig_return)
+        }
+    return plots
+
+
+def valuation_describer(df_intc_valuation,
+                        sharesOutstanding=1,
+                        include_plots=True):
     
-    valuation_summary = df_valuation_res.to_dict(orient="records")
-    valuation_summary_filtered = filter(lambda x: x['percentiles'] in [20, 50, 80], valuation_summary)
+    """Describe stats of monte dcf carlo simulation
+    df_intc_valuation: SimulationResults of monte_carlo_valuator_multi_phase
+    include_plots: render the plots (see valuation_plotter) - plots is empty otherwise"""
+
+    ### Get the Equity value at each percentile - from the surrogate sample when there is one
+    ### The equity value is sorted once, its DistributionSummary serves the summary, the intervals and the plots
+    current_market_cap = np.median(df_intc_valuation['equity_value'])
+    weights = None if 'equity_valuation' in df_intc_valuation.surrogate else df_intc_valuation.weights
+    distribution = DistributionSummary(df_intc_valuation.distribution('equity_valuation'), weights)
+    valuation_summary, tail_summary = equity_value_summary(distribution, current_market_cap, sharesOutstanding)
     
+    ### Sample size and confidence intervals of the reported percentiles - computed here unless the adaptive run left them
+    ### (weighted samples always get weighted intervals)
+    sampling = dict(df_intc_valuation.metadata.get('sampling', {}))
+    sampling.setdefault('sample_size', len(distribution))
+    sampling.setdefault('method', 'order_statistic')
+    sampling.setdefault('confidence', 0.95)
+    if weights is not None:
+        sampling['method'] = 'weighted'
+    ### Bootstrap resamples draw from child stream (3,) of the run's seed
+    rng = np.random.default_rng(child_stream(df_intc_valuation.metadata.get('seed'), 3))
+    if 'confidence_intervals' not in sampling or weights is not None:
+        sampling['confidence_intervals'] = distribution.confidence_intervals(REPORTED_PERCENTILES,
+                                                                            sampling['confidence'],
+                                                                            sampling['method'],
+                                                                            rng)
+    sampling['tail_confidence_intervals'] = distribution.confidence_intervals(TAIL_PERCENTILES,
+                                                                             sampling['confidence'],
+                                                                             sampling['method'],
+                                                                             rng)
+    for key in ('confidence_intervals', 'tail_confidence_intervals'):
+        sampling[key] = [dict(interval,
+                              lower_per_share=interval['lower']/sharesOutstanding,
+                              upper_per_share=interval['upper']/sharesOutstanding)
+                         for interval in sampling[key]]
+    for key in ('variance_reduction', 'importance_sampling', 'incremental'):
+        if key in df_intc_valuation.metadata:
+            sampling[key] = df_intc_valuation.metadata[key]
+    if 'surrogate' in df_intc_valuation.metadata:
+        sampling['surrogate'] = dict(df_intc_valuation.metadata['surrogate'], exact_sample_size=len(df_intc_valuation))
+
     charts = {
-        "valuation_summary": list(valuation_summary_filtered),
-        "plots": {
-            "histogram": {
-                "html": to_centered_html(fig)
-            },
-            "cdf": {
-                "html": to_centered_html(fig_cdf)
-            },
-            "roic": {
-                "html": to_centered_html(fig_roic_inv)
-            },
-            "return": {
-                "html": to_centered_html(fig_return)
-            }
-        }
+        "valuation_summary": valuation_summary,
+        "tail_summary": tail_summary,
+        "sampling": sampling,
+        "plots": valuation_plotter(df_intc_valuation, distribution, current_market_cap) if include_plots else {}
     }
     return charts
 
 
+def reweighted_valuation_describer(df_intc_valuation,
+                                   weights,
+                                   sharesOutstanding=1,
+                                   include_histogram=True):
+    """
+    Valuation summary, tail summary and histogram of a cached run under likelihood ratio weights (see reweight):
+    the equity values are the run's, their weighted percentiles describe the modified distributions.
+    The per year return and ROIC plots are left out - they need the full describer.
+    """
+    distribution = DistributionSummary(df_intc_valuation['equity_valuation'], weights)
+    current_market_cap = DistributionSummary(df_intc_valuation['equity_value'], weights).median
+    valuation_summary, tail_summary = equity_value_summary(distribution, current_market_cap, sharesOutstanding)
+    sampling = {"sample_size": len(distribution),
+                "method": "weighted",
+                "confidence": 0.95}
+    sampling['confidence_intervals'] = [dict(interval,
+                                             lower_per_share=interval['lower']/sharesOutstanding,
+                                             upper_per_share=interval['upper']/sharesOutstanding)
+                                        for interval in distribution.confidence_intervals(REPORTED_PERCENTILES,
+                                                                                          sampling['confidence'])]
+    charts = {
+        "valuation_summary": valuation_summary,
+        "tail_summary": tail_summary,
+        "sampling": sampling,
+        "plots": {}
+    }
+    if include_histogram:
+        charts["plots"]["histogram"] = {
+            "html": to_centered_html(equity_histogram_plotter(distribution, current_market_cap))
+        }
+    return charts
+
+
 ########################################################
 # ADJUST PARAMETERS INPUT TO API
 ########################################################
 
-def adjust_parameters_input_to_api(input_list):
-    monte_carlo_input = {
-        "sample_size": 10000,
-        "list_of_correlation_between_variables": [
+### Correlations of every API request - built once, see correlation_structure
+DEFAULT_LIST_OF_CORRELATION_BETWEEN_VARIABLES = [
         # Intuitive / common sense correlations
         ['revenue_growth_rate_cycle3_end', 'risk_free_rate', 0.95],
         ['revenue_growth_rate_cycle3_end', 'terminal_pretax_cost_of_debt', 0.9],
@@ -1524,22 +1957,17 @@ def adjust_parameters_input_to_api(input_list):
         ['additional_return_on_cost_of_capital_in_perpetuity', 'terminal_operating_margin', 0.5],
         ['terminal_sales_to_capital_ratio', 'terminal_operating_margin', 0.3],
     ]
+correlation_structure(VARIABLE_NAMES, DEFAULT_LIST_OF_CORRELATION_BETWEEN_VARIABLES, pin=True)
+
+def adjust_parameters_input_to_api(input_list):
+    monte_carlo_input = {
+        "sample_size": 10000,
+        "list_of_correlation_between_variables": DEFAULT_LIST_OF_CORRELATION_BETWEEN_VARIABLES
     }
     shares_outstanding = None
     for dict in input_list:
-        value = None
-        if dict["distribution"] == "normal":
-            value = ot.Normal(dict["values"]["mean"], dict["values"]["std"])
-            monte_carlo_input[dict["id"]] = value
-        elif dict["distribution"] == "triangular":
-            value = ot.Triangular(dict["values"]["min"], dict["values"]["mode"], dict["values"]["max"])
-            monte_carlo_input[dict["id"]] = value
-        elif dict["distribution"] == "uniform":
-            value = ot.Uniform(dict["values"]["low"], dict["values"]["high"])
-            monte_carlo_input[dict["id"]] = value
-        elif dict["distribution"] == "skewnorm":
-            value = ot.Distribution(ot.SciPyDistribution(scipy.stats.skewnorm(dict["values"]["skewness"], loc=dict["values"]["loc"], scale=dict["values"]["scale"])))
-            monte_carlo_input[dict["id"]] = value
+        if dict["distribution"] in Marginal.PARAMETERS:
+            monte_carlo_input[dict["id"]] = make_marginal(dict["distribution"], dict["values"])
         if dict["id"] == "shares_outstanding":
             shares_outstanding = dict["values"]["constant"]
     return monte_carlo_input, shares_outstanding
@@ -0,0 +1,134 @@
+import numpy as np
+from functools import lru_cache
+from scipy.special import ndtri
+from .batch import VARIABLE_NAMES, INTEGER_VARIABLE_NAMES
+from .greeks import central_differences
+from .confidence import weighted_percentile
+
+########################################################
+# VARIABLES
+########################################################
+
+### Midpoint quantile rule used for the moments of the marginals
+_QUADRATURE_POINTS = 1 << 16
+
+### The linear control is a secant over +/- this many standard deviations of each input
+_SECANT_STANDARD_DEVIATIONS = 0.5
+
+
+########################################################
+# LINEAR CONTROL
+########################################################
+
+@lru_cache(maxsize=1024)
+def marginal_moments(marginal, rounded=False):
+    """
+    Mean and standard deviation of a marginal as the copula samples it
+    (through from_normal, and rounded for the year columns), by a midpoint quantile rule.
+    """
+    z = ndtri((np.arange(_QUADRATURE_POINTS) + 0.5) / _QUADRATURE_POINTS)
+    values = marginal.from_normal(z)
+    if rounded:
+        values = np.round(values)
+    return float(values.mean()), float(values.std())
+
+
+def linear_control(variables_distributsion):
+    """
+    First order expansion of the intrinsic equity value around the input means.
+    Returns (base_value, gradient, means): base_value is the deterministic valuation at the means
+    (year inputs rounded), gradient the central difference slopes over +/- half a standard deviation.
+    The control base_value + (x - means) @ gradient has mean base_value exactly.
+    """
+    rounded = [name in INTEGER_VARIABLE_NAMES for name in VARIABLE_NAMES]
+    moments = np.array([marginal_moments(marginal, is_rounded)
+                        for marginal, is_rounded in zip(variables_distributsion, rounded)])
+    means, stds = moments[:, 0], moments[:, 1]
+    point = np.where(rounded, np.round(means), means)
+    steps = np.where(rounded, np.maximum(np.round(_SECANT_STANDARD_DEVIATIONS * stds), 1), _SECANT_STANDARD_DEVIATIONS * stds)
+    steps = np.where(np.isfinite(steps) & (stds > 0), steps, 0)
+    base_value, gradient = central_differences(point, steps)
+    return base_value, gradient, means
+
+
+def control_values(inputs, gradient, means):
+    """Linear control of each sample, centred: (x - means) @ gradient has mean 0"""
+    centred = np.where(gradient != 0, inputs - means, 0)
+    return centred @ gradient
+
+
+########################################################
+# CONTROL VARIATE WEIGHTS
+########################################################
+
+def control_variate_weights(control):
+    """
+    Sample weights of the regression control variate estimator, for a control of known mean 0.
+    The weighted mean of any function of the outputs is its control variate estimate -
+    weighted percentiles included. Weights sum to 1 and may be slightly negative.
+    """
+    n = len(control)
+    centred = control - control.mean()
+    sum_of_squares = centred @ centred
+    if n < 2 or sum_of_squares == 0:
+        return np.full(n, 1 / n)
+    return 1 / n - control.mean() * centred / sum_of_squares
+
+
+########################################################
+# EFFECTIVE SAMPLE SIZE
+########################################################
+
+def estimator_variance(values, control=None, antithetic=False):
+    """Variance of the mean estimator of values, after the control (known mean 0) and over antithetic pairs"""
+    values = np.asarray(values, dtype=np.float64)
+    if control is not None:
+        centred = control - control.mean()
+        sum_of_squares = centred @ centred
+        beta = (centred @ (values - values.mean())) / sum_of_squares if sum_of_squares > 0 else 0
+        values = values - beta * control
+    if antithetic:
+        pairs = len(values) // 2
+        values = (values[0:2 * pairs:2] + values[1:2 * pairs:2]) / 2
+    return values.var(ddof=1) / len(values)
+
+
+def effective_sample_size(values, control=None, antithetic=False):
+    """Number of independent samples giving the same variance as the estimator"""
+    variance = estimator_variance(values, control, antithetic)
+    if variance <= 0:
+        return float(len(values))
+    return float(np.var(values, ddof=1) / variance)
+
+
+########################################################
+# VARIANCE REDUCTION SUMMARY
+########################################################
+
+def apply_variance_reduction(df_valuation, variables_distributsion, antithetic=False, control_variate=False):
+    """
+    Estimate the mean and median intrinsic equity value of a run with the variance reduction it used.
+    With control_variate the deterministic valuation at the input means anchors a linear control,
+    and the control variate weights are stored on df_valuation.weights for the weighted percentiles.
+    Writes the estimates and their effective sample sizes to df_valuation.metadata['variance_reduction'].
+    """
+    equity_valuation = df_valuation['equity_valuation']
+    control = None
+    summary = {"antithetic": antithetic, "control_variate": control_variate}
+    if control_variate:
+        base_value, gradient, means = linear_control(variables_distributsion)
+        control = control_values(df_valuation.inputs, gradient, means)
+        df_valuation.weights = control_variate_weights(control)
+        summary["deterministic_valuation"] = base_value
+    if df_valuation.weights is None:
+        mean, median = float(np.mean(equity_valuation)), float(np.median(equity_valuation))
+    else:
+        mean = float(df_valuation.weights @ equity_valuation)
+        median = float(weighted_percentile(equity_valuation, df_valuation.weights, 50))
+    summary["mean"] = mean
+    summary["median"] = median
+    summary["effective_sample_size"] = {
+        "mean": effective_sample_size(equity_valuation, control, antithetic),
+        "median": effective_sample_size((equity_valuation <= median).astype(np.float64), control, antithetic)}
+    df_valuation.metadata['variance_reduction'] = summary
+    return df_valuation
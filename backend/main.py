@@ -1,6 +1,7 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from dcf_valuation.apis import router as dcf_valuation_router
+from dcf_valuation.parallel import shutdown_process_pool
 import logging
 import uvicorn
 from datetime import datetime
@@ -48,6 +49,7 @@ async def startup_event():
 @app.on_event("shutdown")
 async def shutdown_event():
     logger.info("DCF Backend application shutting down")
+    shutdown_process_pool()
     logger.info("Server stopped at %s", datetime.now().isoformat())
 
 
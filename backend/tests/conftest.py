@@ -0,0 +1,33 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from benchmarks.inputs import DEFAULT_INPUT_LIST
+from dcf_valuation.apis import router
+from dcf_valuation.batch import VARIABLE_NAMES
+from dcf_valuation.utils import adjust_parameters_input_to_api
+
+
+@pytest.fixture(scope="session")
+def api_input():
+    """monte_carlo_input and sharesOutstanding of the frontend's default form"""
+    return adjust_parameters_input_to_api(DEFAULT_INPUT_LIST)
+
+
+@pytest.fixture
+def monte_carlo_input(api_input):
+    return dict(api_input[0])
+
+
+@pytest.fixture
+def base_case(api_input):
+    """Keyword arguments of valuator_multi_phase at the medians of the default form - some year inputs are fractional"""
+    monte_carlo_input = api_input[0]
+    return {name: float(monte_carlo_input[name].ppf(0.5)) for name in VARIABLE_NAMES}
+
+
+@pytest.fixture(scope="session")
+def client():
+    """TestClient of an app serving the /dcf router"""
+    app = FastAPI()
+    app.include_router(router)
+    return TestClient(app)
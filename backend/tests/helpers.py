@@ -0,0 +1,8 @@
+import numpy as np
+
+
+def same_results(a, b):
+    """True when two SimulationResults hold bit identical inputs and outputs"""
+    return (np.array_equal(a.inputs, b.inputs)
+            and list(a.scalars) == list(b.scalars) and list(a.series) == list(b.series)
+            and all(np.array_equal(a[name], b[name], equal_nan=True) for name in list(a.scalars) + list(a.series)))
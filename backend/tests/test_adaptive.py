@@ -0,0 +1,17 @@
+from dcf_valuation.utils import adaptive_monte_carlo_valuator_multi_phase
+
+
+def test_adaptive_without_budget_values_several_batches(monte_carlo_input):
+    ### No deadline: the batches are sized by the caps only, never by the cost model
+    results = adaptive_monte_carlo_valuator_multi_phase(monte_carlo_input,
+                                                        tolerance=1e-6,
+                                                        batch_size=500,
+                                                        min_sample_size=500,
+                                                        max_sample_size=2000,
+                                                        n_workers=1,
+                                                        seed=1,
+                                                        outputs=('equity_valuation',))
+    sampling = results.metadata['sampling']
+    assert sampling['batches'] == 4
+    assert sampling['sample_size'] == len(results) == 2000
+    assert sampling['stopped_by'] == 'max_sample_size'
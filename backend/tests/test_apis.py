@@ -0,0 +1,52 @@
+import copy
+import json
+from benchmarks.inputs import DEFAULT_INPUT_LIST
+
+
+def without(input_id):
+    """The default form without one of its inputs"""
+    return [item for item in copy.deepcopy(DEFAULT_INPUT_LIST) if item["id"] != input_id]
+
+
+def test_sensitivity_rejects_malformed_input_list(client):
+    response = client.post("/dcf/sensitivity", json={"input_list": [{"id": "risk_free_rate"}], "sample_size": 64})
+    assert response.status_code == 422
+    assert "Invalid input_list" in response.json()["detail"]
+
+
+def test_sensitivity_rejects_missing_input(client):
+    response = client.post("/dcf/sensitivity", json={"input_list": without("ERP"), "sample_size": 64})
+    assert response.status_code == 422
+    assert "ERP" in response.json()["detail"]
+
+
+def test_reweight_rejects_malformed_input_list(client):
+    response = client.post(f"/dcf/{'0' * 64}/reweight", json={"input_list": [{"distribution": "normal"}]})
+    assert response.status_code == 422
+    assert "Invalid input_list" in response.json()["detail"]
+
+
+def test_reweight_of_unknown_run_is_not_found(client):
+    response = client.post(f"/dcf/{'0' * 64}/reweight", json={"input_list": []})
+    assert response.status_code == 404
+
+
+def test_portfolio_streams_one_line_per_company(client):
+    companies = [{"id": "AAA", "input_list": DEFAULT_INPUT_LIST, "sample_size": 500, "seed": 1},
+                 {"id": "BAD", "input_list": [{"id": "risk_free_rate"}]},
+                 {"id": "CCC", "input_list": without("ERP"), "sample_size": 500},
+                 {"input_list": DEFAULT_INPUT_LIST, "sample_size": 500, "seed": 2}]
+    response = client.post("/dcf/portfolio", json={"companies": companies, "use_cache": False})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert sorted(line["index"] for line in lines) == [0, 1, 2, 3]
+    by_index = {line["index"]: line for line in lines}
+    assert [by_index[index]["id"] for index in range(4)] == ["AAA", "BAD", "CCC", None]
+    for index in (0, 3):
+        assert by_index[index]["status"] == "ok"
+        assert len(by_index[index]["result"]["valuation_summary"]) == 3
+        assert by_index[index]["result"]["plots"] == {}
+    for index in (1, 2):
+        assert by_index[index]["status"] == "error" and "result" not in by_index[index]
+    assert "KeyError" in by_index[1]["error"] and "ERP" in by_index[2]["error"]
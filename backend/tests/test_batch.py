@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+from dcf_valuation.batch import VARIABLE_NAMES, batch_valuator_multi_phase
+from dcf_valuation.utils import monte_carlo_sample_generator, valuator_multi_phase
+
+
+@pytest.fixture(scope="module")
+def samples(api_input):
+    monte_carlo_input = api_input[0]
+    return monte_carlo_sample_generator([monte_carlo_input[name] for name in VARIABLE_NAMES],
+                                        monte_carlo_input['list_of_correlation_between_variables'],
+                                        40,
+                                        seed=7)
+
+
+def test_samples_have_ragged_horizons(samples):
+    horizons = samples[:, [VARIABLE_NAMES.index(f'length_of_cycle{cycle}') for cycle in (1, 2, 3)]].sum(axis=1)
+    assert len(np.unique(horizons)) > 1
+
+
+def test_batch_valuator_matches_valuator_multi_phase(samples):
+    batch = batch_valuator_multi_phase(samples)
+    for i, row in enumerate(samples):
+        arguments = dict(zip(VARIABLE_NAMES, row))
+        if np.isnan(arguments['current_invested_capital']):
+            arguments['current_invested_capital'] = 'implicit'
+        expected = valuator_multi_phase(**arguments)
+        for name in ('equity_value', 'firm_value', 'value_of_operating_assets'):
+            assert batch[name][i] == pytest.approx(expected[name], rel=1e-12), name
+        horizon = int(batch['valuation_interval_in_years'][i])
+        for name in expected['valuation'].columns:
+            values = np.append(batch['valuation'][name][i, :horizon], batch['terminal'][name][i])
+            np.testing.assert_allclose(values, expected['valuation'][name].to_numpy(dtype=np.float64),
+                                       rtol=1e-10, atol=1e-12, equal_nan=True, err_msg=name)
+        assert np.all(np.isnan(batch['valuation']['revenues'][i, horizon:]))
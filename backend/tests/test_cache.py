@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+from dcf_valuation.cache import ResultCache, result_key, seed_from_key
+
+
+def key(monte_carlo_input, **options):
+    """result_key with the options generate_valuation passes"""
+    options = {"adaptive": None, "variance_reduction": {}, "surrogate": None, "plots": True, "outputs": None, **options}
+    return result_key(monte_carlo_input, 1000.0, **options)
+
+
+@pytest.mark.parametrize("reorder", [lambda pairs: list(reversed(pairs)),
+                                     lambda pairs: [[b, a, value] for a, b, value in pairs]])
+def test_key_ignores_the_order_of_the_correlations(monte_carlo_input, reorder):
+    reordered = {**monte_carlo_input,
+                 'list_of_correlation_between_variables': reorder(monte_carlo_input['list_of_correlation_between_variables'])}
+    assert key(reordered) == key(monte_carlo_input)
+
+
+@pytest.mark.parametrize("change", [{"seed": 1}, {"seed": 2}, {"sample_size": 20000}])
+def test_key_follows_the_inputs(monte_carlo_input, change):
+    assert key({**monte_carlo_input, **change}) != key(monte_carlo_input)
+
+
+def test_key_follows_the_seed(monte_carlo_input):
+    assert key({**monte_carlo_input, "seed": 1}) != key({**monte_carlo_input, "seed": 2})
+
+
+@pytest.mark.parametrize("options", [{"plots": False}, {"outputs": ["equity_valuation"]},
+                                     {"adaptive": {"tolerance": 0.01}}])
+def test_key_follows_the_options(monte_carlo_input, options):
+    assert key(monte_carlo_input, **options) != key(monte_carlo_input)
+
+
+def test_key_changes_with_a_correlation(monte_carlo_input):
+    correlations = [list(pair) for pair in monte_carlo_input['list_of_correlation_between_variables']]
+    correlations[0][2] = 0.5
+    assert key({**monte_carlo_input, 'list_of_correlation_between_variables': correlations}) != key(monte_carlo_input)
+
+
+def test_seed_from_key_is_stable(monte_carlo_input):
+    assert seed_from_key(key(monte_carlo_input)) == seed_from_key(key(dict(monte_carlo_input)))
+
+
+def test_entry_bound_evicts_the_least_recently_used():
+    cache = ResultCache(max_entries=2, max_bytes=1000)
+    cache.put("a", 1, nbytes=10)
+    cache.put("b", 2, nbytes=10)
+    assert cache.get("a") == 1
+    cache.put("c", 3, nbytes=10)
+    assert "b" not in cache and "a" in cache and "c" in cache
+    assert cache.get("b") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"], stats["entries"]) == (1, 1, 1, 2)
+    assert stats["hit_rate"] == 0.5
+
+
+def test_byte_bound_evicts_until_the_entry_fits():
+    cache = ResultCache(max_entries=10, max_bytes=100)
+    for name in "abc":
+        cache.put(name, name, nbytes=40)
+    assert list(cache._entries) == ["b", "c"]
+    assert cache.stats()["bytes"] == 80
+    cache.put("d", "d", nbytes=90)
+    assert list(cache._entries) == ["d"] and cache.stats()["evictions"] == 3
+    ### Larger than the byte bound: not cached, nothing evicted
+    assert cache.put("e", "e", nbytes=101) is False
+    assert "e" not in cache and "d" in cache
+
+
+def test_put_counts_the_bytes_of_arrays():
+    cache = ResultCache(max_entries=10, max_bytes=10 ** 6)
+    cache.put("a", {"values": np.zeros(1000)})
+    assert cache.stats()["bytes"] >= 8000
+    assert cache.peek("a") is not None and cache.stats()["hits"] == 0
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+from dcf_valuation.confidence import weighted_percentile, percentile_confidence_intervals
+from dcf_valuation.distribution import DistributionSummary
+
+PERCENTILES = np.linspace(0, 100, 101)
+
+
+@pytest.fixture(scope="module")
+def sample():
+    rng = np.random.default_rng(1)
+    ### Ties included: the histogram edges and the ECDF must count them once
+    return np.round(rng.lognormal(size=20001), 3), rng.exponential(size=20001)
+
+
+def test_percentiles_match_np_percentile(sample):
+    values, _ = sample
+    summary = DistributionSummary(values)
+    assert np.array_equal(summary.percentile(PERCENTILES), np.percentile(values, PERCENTILES))
+    assert summary.median == np.median(values)
+    assert (summary.min, summary.max) == (values.min(), values.max())
+
+
+def test_weighted_percentiles_match_weighted_percentile(sample):
+    values, weights = sample
+    assert np.array_equal(DistributionSummary(values, weights).percentile(PERCENTILES),
+                          weighted_percentile(values, weights, PERCENTILES))
+
+
+def test_negative_weights_keep_a_monotone_distribution(sample):
+    values, weights = sample
+    weights = weights - 0.3
+    summary = DistributionSummary(values, weights)
+    assert np.array_equal(summary.percentile(PERCENTILES), weighted_percentile(values, weights, PERCENTILES))
+    shares, _ = summary.histogram(40)
+    assert np.all(shares >= 0) and shares.sum() == pytest.approx(1)
+
+
+@pytest.mark.parametrize("bins", [1, 30, 200])
+def test_histogram_shares_times_n_are_np_histogram_counts(sample, bins):
+    values, _ = sample
+    shares, edges = DistributionSummary(values).histogram(bins)
+    counts, expected_edges = np.histogram(values, bins)
+    assert np.array_equal(edges, expected_edges)
+    assert np.array_equal(np.round(shares * len(values)).astype(np.int64), counts)
+
+
+def test_weighted_histogram_matches_np_histogram(sample):
+    values, weights = sample
+    shares, edges = DistributionSummary(values, weights).histogram(50, range=(0.5, 4))
+    counts, _ = np.histogram(values, edges, weights=weights)
+    assert np.allclose(shares, counts / weights.sum(), rtol=1e-9, atol=1e-15)
+
+
+def test_ecdf_and_moments(sample):
+    values, weights = sample
+    summary = DistributionSummary(values)
+    points = np.array([-1.0, values[3], np.median(values), 1e9])
+    assert np.allclose(summary.ecdf(points), [np.mean(values <= point) for point in points], rtol=1e-12)
+    assert summary.mean == pytest.approx(values.mean(), rel=1e-12)
+    assert summary.std == pytest.approx(values.std(), rel=1e-12)
+    weighted = DistributionSummary(values, weights)
+    assert weighted.mean == pytest.approx(np.average(values, weights=weights), rel=1e-12)
+    assert weighted.effective_sample_size == pytest.approx(weights.sum() ** 2 / np.sum(weights ** 2), rel=1e-9)
+
+
+def test_plot_sample_and_confidence_intervals(sample):
+    values, _ = sample
+    summary = DistributionSummary(values)
+    assert np.array_equal(summary.plot_sample(), np.sort(values))
+    small = summary.plot_sample(100)
+    assert np.array_equal(small, np.percentile(values, 100 * (np.arange(100) + 0.5) / 100))
+    assert summary.confidence_intervals([20, 50, 80]) == percentile_confidence_intervals(values, [20, 50, 80])
@@ -0,0 +1,29 @@
+import pytest
+from dcf_valuation.incremental import ValuationSession
+from dcf_valuation.sampling import make_marginal
+from dcf_valuation.utils import monte_carlo_valuator_multi_phase, incremental_monte_carlo_valuator_multi_phase
+from .helpers import same_results
+
+
+def widened(marginal):
+    """The marginal with its last parameter (std, max, high or scale) 10% larger"""
+    params = dict(marginal.params)
+    name = list(params)[-1]
+    params[name] = params[name] * 1.1 + 0.01
+    return make_marginal(marginal.family, params)
+
+
+@pytest.mark.parametrize("changed", [('current_effective_tax_rate',),
+                                     ('risk_free_rate',),
+                                     ('length_of_cycle2',),
+                                     ('terminal_operating_margin', 'unlevered_beta')])
+def test_incremental_what_if_matches_full_run(monte_carlo_input, changed):
+    monte_carlo_input['sample_size'] = 2000
+    session = ValuationSession()
+    first = incremental_monte_carlo_valuator_multi_phase(monte_carlo_input, session, seed=11)
+    assert same_results(first, monte_carlo_valuator_multi_phase(**monte_carlo_input, seed=11))
+
+    what_if = {**monte_carlo_input, **{name: widened(monte_carlo_input[name]) for name in changed}}
+    revalued = incremental_monte_carlo_valuator_multi_phase(what_if, session, seed=11)
+    assert same_results(revalued, monte_carlo_valuator_multi_phase(**what_if, seed=11))
+    assert sorted(revalued.metadata['incremental']['changed_inputs']) == sorted(changed)
@@ -0,0 +1,19 @@
+import numpy as np
+from dcf_valuation.parallel import chunked_batch_valuator
+from dcf_valuation.utils import monte_carlo_valuator_multi_phase
+from .helpers import same_results
+
+
+def test_parallel_run_is_identical_to_serial(monte_carlo_input):
+    monte_carlo_input['sample_size'] = 3000
+    serial = monte_carlo_valuator_multi_phase(**monte_carlo_input, seed=42, n_workers=1)
+    parallel = monte_carlo_valuator_multi_phase(**monte_carlo_input, seed=42, n_workers=2, chunk_size=701)
+    assert same_results(serial, parallel)
+
+
+def test_chunking_does_not_change_the_results(monte_carlo_input):
+    monte_carlo_input['sample_size'] = 2000
+    results = monte_carlo_valuator_multi_phase(**monte_carlo_input, seed=3, n_workers=1)
+    rechunked = chunked_batch_valuator(results.inputs, n_workers=1, chunk_size=333)
+    assert all(np.array_equal(results[name], rechunked[name], equal_nan=True)
+               for name in list(results.scalars) + list(results.series))
@@ -0,0 +1,59 @@
+import warnings
+import numpy as np
+import pandas as pd
+import pytest
+from dcf_valuation.utils import DESCRIBE_STATISTICS, per_year_statistics, return_values_from_list_extractor
+
+STATISTICS = DESCRIBE_STATISTICS + ('10%', '90%')
+
+
+@pytest.fixture(scope="module")
+def ragged():
+    """Two NaN padded per year outputs over 8 years: one sample reaches year 6, none years 7 and 8"""
+    rng = np.random.default_rng(0)
+    horizons = rng.integers(1, 6, 60)
+    horizons[17] = 6
+    values = {}
+    for name in ('x', 'y'):
+        array = np.full((60, 8), np.nan)
+        for i, horizon in enumerate(horizons):
+            array[i, :horizon] = rng.normal(size=horizon)
+        values[name] = array
+    return values
+
+
+def expected_statistics(column):
+    """describe() and np.nanquantile of one year's values"""
+    described = pd.Series(column).describe()
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        return {**described.to_dict(), '10%': np.nanquantile(column, 0.1), '90%': np.nanquantile(column, 0.9)}
+
+
+def test_per_year_statistics_match_describe(ragged):
+    table = per_year_statistics(ragged, ['x', 'y'], [1.0, 0.0], STATISTICS)
+    assert len(table) == 9
+    for name, first_value in (('x', 1.0), ('y', 0.0)):
+        years = np.column_stack([np.full(60, first_value), ragged[name]])
+        for year in range(9):
+            expected = expected_statistics(years[:, year])
+            for statistic in STATISTICS:
+                np.testing.assert_allclose(table[f"{name} {statistic}"][year], expected[statistic],
+                                           rtol=1e-12, equal_nan=True, err_msg=f"{name} {statistic} year {year}")
+
+
+def test_empty_and_single_sample_years(ragged):
+    table = per_year_statistics(ragged, ['x'], [1.0], STATISTICS)
+    assert table['x count'][6] == 1 and np.isnan(table['x std'][6])
+    assert table['x min'][6] == table['x max'][6] == table['x 50%'][6] == ragged['x'][17, 5]
+    for year in (7, 8):
+        assert table['x count'][year] == 0
+        assert table.loc[year, [f"x {statistic}" for statistic in STATISTICS if statistic != 'count']].isna().all()
+
+
+def test_list_columns_match_the_padded_array(ragged):
+    lists = pd.DataFrame({'x': [list(row[~np.isnan(row)]) for row in ragged['x']]})
+    from_lists = return_values_from_list_extractor(lists, 'x')
+    from_array = return_values_from_list_extractor(ragged, 'x')
+    ### Lists are padded to the longest one: the empty years 7 and 8 are left out
+    pd.testing.assert_frame_equal(from_lists, from_array.iloc[:len(from_lists)])
@@ -0,0 +1,20 @@
+import pytest
+from dcf_valuation.greeks import valuation_greeks
+from dcf_valuation.point import point_valuation
+from dcf_valuation.utils import valuator_multi_phase
+
+
+def test_base_case_has_fractional_year_inputs(base_case):
+    assert base_case['year_beta_begins_to_converge_to_terminal_beta'] % 1 != 0
+
+
+def test_point_valuation_matches_valuator_multi_phase(base_case):
+    expected = valuator_multi_phase(**base_case)
+    point = point_valuation(base_case)
+    for name in ('equity_value', 'firm_value', 'value_of_operating_assets'):
+        assert point[name] == pytest.approx(expected[name], rel=1e-12)
+    assert point['table']['revenues'][:-1] == pytest.approx(list(expected['valuation']['revenues'].iloc[:-1]), rel=1e-12)
+
+
+def test_greeks_value_matches_valuator_multi_phase(base_case):
+    assert valuation_greeks(base_case)['value'] == pytest.approx(valuator_multi_phase(**base_case)['equity_value'], rel=1e-12)
@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+from dcf_valuation.batch import VARIABLE_NAMES
+from dcf_valuation.confidence import order_statistic_confidence_intervals, weighted_confidence_intervals
+from dcf_valuation.reweight import likelihood_ratio, reweight
+from dcf_valuation.run import generate_valuation, reweight_valuation
+from dcf_valuation.sampling import correlation_structure, make_marginal
+from dcf_valuation.utils import monte_carlo_valuator_multi_phase
+
+PERCENTILES = [20, 50, 80]
+
+
+@pytest.fixture(scope="module")
+def run(api_input):
+    monte_carlo_input = {**api_input[0], "sample_size": 20000}
+    return monte_carlo_input, monte_carlo_valuator_multi_phase(**monte_carlo_input, seed=4, outputs=('equity_valuation',))
+
+
+def distributions(monte_carlo_input, **changes):
+    return [changes.get(name, monte_carlo_input[name]) for name in VARIABLE_NAMES]
+
+
+def structure(monte_carlo_input):
+    return correlation_structure(VARIABLE_NAMES, monte_carlo_input['list_of_correlation_between_variables'])
+
+
+def test_unchanged_distributions_keep_uniform_weights(run):
+    monte_carlo_input, results = run
+    old = distributions(monte_carlo_input)
+    assert np.array_equal(likelihood_ratio(results.inputs, structure(monte_carlo_input), old, list(old)),
+                          np.ones(len(results)))
+    weights, effective_sample_size = reweight(results.inputs, structure(monte_carlo_input), old, list(old))
+    assert np.allclose(weights, 1 / len(results))
+    assert effective_sample_size == pytest.approx(len(results))
+
+
+def test_reweighted_percentiles_match_a_fresh_run(run):
+    monte_carlo_input, results = run
+    ### The mode of the beta moves to the right of the sampled triangle: same support, different density
+    beta = make_marginal('triangular', {'min': 0.8, 'mode': 0.95, 'max': 1.0})
+    weights, effective_sample_size = reweight(results.inputs, structure(monte_carlo_input),
+                                              distributions(monte_carlo_input),
+                                              distributions(monte_carlo_input, unlevered_beta=beta))
+    assert 0.5 * len(results) < effective_sample_size < len(results)
+    fresh = monte_carlo_valuator_multi_phase(**{**monte_carlo_input, "unlevered_beta": beta}, seed=5,
+                                             outputs=('equity_valuation',))
+    lower, upper, _ = weighted_confidence_intervals(results['equity_valuation'], weights, PERCENTILES)
+    fresh_lower, fresh_upper = order_statistic_confidence_intervals(fresh['equity_valuation'], PERCENTILES)
+    ### Two independent estimates of the same percentiles: their intervals overlap
+    assert np.all(lower <= fresh_upper) and np.all(fresh_lower <= upper)
+
+
+def test_year_inputs_cannot_be_reweighted(run):
+    monte_carlo_input, results = run
+    with pytest.raises(ValueError, match="rounded year input"):
+        likelihood_ratio(results.inputs, structure(monte_carlo_input), distributions(monte_carlo_input),
+                         distributions(monte_carlo_input, length_of_cycle1=make_marginal('uniform', {'low': 4, 'high': 7})))
+
+
+def test_inputs_coupled_to_year_inputs_cannot_be_reweighted(run):
+    monte_carlo_input, results = run
+    coupled = correlation_structure(VARIABLE_NAMES, [['risk_free_rate', 'length_of_cycle1', 0.3]])
+    with pytest.raises(ValueError, match="length_of_cycle1 is a rounded year input"):
+        likelihood_ratio(results.inputs, coupled, distributions(monte_carlo_input),
+                         distributions(monte_carlo_input, risk_free_rate=make_marginal('normal', {'mean': 0.041, 'std': 0.002})))
+
+
+def test_mass_outside_the_sampled_range_cannot_be_reweighted(run):
+    monte_carlo_input, results = run
+    with pytest.raises(ValueError, match="outside the sampled range"):
+        likelihood_ratio(results.inputs, structure(monte_carlo_input), distributions(monte_carlo_input),
+                         distributions(monte_carlo_input, unlevered_beta=make_marginal('triangular', {'min': 0.7, 'mode': 0.9, 'max': 1.0})))
+
+
+def test_undefined_reweighting_falls_back_to_a_full_run(api_input):
+    monte_carlo_input, shares_outstanding = api_input
+    charts = generate_valuation({**monte_carlo_input, "sample_size": 2000}, shares_outstanding, include_plots=False)
+    changes = {'length_of_cycle1': make_marginal('uniform', {'low': 4, 'high': 7})}
+    with pytest.raises(ValueError, match="rounded year input"):
+        reweight_valuation(charts["run_id"], changes, fallback=False)
+    fallback = reweight_valuation(charts["run_id"], changes, include_histogram=False)
+    assert fallback["reweighting"]["fallback"] is True
+    assert "rounded year input" in fallback["reweighting"]["reason"]
+    expected = generate_valuation({**monte_carlo_input, **changes, "sample_size": 2000}, shares_outstanding)
+    assert fallback["valuation_summary"] == expected["valuation_summary"]
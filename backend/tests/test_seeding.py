@@ -0,0 +1,39 @@
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pytest
+from dcf_valuation.sampling import SAMPLING_STRATEGIES, stream_normals
+from dcf_valuation.utils import monte_carlo_valuator_multi_phase, adaptive_monte_carlo_valuator_multi_phase
+from .helpers import same_results
+
+
+@pytest.mark.parametrize("sampling", SAMPLING_STRATEGIES)
+@pytest.mark.parametrize("antithetic", [False, True])
+def test_stream_normals_do_not_depend_on_the_chunks(sampling, antithetic):
+    whole = stream_normals(7, 0, 5001, 36, sampling, antithetic)
+    chunks = np.concatenate([stream_normals(7, start, min(start + 997, 5001), 36, sampling, antithetic, 5001)
+                             for start in range(0, 5001, 997)])
+    assert np.array_equal(whole, chunks)
+
+
+def test_seeded_runs_are_deterministic(monte_carlo_input):
+    monte_carlo_input['sample_size'] = 1000
+    first = monte_carlo_valuator_multi_phase(**monte_carlo_input, seed=11)
+    assert same_results(first, monte_carlo_valuator_multi_phase(**monte_carlo_input, seed=11))
+    assert not np.array_equal(first.inputs, monte_carlo_valuator_multi_phase(**monte_carlo_input, seed=12).inputs)
+
+
+def test_concurrent_seeded_runs_match_serial_runs(monte_carlo_input):
+    monte_carlo_input['sample_size'] = 1000
+    seeds = [1, 2, 1, 2]
+    serial = {seed: monte_carlo_valuator_multi_phase(**monte_carlo_input, seed=seed) for seed in set(seeds)}
+    with ThreadPoolExecutor(len(seeds)) as pool:
+        concurrent = list(pool.map(lambda seed: monte_carlo_valuator_multi_phase(**monte_carlo_input, seed=seed), seeds))
+    assert all(same_results(results, serial[seed]) for seed, results in zip(seeds, concurrent))
+
+
+def test_seeded_adaptive_runs_are_deterministic(monte_carlo_input):
+    def run():
+        return adaptive_monte_carlo_valuator_multi_phase(monte_carlo_input, tolerance=1e-6, batch_size=500,
+                                                         min_sample_size=500, max_sample_size=1500, seed=5,
+                                                         outputs=('equity_valuation',))
+    assert same_results(run(), run())
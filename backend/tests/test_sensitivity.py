@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+from dcf_valuation.batch import VARIABLE_NAMES, INTEGER_VARIABLE_NAMES, batch_valuator_multi_phase
+from dcf_valuation.sensitivity import saltelli_design, sensitivity_analysis, sobol_estimates, sobol_indices, tornado_design
+
+COEFFICIENTS = np.array([1.0, 2.0, 0.5, 0.0])
+SCALES = np.array([1.0, 0.5, 3.0, 1.0])
+
+
+def linear_outputs(sample_size, seed=0):
+    """f(x) = sum a_i x_i of independent normal x_i on the A, B and AB_i matrices"""
+    rng = np.random.default_rng(seed)
+    a = rng.normal(size=(sample_size, len(SCALES))) * SCALES
+    b = rng.normal(size=(sample_size, len(SCALES))) * SCALES
+    ab = np.stack([np.where(np.arange(len(SCALES)) == i, b, a) for i in range(len(SCALES))])
+    return a @ COEFFICIENTS, b @ COEFFICIENTS, ab @ COEFFICIENTS
+
+
+def test_sobol_estimates_of_an_additive_function():
+    ### No interactions: S_i = T_i = a_i^2 sigma_i^2 / sum_j a_j^2 sigma_j^2
+    expected = (COEFFICIENTS * SCALES) ** 2 / np.sum((COEFFICIENTS * SCALES) ** 2)
+    first_order, total = sobol_estimates(*linear_outputs(50000))
+    assert first_order == pytest.approx(expected, abs=0.02)
+    assert total == pytest.approx(expected, abs=0.02)
+    assert total[3] == 0
+
+
+def test_sobol_intervals_cover_the_closed_form():
+    expected = (COEFFICIENTS * SCALES) ** 2 / np.sum((COEFFICIENTS * SCALES) ** 2)
+    f_a, f_b, f_ab = linear_outputs(4000, seed=1)
+    indices = sobol_indices(np.concatenate([f_a, f_b, f_ab.ravel()]), 4000, len(SCALES), rng=2)
+    assert np.all(indices["first_order_lower"] <= expected + 1e-12) and np.all(expected <= indices["first_order_upper"] + 1e-12)
+    assert np.all(indices["total_lower"] <= expected + 1e-12) and np.all(expected <= indices["total_upper"] + 1e-12)
+    assert indices["rows"] == 4000
+
+
+def test_saltelli_design_swaps_one_column_per_block(api_input):
+    distributions = [api_input[0][name] for name in VARIABLE_NAMES]
+    design = saltelli_design(distributions, 64, seed=3)
+    dimension = len(VARIABLE_NAMES)
+    assert design.shape == ((dimension + 2) * 64, dimension)
+    a, b = design[:64], design[64:128]
+    for i in range(dimension):
+        block = design[(i + 2) * 64:(i + 3) * 64]
+        assert np.array_equal(block[:, i], b[:, i])
+        assert np.array_equal(np.delete(block, i, axis=1), np.delete(a, i, axis=1))
+    year_columns = [VARIABLE_NAMES.index(name) for name in INTEGER_VARIABLE_NAMES]
+    assert np.array_equal(design[:, year_columns], np.round(design[:, year_columns]))
+
+
+def test_tornado_base_is_the_valuation_at_the_medians(api_input):
+    distributions = [api_input[0][name] for name in VARIABLE_NAMES]
+    medians = np.array([marginal.ppf(0.5) for marginal in distributions])
+    year_columns = [VARIABLE_NAMES.index(name) for name in INTEGER_VARIABLE_NAMES]
+    medians[year_columns] = np.round(medians[year_columns])
+    design, bounds = tornado_design(distributions)
+    assert np.allclose(design[0], medians, rtol=1e-12, equal_nan=True)
+    analysis = sensitivity_analysis(distributions, sample_size=64, seed=1, n_workers=1)
+    assert analysis["tornado"]["base"] == batch_valuator_multi_phase(design[:1])['equity_value'][0]
+    assert {row["input"] for row in analysis["sobol"]} == set(VARIABLE_NAMES)